@@ -0,0 +1,273 @@
+"""
+Admission control for the /ai router.
+
+Every query is classified before it runs and charged a cost in capacity
+units by route class (a demand forecast with Prophet and Gemini costs more
+than a supply check). A request runs once its units fit in the process's
+ADMISSION_CAPACITY and in its tenant's share of it; otherwise it waits in
+a small queue per tenant and route class. Freed units go to the cheapest
+waiting class first (interactive lookups ahead of forecasts), then to the
+tenant holding the least capacity, with waiting requests gaining priority
+as they age so expensive ones are not starved.
+
+When a queue is full, too many requests are already waiting, or the
+expected wait exceeds what the request's deadline allows, the request is
+rejected at once with 429 and a Retry-After estimate instead of holding a
+worker thread. Under gunicorn every worker admits independently, so size
+SERVE_THREADS above what ADMISSION_CAPACITY admits plus ADMISSION_MAX_WAITING.
+
+    ticket = admission.get_controller().acquire(tenant, route_class)
+    ...
+    admission.get_controller().release(ticket)
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from flask import jsonify
+
+import metrics
+
+TENANT_HEADER = os.getenv("ADMISSION_TENANT_HEADER", "X-Tenant-Id")
+CAPACITY = int(os.getenv("ADMISSION_CAPACITY", 16))
+TENANT_SHARE = float(os.getenv("ADMISSION_TENANT_SHARE", 0.5))
+QUEUE_PER_CLASS = int(os.getenv("ADMISSION_QUEUE_PER_CLASS", 4))
+MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", 16))
+MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", 10))
+AGING_S = float(os.getenv("ADMISSION_AGING_S", 5))
+MAX_RETRY_AFTER_S = 30
+
+# Capacity units per route class, roughly proportional to how long the
+# route holds a worker and its downstream agents. Cheaper classes are served first.
+ROUTE_COST = {
+    "supply": 1,
+    "fallback": 1,
+    "optimize": 2,
+    "best_supplier": 3,
+    "negotiate": 3,
+    "demand": 4,
+}
+DEFAULT_COST = 2
+
+metrics.describe("admission_wait_seconds", "histogram", "Time admitted /ai requests waited for capacity.")
+metrics.describe("admission_rejected_total", "counter", "Requests rejected by admission control.")
+metrics.describe("admission_queue_depth", "gauge", "Requests waiting for capacity.")
+metrics.describe("admission_units_in_use", "gauge", "Capacity units held by running requests.")
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after_s):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class Ticket:
+    __slots__ = ("tenant", "route_class", "cost", "seq", "enqueued_at", "granted_at")
+
+    def __init__(self, tenant, route_class, cost, seq):
+        self.tenant = tenant
+        self.route_class = route_class
+        self.cost = cost
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+
+
+def cost_of(route_class, parts=1):
+    """Units for a route class; fan-out requests pay for each part, up to the whole capacity."""
+    if route_class == "fanout":
+        return min(CAPACITY, DEFAULT_COST * max(1, parts))
+    return min(CAPACITY, ROUTE_COST.get(route_class, DEFAULT_COST))
+
+
+class AdmissionController:
+    def __init__(self, capacity=CAPACITY, tenant_share=TENANT_SHARE, queue_per_class=QUEUE_PER_CLASS,
+                 max_waiting=MAX_WAITING, max_wait_s=MAX_WAIT_S):
+        self.capacity = capacity
+        self.tenant_capacity = max(max(ROUTE_COST.values()), int(capacity * tenant_share))
+        self.queue_per_class = queue_per_class
+        self.max_waiting = max_waiting
+        self.max_wait_s = max_wait_s
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._tenant_in_use = {}
+        self._queues = {}  # (tenant, route_class) -> deque of waiting tickets
+        self._waiting = 0
+        self._seq = 0
+        self._hold_s = 2.0  # moving average of how long a request holds its units
+        self._rejected = {}
+
+    # ----------------------
+    # Scheduling (all called with the lock held)
+    # ----------------------
+    def _fits(self, ticket):
+        return (self._in_use + ticket.cost <= self.capacity
+                and self._tenant_in_use.get(ticket.tenant, 0) + ticket.cost <= self.tenant_capacity)
+
+    def _grant(self, ticket):
+        ticket.granted_at = time.monotonic()
+        self._in_use += ticket.cost
+        self._tenant_in_use[ticket.tenant] = self._tenant_in_use.get(ticket.tenant, 0) + ticket.cost
+
+    def _priority(self, ticket, now):
+        """Lower runs first: cost, minus one step per AGING_S waited, then the tenant's current usage."""
+        aged = (now - ticket.enqueued_at) / AGING_S if AGING_S > 0 else 0
+        return ticket.cost - aged, self._tenant_in_use.get(ticket.tenant, 0), ticket.seq
+
+    def _dispatch(self):
+        """Grant queue heads in priority order while they fit."""
+        granted = False
+        while True:
+            now = time.monotonic()
+            heads = sorted((q[0] for q in self._queues.values() if q), key=lambda t: self._priority(t, now))
+            ticket = next((t for t in heads if self._fits(t)), None)
+            if ticket is None:
+                break
+            self._remove(ticket)
+            self._grant(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _remove(self, ticket):
+        key = (ticket.tenant, ticket.route_class)
+        queue = self._queues.get(key)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[key]
+
+    def _expected_wait_s(self, cost):
+        """Units queued ahead plus this request, drained at capacity units per average hold time."""
+        queued_units = sum(t.cost for q in self._queues.values() for t in q)
+        backlog = max(0, self._in_use + queued_units + cost - self.capacity)
+        return backlog * self._hold_s / self.capacity
+
+    def _reject(self, ticket, reason, retry_after_s):
+        key = (ticket.route_class, reason)
+        self._rejected[key] = self._rejected.get(key, 0) + 1
+        metrics.inc("admission_rejected_total", route_class=ticket.route_class, reason=reason)
+        retry = max(1, min(MAX_RETRY_AFTER_S, math.ceil(retry_after_s)))
+        raise Rejected(reason, retry)
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    def acquire(self, tenant, route_class, cost=None, max_wait_s=None):
+        """
+        Wait for capacity and return a Ticket to release() when the request
+        is done. Raises Rejected when the request should be turned away.
+        """
+        cost = cost if cost is not None else cost_of(route_class)
+        max_wait_s = self.max_wait_s if max_wait_s is None else min(self.max_wait_s, max_wait_s)
+        with self._cond:
+            self._seq += 1
+            ticket = Ticket(tenant, route_class, cost, self._seq)
+            key = (tenant, route_class)
+            if not self._waiting and self._fits(ticket):
+                self._grant(ticket)
+                metrics.observe("admission_wait_seconds", 0.0, route_class=route_class)
+                return ticket
+
+            expected = self._expected_wait_s(cost)
+            if len(self._queues.get(key, ())) >= self.queue_per_class:
+                self._reject(ticket, "tenant_queue_full", expected)
+            if self._waiting >= self.max_waiting:
+                self._reject(ticket, "saturated", expected)
+            if expected > max_wait_s:
+                self._reject(ticket, "expected_wait", expected)
+
+            self._queues.setdefault(key, deque()).append(ticket)
+            self._waiting += 1
+            self._dispatch()  # it may fit ahead of the waiters that don't
+            give_up = ticket.enqueued_at + max_wait_s
+            while ticket.granted_at is None:
+                remaining = give_up - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._reject(ticket, "wait_timeout", self._expected_wait_s(cost))
+                self._cond.wait(remaining)
+            metrics.observe("admission_wait_seconds", ticket.granted_at - ticket.enqueued_at,
+                            route_class=route_class)
+            return ticket
+
+    def release(self, ticket):
+        """Return a ticket's units and admit whoever fits next. Safe to call twice."""
+        with self._cond:
+            if ticket.granted_at is None:
+                return
+            held = time.monotonic() - ticket.granted_at
+            ticket.granted_at = None
+            self._hold_s = 0.9 * self._hold_s + 0.1 * held
+            self._in_use -= ticket.cost
+            remaining = self._tenant_in_use.get(ticket.tenant, 0) - ticket.cost
+            if remaining > 0:
+                self._tenant_in_use[ticket.tenant] = remaining
+            else:
+                self._tenant_in_use.pop(ticket.tenant, None)
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            depth = {}
+            for (_, route_class), queue in self._queues.items():
+                depth[route_class] = depth.get(route_class, 0) + len(queue)
+            return {
+                "capacity": self.capacity,
+                "tenant_capacity": self.tenant_capacity,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "queue_depth": depth,
+                "tenants_running": len(self._tenant_in_use),
+                "avg_hold_s": round(self._hold_s, 3),
+                "rejected": {f"{c}:{r}": n for (c, r), n in sorted(self._rejected.items())},
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+    return _controller
+
+
+def tenant_of(request):
+    """Tenant id from the tenant header, falling back to the client address."""
+    return request.headers.get(TENANT_HEADER) or request.remote_addr or "anonymous"
+
+
+def explicit_tenant(request):
+    """Tenant id from the tenant header, or None; for state that must never be shared between callers."""
+    return request.headers.get(TENANT_HEADER) or None
+
+
+def rejection_response(error):
+    response = jsonify({
+        "error": "The assistant is busy right now, please retry shortly.",
+        "reason": error.reason,
+        "retry_after_s": error.retry_after_s,
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after_s)
+    return response
+
+
+def _metric_samples():
+    stats = get_controller().stats()
+    samples = [("admission_units_in_use", {}, stats["in_use"])]
+    for route_class in sorted(set(ROUTE_COST) | {"fanout"}):
+        samples.append(("admission_queue_depth", {"route_class": route_class},
+                        stats["queue_depth"].get(route_class, 0)))
+    return samples
+
+
+metrics.register_collector(_metric_samples)
@@ -1,200 +1,574 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 import requests
-from supplier_service import get_web_suppliers, format_suppliers
+import json
+import logging
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from supplier_service import format_suppliers
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+from llm_gateway import generate, generate_stream, stats as llm_stats
+from streaming import sse_response, wants_stream
+from intent_classifier import classify, catalog_names, get_classifier
+import admission
+import analytics_store
+import deadline
+import log_setup
+import metrics
+import precompute
+import services
+import stock_monitor
+import supplier_directory
+import tracing
+import wire_format
 
 # ----------------------
 # Load environment variables
 # ----------------------
-load_dotenv()
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-genai.configure(api_key=gemini_api_key)
+load_dotenv()  # GEMINI_API_KEY is checked by llm_gateway on the first model call
+log_setup.configure("ai", "ai_router_logs.txt")
+logger = logging.getLogger(__name__)
 
 # ----------------------
 # Flask app
 # ----------------------
 app = Flask(__name__)
 CORS(app)
+deadline.init_app(app)
+services.init_app(app, "ai", warmup=get_classifier)
+tracing.init_app(app, "ai")
+metrics.init_app(app, "ai")
+wire_format.init_app(app)
 
 # ----------------------
 # Helper to call demand_predictor.py via HTTP
 # ----------------------
+def agent_headers():
+    """Deadline, trace and dataset context for a call to another agent."""
+    return {**deadline.outgoing_headers(), **tracing.outgoing_headers(), **analytics_store.outgoing_headers()}
+
+
+@metrics.timed("agent_call", agent="demand_predictor")
 def run_demand_predictor(query, stock_data, transaction_data):
     try:
-        url = "http://127.0.0.1:5000/predict_demand"  # demand_predictor Flask endpoint
+        url = services.url("demand_predictor", "/predict_demand")
         payload = {
             "query": query,
             "stock_data": stock_data,
             "transaction_data": transaction_data
         }
-        response = requests.post(url, json=payload, timeout=60)
+        response = wire_format.post(url, payload, timeout=deadline.timeout(60), headers=agent_headers())
         if response.status_code != 200:
             return {"error": f"demand_predictor returned {response.status_code}: {response.text}"}
-        return response.json()
+        result = wire_format.decode_response(response)
+        deadline.merge_skipped(result)
+        return result
     except requests.exceptions.RequestException as e:
         return {"error": f"Request to demand_predictor failed: {str(e)}"}
 
 # ----------------------
 
 
+@metrics.timed("agent_call", agent="auto_reply")
 def run_auto_reply(email_text):
     try:
-        url = "http://127.0.0.1:5004/auto_reply"  # your auto_reply_agent endpoint
+        url = services.url("auto_reply", "/auto_reply")
         payload = {"email_text": email_text}
-        response = requests.post(url, json=payload, timeout=15)
+        response = wire_format.post(url, payload, timeout=deadline.timeout(15), headers=agent_headers())
         if response.status_code != 200:
             return {"error": f"auto_reply_agent returned {response.status_code}: {response.text}"}
-        return response.json()
+        result = wire_format.decode_response(response)
+        deadline.merge_skipped(result)
+        return result
     except requests.exceptions.RequestException as e:
         return {"error": f"Request to auto_reply_agent failed: {str(e)}"}
 
 
 # Dummy agents
 # ----------------------
+@metrics.timed("agent_call", agent="order_optimizer")
 def run_order_optimizer(query, stock_data, transaction_data):
     try:
-        url = "http://127.0.0.1:5003/optimize_order"  # order_optimizer Flask endpoint
+        url = services.url("order_optimizer", "/optimize_order")
         payload = {
             "query": query,
             "stock_data": stock_data,
             "transaction_data": transaction_data
         }
-        response = requests.post(url, json=payload, timeout=10)
+        response = wire_format.post(url, payload, timeout=deadline.timeout(10), headers=agent_headers())
         if response.status_code != 200:
             return {"error": f"order_optimizer returned {response.status_code}: {response.text}"}
-        return response.json()
+        result = wire_format.decode_response(response)
+        deadline.merge_skipped(result)
+        return result
     except requests.exceptions.RequestException as e:
         return {"error": f"Request to order_optimizer failed: {str(e)}"}
 
 
+@metrics.timed("agent_call", agent="supply_checker")
 def supply_checker(query, stock_data, product_name=None):
     try:
-        url = "http://127.0.0.1:5002/supply-check"  # supply_checker Flask endpoint
+        url = services.url("supply_checker", "/supply-check")
         payload = {
             "query": query,
-            "stock_data": stock_data,
-            "product_name": product_name
+            "product_name": product_name,  # ahead of stock_data so the checker can filter while reading
+            "stock_data": stock_data
         }
-        response = requests.post(url, json=payload, timeout=10)
+        response = wire_format.post(url, payload, timeout=deadline.timeout(10), headers=agent_headers())
         if response.status_code != 200:
             return {"error": f"supply_checker returned {response.status_code}: {response.text}"}
-        return response.json()
+        result = wire_format.decode_response(response)
+        deadline.merge_skipped(result)
+        return result
     except requests.exceptions.RequestException as e:
         return {"error": f"Request to supply_checker failed: {str(e)}"}
 
+@metrics.timed("agent_call", agent="negotiation")
 def negotiate_with_supplier(product_name, supplier, user_request):
     """Call negotiation service to send email to supplier."""
-    url = "http://127.0.0.1:5003/negotiate"
+    url = services.url("negotiation", "/negotiate")
     try:
         payload = {
             "product_name": product_name,
             "supplier": supplier,
             "user_request": user_request
         }
-        response = requests.post(url, json=payload, timeout=10)
+        response = wire_format.post(url, payload, timeout=deadline.timeout(10), headers=agent_headers())
         response.raise_for_status()
-        return response.json()
+        result = wire_format.decode_response(response)
+        deadline.merge_skipped(result)
+        return result
     except requests.exceptions.RequestException as e:
         return {"error": f"Request to negotiation service failed: {str(e)}"}
 
 
+def proxy_agent_stream(url, payload, timeout):
+    """Relay an agent's NDJSON event stream as (event, data) pairs."""
+    try:
+        with wire_format.post(
+            url, payload, accept_msgpack=False, stream=True, timeout=deadline.timeout(timeout), headers=agent_headers()
+        ) as response:
+            if response.status_code != 200:
+                yield "error", {"error": f"{url} returned {response.status_code}: {response.text}"}
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                    event, data = message["event"], message["data"]
+                except (ValueError, KeyError, TypeError):
+                    # A truncated or malformed line: end the stream with an error event instead of dropping it
+                    logger.warning("bad stream line", extra={"url": url, "line": line[:200]})
+                    yield "error", {"error": f"{url} sent a malformed stream event"}
+                    return
+                if event == "done":
+                    deadline.merge_skipped(data)
+                yield event, data
+    except requests.exceptions.RequestException as e:
+        yield "error", {"error": f"Request to {url} failed: {str(e)}"}
+
+
+# ----------------------
+# Routing
+# ----------------------
+FALLBACK_ERROR_TEXT = (
+    "⚠️ I'm having trouble responding right now.\n\n"
+    "👉 Try asking about demand, orders or supply."
+)
+
+
+def classify_route(query, stock_data=None):
+    """Pick the agent for a query; low-confidence queries go to the Gemini fallback."""
+    return classify(query, catalog_names(stock_data)).intent
+
+
+def legacy_product_name(query, route):
+    """Product extraction used before the intent classifier had a product slot."""
+    if route == "best_supplier":
+        return (
+            query.replace("who are the best suppliers for", "")
+                .replace("who is the best supplier for", "")
+                .replace("who are best supplier for", "")
+                .replace("who is best supplier for", "")
+                .replace("best supplier for", "")
+                .strip()
+        )
+    return query.split("for")[-1].strip() if "for" in query else ""
+
+
+def best_supplier_response(product_name):
+    logger.debug("best supplier lookup", extra={"product_name": product_name})
+    suppliers = supplier_directory.find_suppliers(product_name)
+    formatted_suppliers = format_suppliers(suppliers)
+    #response_text = format_supplier_html(product_name, formatted_suppliers)
+
+    response_text = f"Top suppliers for '{product_name}':\n"
+    for sup in formatted_suppliers:  # Use formatted_suppliers instead
+        response_text += (
+            f"- 🏠Company: {sup['companyName']}\n\n"
+            f"  ☎Contact: {sup['contact']}\n\n"
+            f"  📩Email: {sup['email']}\n\n"
+            f"  📝Description: {sup['description']}\n\n"
+            f"  🌍Website: {sup['website']}\n\n"
+            "-------------------------\n\n"
+        )
+
+    return {"readable_text": response_text.strip(), "suppliers": formatted_suppliers, "type": "text"}
+
+
+def route_query(query, stock_data, transaction_data):
+    """Run the agent that matches query. Returns (response dict, HTTP status)."""
+    if deadline.remaining() <= 0:
+        return {"error": "Request deadline exceeded before the query could be routed"}, 504
+
+    with metrics.timed("intent"):
+        intent = classify(query, catalog_names(stock_data))
+    route = intent.intent
+    product_name = intent.product or legacy_product_name(query, route)
+
+    if route == "demand":
+        cached = precompute.lookup("demand", product_name)
+        if cached:
+            return cached, 200
+        agent_query = f"predict demand for {product_name}" if product_name else query
+        return run_demand_predictor(agent_query, stock_data, transaction_data), 200
+
+    if route == "optimize":
+        cached = precompute.lookup("optimize", product_name)
+        if cached:
+            return cached, 200
+        agent_query = f"optimize order for {product_name}" if product_name else query
+        return run_order_optimizer(agent_query, stock_data, transaction_data), 200
+
+    if route == "best_supplier":
+        return best_supplier_response(product_name), 200
+
+    if route == "negotiate":
+        user_request = query  # Full query as user intent
+        suppliers = supplier_directory.find_suppliers(product_name, need_contact=True) if product_name else []
+        if not suppliers:
+            return {"error": "No suppliers found for negotiation"}, 400
+
+        # Negotiate with the first supplier (or add logic to select one)
+        response = negotiate_with_supplier(product_name, format_suppliers(suppliers)[0], user_request)
+        response["readable_text"] = f"Negotiation email sent for {product_name}:\n{response.get('email_content', 'Email sent.')}"
+        return response, 200
+
+    if route == "supply":
+        # Handle supply checks separately, only when not "best supplier"
+        return supply_checker(query, stock_data, product_name or None), 200
+
+    # Fallback to Gemini AI for general queries
+    if not deadline.allows("llm"):
+        deadline.skip("llm")
+        return {"readable_text": FALLBACK_ERROR_TEXT}, 200
+    try:
+        text = generate(query, model="gemini-2.0-flash-001", call_site="ai_fallback", deadline=deadline.remaining())
+        return {"readable_text": text}, 200
+    except Exception as e:
+        return {"readable_text": FALLBACK_ERROR_TEXT, "error": str(e)}, 200
+
+
+# ----------------------
+# Fan-out for compound and multi-query requests
+# ----------------------
+FANOUT_WORKERS = int(os.getenv("AI_FANOUT_WORKERS", 8))
+_fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="ai-fanout")
+
+INTENT_SPLIT_RE = re.compile(r"\s*(?:,|;|\band then\b|\bthen\b|\balso\b|\band\b)\s*", re.IGNORECASE)
+
+
+def split_compound_query(query, stock_data=None):
+    """
+    Split a query like "predict demand and optimize order for rice" into one
+    sub-query per intent, each carrying the shared "for <product>" tail.
+    Returns [query] unchanged unless every part maps to a distinct agent,
+    so product names containing "and" are left alone.
+    """
+    parts = [part for part in INTENT_SPLIT_RE.split(query) if part and part.strip()]
+    if len(parts) < 2:
+        return [query]
+
+    routes = [classify_route(part, stock_data) for part in parts]
+    if "fallback" in routes or len(set(routes)) < len(routes):
+        return [query]
+
+    product = query.rsplit(" for ", 1)[1].strip() if " for " in query else ""
+    return [
+        f"{part.strip()} for {product}" if product and " for " not in part else part.strip()
+        for part in parts
+    ]
+
+
+def _timed_route(query, stock_data, transaction_data):
+    start = time.perf_counter()
+    try:
+        response, status = route_query(query, stock_data, transaction_data)
+    except Exception as e:
+        response, status = {"error": str(e)}, 500
+    return {
+        "query": query,
+        "route": classify_route(query, stock_data),
+        "status": status,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "response": response,
+    }
+
+
+def submit_fanout(queries, stock_data, transaction_data):
+    """Start every sub-query on the fan-out pool; returns the futures in input order."""
+    return [
+        _fanout_pool.submit(contextvars.copy_context().run, _timed_route, q, stock_data, transaction_data)
+        for q in queries
+    ]
+
+
+def merge_fanout(parts, elapsed_ms):
+    readable = [
+        part["response"].get("readable_text") or part["response"].get("error", "")
+        for part in parts
+    ]
+    return {
+        "readable_text": "\n\n".join(text for text in readable if text),
+        "results": parts,
+        "timings": {part["query"]: part["elapsed_ms"] for part in parts},
+        "elapsed_ms": elapsed_ms,
+        "skipped_stages": deadline.skipped_stages(),
+    }
+
+
+def run_fanout(queries, stock_data, transaction_data):
+    """Run sub-queries concurrently and merge them into one response."""
+    start = time.perf_counter()
+    parts = [future.result() for future in submit_fanout(queries, stock_data, transaction_data)]
+    return merge_fanout(parts, round((time.perf_counter() - start) * 1000, 1))
+
+
+def stream_fanout(queries, stock_data, transaction_data):
+    """Yield one "part" event per sub-query as it finishes, then the merged response."""
+    start = time.perf_counter()
+    yield "route", {"route": "fanout", "queries": queries}
+    futures = submit_fanout(queries, stock_data, transaction_data)
+    for future in as_completed(futures):
+        yield "part", future.result()
+    parts = [future.result() for future in futures]
+    yield "done", merge_fanout(parts, round((time.perf_counter() - start) * 1000, 1))
+
+
+def stream_query(query, stock_data, transaction_data):
+    """
+    Yield (event, data) pairs for a streamed /ai response. Demand and order
+    numbers arrive as soon as the agent computes them and model text follows
+    in pieces; other routes finish with a single "done" event.
+    """
+    with metrics.timed("intent"):
+        intent = classify(query, catalog_names(stock_data))
+    route = intent.intent
+    yield "route", {"route": route, "confidence": intent.confidence, "product": intent.product}
+
+    cached = precompute.lookup(route, intent.product) if route in precompute.KINDS else None
+    if cached:
+        yield "done", cached
+
+    elif route == "demand":
+        agent_query = f"predict demand for {intent.product}" if intent.product else query
+        payload = {"query": agent_query, "stock_data": stock_data, "transaction_data": transaction_data}
+        yield from proxy_agent_stream(services.url("demand_predictor", "/predict_demand/stream"), payload, timeout=60)
+
+    elif route == "optimize":
+        agent_query = f"optimize order for {intent.product}" if intent.product else query
+        payload = {"query": agent_query, "stock_data": stock_data, "transaction_data": transaction_data}
+        yield from proxy_agent_stream(services.url("order_optimizer", "/optimize_order/stream"), payload, timeout=10)
+
+    elif route == "fallback" and deadline.allows("llm"):
+        parts = []
+        try:
+            stream = generate_stream(
+                query, model="gemini-2.0-flash-001", call_site="ai_fallback", deadline=deadline.remaining()
+            )
+            for piece in stream:
+                parts.append(piece)
+                yield "text_delta", {"text": piece}
+            yield "done", {"readable_text": "".join(parts)}
+        except Exception as e:
+            yield "done", {"readable_text": "".join(parts) or FALLBACK_ERROR_TEXT, "error": str(e)}
+
+    else:
+        response, status = route_query(query, stock_data, transaction_data)
+        response["skipped_stages"] = deadline.skipped_stages()
+        yield ("done" if status == 200 else "error"), response
+
+
 # ----------------------
 # Universal Endpoint
 # ----------------------
 @app.route("/ai", methods=["POST"])
 def ai_handler():
+    """
+    Route a dashboard query to the matching agent.
+    Send {"stream": true} or Accept: text/event-stream for a Server-Sent
+    Events response instead of a single JSON body.
+    Send "queries": [...] instead of "query" (or a compound query such as
+    "predict demand and optimize order for rice") to run several agents
+    concurrently and get one merged response with per-part timings.
+    Requests are admitted per tenant (X-Tenant-Id) and route class; when the
+    router is saturated it answers 429 with Retry-After instead.
+    """
     try:
         data = request.get_json()
-        print(" /ai received:", data)
+        logger.info("/ai received", extra={"payload": log_setup.payload_summary(data)})
 
         query = data.get("query", "").strip()
         stock_data = data.get("stock_data", [])
         transaction_data = data.get("transaction_data", [])
 
-        query_lower = query.lower()
+        queries = [
+            (q.get("query", "") if isinstance(q, dict) else str(q)).strip()
+            for q in data.get("queries") or []
+        ]
+        queries = [q for q in queries if q] or split_compound_query(query, stock_data)
 
-        # Route query to appropriate module
-        if "predict" in query_lower and "demand" in query_lower:
-            response = run_demand_predictor(query, stock_data, transaction_data)
-
-        elif "optimize" in query or "order" in query:
-            response = order_optimizer(query, stock_data, transaction_data)
-
-        elif "best supplier" in query or "who are the best suppliers" in query or "who are best supplier" in query:
-            # Moved above generic "supplier" check
-            product_name = (
-                query.replace("who are the best suppliers for", "")
-                    .replace("who is the best supplier for", "")
-                    .replace("who are best supplier for", "")
-                    .replace("who is best supplier for", "")
-                    .replace("best supplier for", "")
-                    .strip()
+        route_class = "fanout" if len(queries) > 1 else classify_route(queries[0], stock_data)
+        try:
+            ticket = admission.get_controller().acquire(
+                admission.tenant_of(request), route_class,
+                cost=admission.cost_of(route_class, len(queries)),
+                max_wait_s=deadline.remaining() / 2,  # leave at least half the budget for the work itself
             )
-            print("Extracted product name:", product_name)
-            suppliers = get_web_suppliers(product_name)
-            formatted_suppliers = format_suppliers(suppliers)
-            #response_text = format_supplier_html(product_name, formatted_suppliers)
-
-            response_text = f"Top suppliers for '{product_name}':\n"
-            for sup in formatted_suppliers:  # Use formatted_suppliers instead
-                response_text += (
-                    f"- 🏠Company: {sup['companyName']}\n\n"
-                    f"  ☎Contact: {sup['contact']}\n\n"
-                    f"  📩Email: {sup['email']}\n\n"
-                    f"  📝Description: {sup['description']}\n\n"
-                    f"  🌍Website: {sup['website']}\n\n"
-                    "-------------------------\n\n"
-                )
-
-            response = {"readable_text": response_text.strip(), "suppliers": formatted_suppliers,"type": "text"}
-
-        elif "negotiate" in query or "email supplier" in query:
-            product_name = query.split("for")[-1].strip() if "for" in query else ""
-            user_request = query  # Full query as user intent
-            suppliers = get_web_suppliers(product_name) if product_name else []
-            if not suppliers:
-                return jsonify({"error": "No suppliers found for negotiation"}), 400
-
-            # Negotiate with the first supplier (or add logic to select one)
-            response = negotiate_with_supplier(product_name, format_suppliers(suppliers)[0], user_request)
-            response["readable_text"] = f"Negotiation email sent for {product_name}:\n{response.get('email_content', 'Email sent.')}"
-
-        elif "supply" in query:
-            # Handle supply checks separately, only when not "best supplier"
-            product_name = query.split("for")[-1].strip() if "for" in query else None
-            response = supply_checker(query, stock_data, product_name)
-
-        else:
-            # Fallback to Gemini AI for general queries
-            try:
-                model_gemini = genai.GenerativeModel("gemini-2.0-flash-001")  # Use any available model
-                gemini_response = model_gemini.generate_content(query)
-                response = {
-                    "readable_text": gemini_response.text
-                }
-            except Exception as e:
-                response = {
-                    "readable_text": (
-                        "⚠️ I'm having trouble responding right now.\n\n"
-                        "👉 Try asking about demand, orders or supply."
-                    ),
-                    "error": str(e)
-                }
-
-        return jsonify(response)
+        except admission.Rejected as e:
+            logger.warning("/ai rejected", extra={"route_class": route_class, "reason": e.reason})
+            return admission.rejection_response(e)
+        try:
+            tenant = admission.tenant_of(request)
+            version = analytics_store.observe_request(admission.explicit_tenant(request), stock_data, transaction_data)
+            precompute.observe_request(tenant, version, stock_data, transaction_data)
+            stock_monitor.observe_request(tenant, version, stock_data, transaction_data)
+            supplier_directory.observe_request(tenant, version, stock_data)
+            response = make_response(handle_queries(queries, data, stock_data, transaction_data))
+        except BaseException:
+            admission.get_controller().release(ticket)
+            raise
+        # Streamed bodies are still running here, so hold the units until the response is closed
+        response.call_on_close(lambda: admission.get_controller().release(ticket))
+        return response
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("/ai failed")
         return jsonify({"error": str(e)}), 500
 
+
+def handle_queries(queries, data, stock_data, transaction_data):
+    """Response for an admitted /ai request: streamed, fanned out or routed to one agent."""
+    if len(queries) > 1:
+        if wants_stream(request, data):
+            return sse_response(stream_fanout(queries, stock_data, transaction_data))
+        return jsonify(run_fanout(queries, stock_data, transaction_data))
+    query = queries[0]
+
+    if wants_stream(request, data):
+        return sse_response(stream_query(query, stock_data, transaction_data))
+
+    response, status = route_query(query, stock_data, transaction_data)
+    response["skipped_stages"] = deadline.skipped_stages()
+    return jsonify(response), status
+
+
+@app.route("/precompute/trigger", methods=["POST"])
+def precompute_trigger_handler():
+    """
+    Refresh the tenant's precomputed forecasts now, e.g. after the backend
+    records transactions. Send the current stock_data and transaction_data.
+    """
+    precomputer = precompute.get_precomputer()
+    if precomputer is None:
+        return jsonify({"error": "Precomputation is disabled"}), 404
+    data = request.get_json() or {}
+    tenant = admission.tenant_of(request)
+    stock_data = data.get("stock_data") or []
+    transaction_data = data.get("transaction_data") or []
+    if stock_data:
+        version = analytics_store.observe_request(admission.explicit_tenant(request), stock_data, transaction_data)
+        precomputer.store.save_dataset(tenant, version, stock_data, transaction_data)
+    precomputer.trigger(tenant)
+    return jsonify(precomputer.store.status(tenant)), 202
+
+
+@app.route("/precompute/status", methods=["GET"])
+def precompute_status_handler():
+    """Dataset version and precomputed result counts for the calling tenant."""
+    precomputer = precompute.get_precomputer()
+    if precomputer is None:
+        return jsonify({"error": "Precomputation is disabled"}), 404
+    return jsonify(precomputer.store.status(admission.tenant_of(request)))
+
+
+@app.route("/monitor/events", methods=["POST"])
+def monitor_events_handler():
+    """
+    Apply stock and sales events for the calling tenant, e.g. from the
+    backend as it processes an order. Send {"events": [...]} with
+    {"type": "sale", "product_name", "qty", "stock"?, "at"?},
+    {"type": "stock", "product_name", "qty"} or
+    {"type": "transaction", "items": [...], "createdAt"}.
+    """
+    monitor = stock_monitor.get_monitor()
+    if monitor is None:
+        return jsonify({"error": "The stock monitor is disabled"}), 404
+    data = request.get_json() or {}
+    events = data.get("events")
+    if not isinstance(events, list):
+        return jsonify({"error": "Send a list of events"}), 400
+    skus, alerts = monitor.apply_events(admission.tenant_of(request), events)
+    return jsonify({"skus": skus, "alerts": alerts})
+
+
+@app.route("/monitor/alerts", methods=["GET"])
+def monitor_alerts_handler():
+    """
+    The calling tenant's alerts after ?after=<seq>, waiting up to ?wait=
+    seconds for one (long poll). Pass back "next" as after. Long polls hold
+    a router thread, so beyond MONITOR_MAX_WAITERS at once they get 429.
+    """
+    monitor = stock_monitor.get_monitor()
+    if monitor is None:
+        return jsonify({"error": "The stock monitor is disabled"}), 404
+    after = request.args.get("after", 0, type=int)
+    try:
+        alerts = monitor.wait_for_alerts(admission.tenant_of(request), after, request.args.get("wait", 0, type=float))
+    except stock_monitor.TooManyWaiters:
+        response = jsonify({"error": "Too many alert long polls are open, retry shortly.", "retry_after_s": 5})
+        response.status_code = 429
+        response.headers["Retry-After"] = "5"
+        return response
+    return jsonify({"alerts": alerts, "next": alerts[-1]["seq"] if alerts else after})
+
+
+@app.route("/monitor/status", methods=["GET"])
+def monitor_status_handler():
+    """Coverage, depletion rate and state of the calling tenant's SKUs (?product=, ?state=low)."""
+    monitor = stock_monitor.get_monitor()
+    if monitor is None:
+        return jsonify({"error": "The stock monitor is disabled"}), 404
+    skus = monitor.store.status(admission.tenant_of(request), request.args.get("product"), request.args.get("state"))
+    return jsonify({"skus": skus})
+
+
+@app.route("/admission/stats", methods=["GET"])
+def admission_stats_handler():
+    """Capacity in use, queue depths and rejections of this worker's admission control."""
+    return jsonify(admission.get_controller().stats())
+
+@app.route("/llm/stats", methods=["GET"])
+def llm_stats_handler():
+    """Per-call-site LLM counters plus response cache hit/miss counts."""
+    return jsonify(llm_stats())
+
 # ----------------------
 # Run Server
 # ----------------------
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5001, debug=True)
+    app.run(host="127.0.0.1", port=services.port("ai"), debug=True)
@@ -0,0 +1,622 @@
+"""
+Embedded analytical store for transaction history and stock snapshots.
+
+Line items are kept per tenant in SQLite, tagged with their month and
+indexed by (tenant, product, time), with a monthly_sales rollup per
+product maintained as items are appended. Stock is stored as snapshots,
+of which the newest is current. The agents query these tables instead of
+building DataFrames from every request body:
+
+    source = analytics_store.request_source()   # (store, tenant) or None
+    if source:
+        months, mean_qty = source[0].sales_since(source[1], "rice", since)
+
+The router syncs each request's data in the background when its dataset
+version changes and forwards the tenant and version to the agents in
+headers. Each stored transaction keeps a hash of its content: new ones
+are inserted, edited ones replaced and ones missing from the body
+(deleted in the dashboard) removed. A version is marked synced only when
+the stored hashes then match the body. An agent uses the store only when it
+has synced that version, and falls back to the request body otherwise.
+Only requests with an explicit X-Tenant-Id are synced.
+ANALYTICS_PATH="" turns the store off.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import request
+
+import catalog_snapshot
+import metrics
+
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "analytics.sqlite3")
+STOCK_SNAPSHOTS_KEPT = int(os.getenv("ANALYTICS_STOCK_SNAPSHOTS", 30))
+TENANT_HEADER = os.getenv("ADMISSION_TENANT_HEADER", "X-Tenant-Id")  # the header admission control reads
+VERSION_HEADER = "X-Dataset-Version"
+
+logger = logging.getLogger(__name__)
+
+_request_dataset = contextvars.ContextVar("analytics_dataset", default=None)  # (tenant, version)
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+# Fields the agents and this store read; a change to any of them is a new dataset version
+STOCK_FIELDS = ("product_name", "name", "qty", "base_cost_usd", "suggested_price_usd", "supplierName", "purchase_price")
+TRANSACTION_FIELDS = ("tid", "createdAt", "cus_name", "total_amount")
+ITEM_FIELDS = ("product_name", "qty", "selling_price", "discount", "subtotal", "discounted_subtotal")
+
+
+def _fields(row, fields):
+    return "\x1f".join(str(row.get(f)) for f in fields)
+
+
+def _transaction_content(transaction):
+    """The fields of a transaction and its line items as one string."""
+    items = transaction.get("items")
+    parts = [_fields(transaction, TRANSACTION_FIELDS)]
+    if isinstance(items, list):
+        parts.extend(_fields(item, ITEM_FIELDS) if isinstance(item, dict) else str(item) for item in items)
+    else:
+        parts.append(_fields(transaction, ITEM_FIELDS))
+    return "\x1d".join(parts)
+
+
+def dataset_version(stock_data, transaction_data):
+    """
+    Fingerprint of a tenant's data: the fields in STOCK_FIELDS of every
+    stock row and every transaction with its line items, in order.
+    """
+    stock = "\x1e".join(_fields(row, STOCK_FIELDS) if isinstance(row, dict) else "" for row in stock_data or [])
+    transactions = "\x1e".join(
+        _transaction_content(t) if isinstance(t, dict) else "" for t in transaction_data or []
+    )
+    return hashlib.sha1(f"{stock}\x1c{transactions}".encode()).hexdigest()[:16]
+
+
+def _timestamp(value):
+    """ISO createdAt -> naive "YYYY-MM-DD HH:MM:SS" in the writer's wall time (as pandas tz_localize(None) does)."""
+    if not value:
+        return None
+    text = str(value).strip().replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return None
+    return parsed.replace(tzinfo=None).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _number(value):
+    """SQLite sums come back as floats; whole numbers read better as ints."""
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _tx_key(transaction):
+    """A transaction's tid, or a hash of its content when it has none."""
+    return transaction.get("tid") or hashlib.sha1(
+        json.dumps(transaction, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _content_hash(transaction):
+    return hashlib.sha1(_transaction_content(transaction).encode()).hexdigest()
+
+
+def _line_items(transaction):
+    """Items of a nested transaction, or the row itself when transactions are already flat."""
+    items = transaction.get("items")
+    return items if isinstance(items, list) else [transaction]
+
+
+# ----------------------
+# Store
+# ----------------------
+class AnalyticsStore:
+    """SQLite tables for line items, monthly rollups and stock snapshots, per tenant."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tenants (
+                tenant TEXT PRIMARY KEY,
+                synced_version TEXT,
+                stock_hash TEXT,
+                high_water TEXT,
+                synced_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS transactions (
+                tenant TEXT,
+                tx_key TEXT,
+                created_at TEXT,
+                customer TEXT,
+                total REAL,
+                content_hash TEXT,
+                PRIMARY KEY (tenant, tx_key)
+            );
+            CREATE INDEX IF NOT EXISTS transactions_customer ON transactions (tenant, customer, created_at);
+            CREATE TABLE IF NOT EXISTS line_items (
+                tenant TEXT,
+                tx_key TEXT,
+                month TEXT,
+                created_at TEXT,
+                product TEXT,
+                product_name TEXT,
+                qty REAL,
+                selling_price REAL,
+                discount REAL,
+                subtotal REAL
+            );
+            CREATE INDEX IF NOT EXISTS line_items_product ON line_items (tenant, product, created_at);
+            CREATE INDEX IF NOT EXISTS line_items_tx ON line_items (tenant, tx_key);
+            CREATE TABLE IF NOT EXISTS monthly_sales (
+                tenant TEXT,
+                product TEXT,
+                month TEXT,
+                qty REAL,
+                items INTEGER,
+                revenue REAL,
+                PRIMARY KEY (tenant, product, month)
+            );
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                tenant TEXT,
+                snapshot_id INTEGER,
+                taken_at REAL,
+                PRIMARY KEY (tenant, snapshot_id)
+            );
+            CREATE TABLE IF NOT EXISTS stock_lots (
+                tenant TEXT,
+                snapshot_id INTEGER,
+                position INTEGER,
+                product TEXT,
+                product_name TEXT,
+                supplier TEXT,
+                qty REAL,
+                purchase_price REAL,
+                base_cost REAL,
+                suggested_price REAL
+            );
+            CREATE INDEX IF NOT EXISTS stock_lots_product ON stock_lots (tenant, snapshot_id, product, position);
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(transactions)")]
+        if "content_hash" not in columns:  # stores created before edits were reconciled
+            self._conn.execute("ALTER TABLE transactions ADD COLUMN content_hash TEXT")
+        self._conn.commit()
+
+    # ----------------------
+    # Append
+    # ----------------------
+    def append_transactions(self, tenant, transactions, full=False):
+        """
+        Insert transactions not stored yet (keyed by tid) with their line
+        items and content hash, and update the monthly rollup. Transactions older than the
+        tenant's newest stored one are skipped without a lookup unless
+        full is set. Returns the number of transactions added.
+        """
+        added = 0
+        with self._lock:
+            row = self._conn.execute("SELECT high_water FROM tenants WHERE tenant = ?", (tenant,)).fetchone()
+            high_water = row[0] if row and row[0] else ""
+            skip_before = "" if full else high_water
+            newest = high_water
+            cur = self._conn.cursor()
+            for tx in transactions or []:
+                created_at = _timestamp(tx.get("createdAt"))
+                if created_at is None or created_at < skip_before:
+                    continue
+                items = _line_items(tx)
+                tx_key = _tx_key(tx)
+                cur.execute(
+                    "INSERT OR IGNORE INTO transactions (tenant, tx_key, created_at, customer, total, content_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tenant, tx_key, created_at, tx.get("cus_name"), tx.get("total_amount"), _content_hash(tx)),
+                )
+                if not cur.rowcount:
+                    continue
+                added += 1
+                newest = max(newest, created_at)
+                month = created_at[:7]
+                for item in items:
+                    product = normalize_name(item.get("product_name"))
+                    qty = float(item.get("qty") or 0)
+                    subtotal = item.get("discounted_subtotal", item.get("subtotal"))
+                    cur.execute(
+                        "INSERT INTO line_items (tenant, tx_key, month, created_at, product, product_name, qty, "
+                        "selling_price, discount, subtotal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (tenant, tx_key, month, created_at, product, item.get("product_name"), qty,
+                         item.get("selling_price"), item.get("discount"), subtotal),
+                    )
+                    cur.execute(
+                        "INSERT INTO monthly_sales (tenant, product, month, qty, items, revenue) VALUES (?, ?, ?, ?, 1, ?) "
+                        "ON CONFLICT(tenant, product, month) DO UPDATE SET qty = qty + excluded.qty, "
+                        "items = items + 1, revenue = revenue + excluded.revenue",
+                        (tenant, product, month, qty, float(subtotal or 0)),
+                    )
+            cur.execute(
+                "INSERT INTO tenants (tenant, high_water) VALUES (?, ?) "
+                "ON CONFLICT(tenant) DO UPDATE SET high_water = excluded.high_water",
+                (tenant, newest),
+            )
+            self._conn.commit()
+        return added
+
+    def remove_transactions(self, tenant, keys):
+        """
+        Delete the tenant's transactions with these keys, with their line
+        items and their share of the monthly rollup. Returns how many.
+        """
+        with self._lock:
+            cur = self._conn.cursor()
+            for tx_key in keys:
+                for product, month, qty, subtotal in cur.execute(
+                    "SELECT product, month, qty, subtotal FROM line_items WHERE tenant = ? AND tx_key = ?",
+                    (tenant, tx_key),
+                ).fetchall():
+                    cur.execute(
+                        "UPDATE monthly_sales SET qty = qty - ?, items = items - 1, revenue = revenue - ? "
+                        "WHERE tenant = ? AND product = ? AND month = ?",
+                        (qty or 0, float(subtotal or 0), tenant, product, month),
+                    )
+                cur.execute("DELETE FROM line_items WHERE tenant = ? AND tx_key = ?", (tenant, tx_key))
+                cur.execute("DELETE FROM transactions WHERE tenant = ? AND tx_key = ?", (tenant, tx_key))
+            if keys:
+                cur.execute("DELETE FROM monthly_sales WHERE tenant = ? AND items <= 0", (tenant,))
+            self._conn.commit()
+        return len(keys)
+
+    def transaction_hashes(self, tenant):
+        """{transaction key: content hash} of everything stored for the tenant."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT tx_key, content_hash FROM transactions WHERE tenant = ?", (tenant,)
+            ).fetchall())
+
+    def replace_stock(self, tenant, stock_data):
+        """Store stock_data as the tenant's current snapshot unless it is unchanged. Returns True if stored."""
+        stock_hash = hashlib.sha1(json.dumps(stock_data, sort_keys=True, default=str).encode()).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT stock_hash FROM tenants WHERE tenant = ?", (tenant,)).fetchone()
+            if row and row[0] == stock_hash:
+                return False
+            last = self._conn.execute(
+                "SELECT MAX(snapshot_id) FROM stock_snapshots WHERE tenant = ?", (tenant,)
+            ).fetchone()[0]
+            snapshot_id = (last or 0) + 1
+            self._conn.execute("INSERT INTO stock_snapshots VALUES (?, ?, ?)", (tenant, snapshot_id, time.time()))
+            self._conn.executemany(
+                "INSERT INTO stock_lots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (tenant, snapshot_id, position, normalize_name(lot.get("product_name") or lot.get("name")),
+                     lot.get("product_name") or lot.get("name"), lot.get("supplierName"), float(lot.get("qty") or 0),
+                     lot.get("purchase_price"), lot.get("base_cost_usd"), lot.get("suggested_price_usd"))
+                    for position, lot in enumerate(stock_data or [])
+                ],
+            )
+            oldest_kept = snapshot_id - STOCK_SNAPSHOTS_KEPT
+            self._conn.execute("DELETE FROM stock_lots WHERE tenant = ? AND snapshot_id <= ?", (tenant, oldest_kept))
+            self._conn.execute("DELETE FROM stock_snapshots WHERE tenant = ? AND snapshot_id <= ?", (tenant, oldest_kept))
+            self._conn.execute(
+                "INSERT INTO tenants (tenant, stock_hash) VALUES (?, ?) "
+                "ON CONFLICT(tenant) DO UPDATE SET stock_hash = excluded.stock_hash",
+                (tenant, stock_hash),
+            )
+            self._conn.commit()
+        return True
+
+    def sync(self, tenant, version, stock_data, transaction_data):
+        """
+        Bring the tenant up to a request's data and record the version it now
+        matches. Returns the number of transactions added, or None when the
+        stored transactions still differ from the body and the version was
+        not recorded.
+        """
+        with metrics.timed("analytics_sync"):
+            self.replace_stock(tenant, stock_data)
+            body = {}  # key -> (content hash, transaction); the first of repeated keys is the one stored
+            for tx in transaction_data or []:
+                if isinstance(tx, dict) and _timestamp(tx.get("createdAt")) is not None:
+                    body.setdefault(_tx_key(tx), (_content_hash(tx), tx))
+            stored = self.transaction_hashes(tenant)
+            # Deleted in the dashboard, or edited since they were stored
+            stale = [key for key, content_hash in stored.items() if body.get(key, (None,))[0] != content_hash]
+            removed = self.remove_transactions(tenant, stale)
+            stale = set(stale)
+            added = self.append_transactions(
+                tenant, [tx for key, (_, tx) in body.items() if key not in stored or key in stale], full=True
+            )
+            if self.transaction_hashes(tenant) != {key: content_hash for key, (content_hash, _) in body.items()}:
+                logger.warning("analytics store does not match the request", extra={"tenant": tenant, "version": version})
+                with self._lock:
+                    self._conn.execute("UPDATE tenants SET synced_version = NULL WHERE tenant = ?", (tenant,))
+                    self._conn.commit()
+                return None
+            if removed:
+                logger.info("analytics replaced edited or deleted transactions", extra={"tenant": tenant, "removed": removed})
+            try:
+                catalog_snapshot.publish(self, tenant, version)  # before the version is visible to the agents
+            except Exception:
+                logger.exception("catalog snapshot failed")
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE tenants SET synced_version = ?, synced_at = ? WHERE tenant = ?", (version, time.time(), tenant)
+                )
+                self._conn.commit()
+        return added
+
+    def synced_version(self, tenant):
+        with self._lock:
+            row = self._conn.execute("SELECT synced_version FROM tenants WHERE tenant = ?", (tenant,)).fetchone()
+        return row[0] if row else None
+
+    # ----------------------
+    # Queries
+    # ----------------------
+    def _current_snapshot(self, tenant):
+        return self._conn.execute(
+            "SELECT MAX(snapshot_id) FROM stock_snapshots WHERE tenant = ?", (tenant,)
+        ).fetchone()[0]
+
+    def current_stock(self, tenant, product):
+        """The first stock row for product in the current snapshot, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT product_name, qty, base_cost, suggested_price, supplier FROM stock_lots "
+                "WHERE tenant = ? AND snapshot_id = ? AND product = ? ORDER BY position LIMIT 1",
+                (tenant, self._current_snapshot(tenant), normalize_name(product)),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"product_name": row[0], "qty": _number(row[1]), "base_cost": row[2],
+                "suggested_price": row[3], "supplier": row[4]}
+
+    def products(self, tenant):
+        """Product names in the current snapshot, in stock order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT product_name FROM stock_lots WHERE tenant = ? AND snapshot_id = ? AND product != '' "
+                "GROUP BY product ORDER BY MIN(position)",
+                (tenant, self._current_snapshot(tenant)),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def monthly_sales(self, tenant, product, since_month=None):
+        """[(month "YYYY-MM", qty, line items)] for product from the rollup, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT month, qty, items FROM monthly_sales WHERE tenant = ? AND product = ? AND month >= ? ORDER BY month",
+                (tenant, normalize_name(product), since_month or ""),
+            ).fetchall()
+        return [(month, _number(qty), items) for month, qty, items in rows]
+
+    def sales_since(self, tenant, product, since):
+        """
+        Monthly quantities of product sold since a datetime, and the mean
+        quantity per line item over the same window (None without sales).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT month, SUM(qty), COUNT(*) FROM line_items "
+                "WHERE tenant = ? AND product = ? AND created_at >= ? GROUP BY month ORDER BY month",
+                (tenant, normalize_name(product), since.strftime("%Y-%m-%d %H:%M:%S")),
+            ).fetchall()
+        items = sum(row[2] for row in rows)
+        mean_qty = sum(row[1] for row in rows) / items if items else None
+        return [(month, _number(qty)) for month, qty, _ in rows], mean_qty
+
+    def sales_mean(self, tenant, product):
+        """Mean quantity per line item of product over all history (None without sales)."""
+        with self._lock:
+            qty, items = self._conn.execute(
+                "SELECT SUM(qty), SUM(items) FROM monthly_sales WHERE tenant = ? AND product = ?",
+                (tenant, normalize_name(product)),
+            ).fetchone()
+        return qty / items if items else None
+
+    def supplier_price_stats(self, tenant, product):
+        """Per supplier of product in the current snapshot: lots, total quantity and purchase price stats."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT COALESCE(supplier, 'Unknown'), COUNT(*), SUM(qty), AVG(NULLIF(purchase_price, 0)), "
+                "MIN(NULLIF(purchase_price, 0)), MAX(NULLIF(purchase_price, 0)) FROM stock_lots "
+                "WHERE tenant = ? AND snapshot_id = ? AND product = ? GROUP BY COALESCE(supplier, 'Unknown')",
+                (tenant, self._current_snapshot(tenant), normalize_name(product)),
+            ).fetchall()
+        return [
+            {"supplier": supplier, "lots": lots, "total_qty": _number(total_qty),
+             "avg_price": avg or 0, "min_price": low, "max_price": high}
+            for supplier, lots, total_qty, avg, low, high in rows
+        ]
+
+    def catalog(self, tenant):
+        """
+        One row per product stocked or sold: the first stock row of the
+        current snapshot (None fields when not stocked) and all-time sales.
+        """
+        with self._lock:
+            snapshot_id = self._current_snapshot(tenant)
+            stock = self._conn.execute(
+                "SELECT l.product, l.product_name, l.position, l.qty, l.base_cost, l.suggested_price "
+                "FROM stock_lots l JOIN (SELECT product, MIN(position) AS position FROM stock_lots "
+                "WHERE tenant = ? AND snapshot_id = ? GROUP BY product) f "
+                "ON l.product = f.product AND l.position = f.position WHERE l.tenant = ? AND l.snapshot_id = ?",
+                (tenant, snapshot_id, tenant, snapshot_id),
+            ).fetchall()
+            sales = self._conn.execute(
+                "SELECT product, SUM(qty), SUM(items) FROM monthly_sales WHERE tenant = ? GROUP BY product", (tenant,)
+            ).fetchall()
+        rows = {
+            product: {"product": product, "product_name": name, "position": position, "qty": qty,
+                      "base_cost": base_cost, "suggested_price": suggested_price}
+            for product, name, position, qty, base_cost, suggested_price in stock if product
+        }
+        for product, total_qty, total_items in sales:
+            if product:
+                row = rows.setdefault(product, {"product": product})
+                row["total_qty"], row["total_items"] = total_qty, total_items
+        return list(rows.values())
+
+    def daily_sales(self, tenant, since):
+        """[(product, "YYYY-MM-DD", qty, line items)] from a date on."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT product, substr(created_at, 1, 10), SUM(qty), COUNT(*) FROM line_items "
+                "WHERE tenant = ? AND created_at >= ? GROUP BY product, substr(created_at, 1, 10)",
+                (tenant, since.isoformat()),
+            ).fetchall()
+
+    def customer_orders(self, tenant, customer, limit=10):
+        """A customer's most recent transactions with their line items, newest first."""
+        with self._lock:
+            txs = self._conn.execute(
+                "SELECT tx_key, created_at, total FROM transactions WHERE tenant = ? AND customer = ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (tenant, customer, limit),
+            ).fetchall()
+            orders = []
+            for tx_key, created_at, total in txs:
+                items = self._conn.execute(
+                    "SELECT product_name, qty, selling_price, subtotal FROM line_items WHERE tenant = ? AND tx_key = ?",
+                    (tenant, tx_key),
+                ).fetchall()
+                orders.append({
+                    "tid": tx_key, "createdAt": created_at, "total_amount": total,
+                    "items": [{"product_name": n, "qty": _number(q), "selling_price": p, "subtotal": s}
+                              for n, q, p, s in items],
+                })
+        return orders
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process's store, opened on first use; None when ANALYTICS_PATH is empty."""
+    global _store
+    if not ANALYTICS_PATH:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore(ANALYTICS_PATH)
+    return _store
+
+
+# ----------------------
+# Router side
+# ----------------------
+_syncer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics-sync")
+_known_versions = {}  # tenant -> last version this process queued for sync
+
+
+def _sync(tenant, version, stock_data, transaction_data):
+    try:
+        added = get_store().sync(tenant, version, stock_data, transaction_data)
+        if added is None:
+            return
+        logger.info("analytics synced", extra={"tenant": tenant, "version": version, "transactions_added": added})
+    except Exception:
+        logger.exception("analytics sync failed")
+        _known_versions.pop(tenant, None)
+
+
+def observe_request(tenant, stock_data, transaction_data):
+    """
+    Fingerprint a request's data, remember it for outgoing_headers() and
+    queue a background sync when the version is new. Returns the version.
+    tenant is None when the caller sent no X-Tenant-Id: the agents then
+    answer from the body, since callers without one would share a tenant.
+    """
+    version = dataset_version(stock_data, transaction_data)
+    _request_dataset.set((tenant, version) if tenant else None)
+    if not tenant:
+        return version
+    if get_store() is not None and stock_data and _known_versions.get(tenant) != version:
+        _known_versions[tenant] = version
+        _syncer.submit(_sync, tenant, version, stock_data, transaction_data)
+    return version
+
+
+def dataset_headers(tenant, version):
+    return {TENANT_HEADER: tenant, VERSION_HEADER: version}
+
+
+def outgoing_headers():
+    """Tenant and dataset version for a call to an agent, so it can answer from the store."""
+    context = _request_dataset.get()
+    return dataset_headers(*context) if context else {}
+
+
+# ----------------------
+# Agent side
+# ----------------------
+class SnapshotReader:
+    """
+    The store's query helpers answered from the mapped catalog snapshot
+    where it holds the data, and from SQLite otherwise.
+    """
+
+    def __init__(self, snapshot, store):
+        self.snapshot = snapshot
+        self.store = store
+
+    def products(self, tenant):
+        return self.snapshot.products(tenant)
+
+    def current_stock(self, tenant, product):
+        return self.snapshot.current_stock(tenant, product)
+
+    def sales_mean(self, tenant, product):
+        return self.snapshot.sales_mean(tenant, product)
+
+    def sales_since(self, tenant, product, since):
+        if self.snapshot.covers(since):
+            return self.snapshot.sales_since(tenant, product, since)
+        return self.store.sales_since(tenant, product, since)
+
+    def monthly_sales(self, tenant, product, since_month=None):
+        return self.store.monthly_sales(tenant, product, since_month)
+
+    def supplier_price_stats(self, tenant, product):
+        return self.store.supplier_price_stats(tenant, product)
+
+    def customer_orders(self, tenant, customer, limit=10):
+        return self.store.customer_orders(tenant, customer, limit)
+
+
+def request_source():
+    """
+    (store, tenant) when the store holds this request's data: the tenant
+    header is set and the store has synced the version in the version
+    header (or any version, when the caller sent none). Otherwise None.
+    The store is wrapped in a SnapshotReader when that version's catalog
+    snapshot is on disk.
+    """
+    tenant = request.headers.get(TENANT_HEADER)
+    store = get_store() if tenant else None
+    if store is None:
+        return None
+    synced = store.synced_version(tenant)
+    wanted = request.headers.get(VERSION_HEADER)
+    if synced is None or (wanted and synced != wanted):
+        metrics.inc("analytics_requests_total", source="body")
+        return None
+    snapshot = catalog_snapshot.get(tenant, synced)
+    metrics.inc("analytics_requests_total", source="snapshot" if snapshot else "store")
+    return (SnapshotReader(snapshot, store) if snapshot else store), tenant
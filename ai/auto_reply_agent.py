@@ -1,14 +1,35 @@
 from flask import Flask, request, jsonify
-import google.generativeai as genai
-import os
 from dotenv import load_dotenv
 import re
 import json
+import logging
+import os
+from llm_gateway import generate
+from llm_cache import get_cache
+import deadline
+import email_preprocess
+import log_setup
+import metrics
+import services
+import tracing
+import wire_format
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+log_setup.configure("auto_reply", "auto_reply_agent_logs.txt")
 
 app = Flask(__name__)
+deadline.init_app(app, budget_s=15)
+services.init_app(app, "auto_reply")
+tracing.init_app(app, "auto_reply")
+metrics.init_app(app, "auto_reply")
+wire_format.init_app(app)
+
+# Answers are stored per message (tenant and message id) so a redelivered message skips parsing and the model
+DEDUP_TTL_S = float(os.getenv("AUTO_REPLY_DEDUP_TTL_S", 24 * 3600))
+DEDUP_PREFIX = "auto_reply:message:"
+TENANT_HEADER = os.getenv("ADMISSION_TENANT_HEADER", "X-Tenant-Id")
+
+metrics.describe("auto_reply_duplicates_total", "counter", "Customer emails answered from a stored reply.")
 
 # Helper: simple regex-based quantity detection
 # small word→number map for common words
@@ -44,6 +65,7 @@ def words_to_num(text):
     total += current
     return total if seen else None
 
+@metrics.timed("order_parse")
 def parse_order_from_message(message, stock_data):
     """
     Robust extraction of ordered items from free text.
@@ -150,18 +172,8 @@ def parse_order_from_message(message, stock_data):
 
     return results
 
-@app.route("/auto_reply", methods=["POST"])
-def auto_reply():
-    data = request.get_json()
-    email = data.get("email", {})
-    stock_data = data.get("stock_data", [])
-    transaction_data = data.get("transaction_data", [])
-    processed_order = data.get("processedOrder", None)  # optional: after backend processing
-
-    customer_message = email.get("body", "")
-    subject = email.get("subject", "")
-    sender = email.get("from", "")
-
+def compose_reply(sender, subject, customer_message, stock_data, transaction_data, processed_order):
+    """Detect an order in the cleaned message and write the HTML reply."""
     # --- Detect order from message ---
     order_items = parse_order_from_message(customer_message, stock_data)
     order_detected = len(order_items) > 0
@@ -194,19 +206,66 @@ def auto_reply():
 
     prompt += "\nEnd with: <br><br>Best regards,<br>The Nexabiz Team"
 
+    reply_text = generate(prompt, model="gemini-2.5-flash-lite", call_site="auto_reply",
+                          deadline=deadline.remaining()).strip()
+    return {
+        "reply": reply_text,
+        "orderDetected": order_detected,
+        "customer_name": sender,
+        "items": order_items
+    }
+
+
+@app.route("/auto_reply", methods=["POST"])
+def auto_reply():
+    """
+    Reply to a customer email, detecting any order in it. Only the new
+    content of the message is parsed and prompted (see email_preprocess).
+    A message with an id ("id", e.g. Gmail's message id) already answered
+    for the same tenant (X-Tenant-Id) within AUTO_REPLY_DEDUP_TTL_S gets the
+    stored answer back with "duplicate": true. Messages without an id are
+    always answered, so a customer repeating an order is never dropped.
+    Send the original message's "fingerprint" with the order confirmation
+    call so that a redelivery of the original gets the confirmation.
+    """
+    data = request.get_json()
+    email = data.get("email", {})
+    stock_data = data.get("stock_data", [])
+    transaction_data = data.get("transaction_data", [])
+    processed_order = data.get("processedOrder", None)  # optional: after backend processing
+
+    cleaned = email_preprocess.clean(email.get("body", ""))
+    customer_message = cleaned.text
+    subject = email.get("subject", "")
+    sender = email.get("from", "")
+    message_id = email.get("id") or email.get("messageId") or email.get("message_id")
+    tenant = request.headers.get(TENANT_HEADER, "")
+    fingerprint = email_preprocess.fingerprint(sender, customer_message, tenant, message_id, processed_order)
+    dedup = DEDUP_TTL_S > 0 and bool(message_id)
+
+    computed = []
+
+    def answer():
+        computed.append(True)
+        return json.dumps(compose_reply(sender, subject, customer_message, stock_data, transaction_data,
+                                        processed_order))
+
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash-lite")
-        result = model.generate_content(prompt)
-        reply_text = result.text.strip()
-        return jsonify({
-            "reply": reply_text,
-            "orderDetected": order_detected,
-            "customer_name": sender,
-            "items": order_items
-        })
+        if dedup:
+            result = json.loads(get_cache().get_or_compute(DEDUP_PREFIX + fingerprint, DEDUP_TTL_S, answer))
+        else:
+            result = json.loads(answer())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    if not computed:
+        metrics.inc("auto_reply_duplicates_total")
+        logging.info(f"auto_reply: duplicate message {fingerprint}, returning the stored reply")
+    elif DEDUP_TTL_S > 0 and isinstance(data.get("fingerprint"), str):
+        get_cache().put(DEDUP_PREFIX + data["fingerprint"], json.dumps(result), DEDUP_TTL_S)
+    return jsonify({**result, "fingerprint": fingerprint, "duplicate": not computed,
+                    "preprocessing": cleaned.summary()})
+
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5005, debug=True)
+    app.run(host="127.0.0.1", port=services.port("auto_reply"), debug=True)
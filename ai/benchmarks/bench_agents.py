@@ -0,0 +1,244 @@
+"""
+Latency of every agent endpoint on synthetic data, with external services stubbed.
+
+Runs /predict_demand, /optimize_order, /supply-check and /auto_reply
+through Flask's test client, plus parse_order_from_message and PDF order
+parsing directly, at each dataset size (see synthetic.py). External calls
+go to benchmarks/stubs.py, answering instantly by default so the numbers
+are the agents' own work. Caches are cleared before every round. Run from
+ai/, save the results, and compare a later run against them:
+
+    python benchmarks/bench_agents.py --sizes 100,10k --json benchmarks/results/before.json
+    python benchmarks/bench_agents.py --sizes 100,10k --compare benchmarks/results/before.json
+
+--compare exits non-zero when a case's median is more than --threshold
+slower than in the saved run. --analytics loads each dataset into a
+scratch analytics store first and sends the tenant header, so the agents
+answer from the store instead of the request body.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+import synthetic  # noqa: E402
+
+
+# ----------------------
+# Cases
+# ----------------------
+# Each case takes the dataset and returns the function to time; the function
+# raises if the agent answered with an error, so failures don't pass as fast runs.
+HEADERS = {}  # the tenant header when --analytics is on
+
+
+def _post(client, path, payload):
+    response = client.post(path, json=payload, headers=HEADERS)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def case_predict_demand(data):
+    import demand_predictor
+
+    client = demand_predictor.app.test_client()
+    payload = {
+        "query": f"predict demand for {data['products'][0]}",
+        "stock_data": data["stock_data"],
+        "transaction_data": data["transaction_data"],
+    }
+
+    def run():
+        demand_predictor._trend_cache.clear()
+        _post(client, "/predict_demand", payload)
+    return run
+
+
+def case_optimize_order(data):
+    import order_optimizer
+
+    client = order_optimizer.app.test_client()
+    payload = {
+        "query": f"optimize order for {data['products'][0]}",
+        "stock_data": data["stock_data"],
+        "transaction_data": synthetic.flat_transactions(data["transaction_data"]),
+    }
+    return lambda: _post(client, "/optimize_order", payload)
+
+
+def case_supply_check(data):
+    import supply_checker
+
+    client = supply_checker.app.test_client()
+    payload = {
+        "query": f"supply check for {data['products'][0]}",
+        "product_name": data["products"][0].lower(),
+        "stock_data": data["stock_data"],
+    }
+    return lambda: _post(client, "/supply-check", payload)
+
+
+def case_auto_reply(data):
+    import auto_reply_agent
+
+    client = auto_reply_agent.app.test_client()
+    email = synthetic.customer_emails(data["products"], count=1)[0]["email"]
+    payload = {"email": email, "stock_data": data["stock_data"], "transaction_data": data["transaction_data"][:50]}
+    return lambda: _post(client, "/auto_reply", payload)
+
+
+def case_parse_order_message(data):
+    from auto_reply_agent import parse_order_from_message
+
+    emails = synthetic.customer_emails(data["products"], count=20)
+
+    def run():
+        for e in emails:
+            parse_order_from_message(e["email"]["body"], data["stock_data"])
+    return run
+
+
+def case_parse_order_pdf(data):
+    from pdf_order_parser import parse_order_pdf
+
+    lines = min(len(data["stock_data"]), 2000)
+    pdf = synthetic.order_pdf(data["products"], lines=lines)
+    return lambda: parse_order_pdf(io.BytesIO(pdf), data["products"])
+
+
+CASES = {
+    "predict_demand": case_predict_demand,
+    "optimize_order": case_optimize_order,
+    "supply_check": case_supply_check,
+    "auto_reply": case_auto_reply,
+    "parse_order_message": case_parse_order_message,
+    "parse_order_pdf": case_parse_order_pdf,
+}
+
+
+# ----------------------
+# Measurement
+# ----------------------
+def _reset_caches():
+    from llm_cache import get_cache
+    get_cache().clear()
+
+
+def measure(run, rounds, warmup):
+    """Timing stats in ms over `rounds` calls after `warmup` untimed ones."""
+    for _ in range(warmup):
+        _reset_caches()
+        run()
+    timings = []
+    for _ in range(rounds):
+        _reset_caches()
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "rounds": rounds,
+        "min_ms": round(timings[0], 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "stddev_ms": round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print median changes against a saved run; returns the cases that regressed."""
+    base = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'case':<22}{'size':>6}{'base ms':>11}{'now ms':>11}{'change':>9}")
+    for r in results:
+        old = base.get((r["case"], r["size"]))
+        if old is None or "median_ms" not in old or "median_ms" not in r:
+            continue
+        change = r["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{r['case']:<22}{r['size']:>6}{old['median_ms']:>11.2f}{r['median_ms']:>11.2f}{change:>+9.1%}{flag}")
+        if flag:
+            regressions.append(f"{r['case']}@{r['size']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,10k", help="comma-separated dataset sizes: 100, 10k, 1m or a number")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated subset of " + ", ".join(CASES))
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="stub latency multiplier; 1 adds realistic provider latency")
+    parser.add_argument("--analytics", action="store_true", help="answer from a scratch analytics store")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="median slowdown counted as a regression")
+    args = parser.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    if args.analytics:
+        os.environ["ANALYTICS_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-analytics-"), "analytics.sqlite3")
+    stubs.install(args.latency_scale)
+    results = []
+    print(f"{'case':<22}{'size':>6}{'median ms':>11}{'mean ms':>10}{'p95 ms':>10}{'stddev':>9}")
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        start = time.perf_counter()
+        data = synthetic.dataset(synthetic.parse_size(size), args.seed)
+        stubs.set_firestore_products(data["products"])
+        print(f"-- {size}: generated in {time.perf_counter() - start:.1f}s")
+        if args.analytics:
+            import analytics_store
+
+            start = time.perf_counter()
+            tenant = f"bench-{size}"
+            analytics_store.get_store().sync(tenant, "bench", data["stock_data"], data["transaction_data"])
+            HEADERS[analytics_store.TENANT_HEADER] = tenant
+            print(f"-- {size}: loaded into the analytics store in {time.perf_counter() - start:.1f}s")
+        for name in cases:
+            try:
+                stats = measure(CASES[name](data), args.rounds, args.warmup)
+            except Exception as e:
+                results.append({"case": name, "size": size, "error": f"{type(e).__name__}: {e}"})
+                print(f"{name:<22}{size:>6}  failed: {type(e).__name__}: {e}")
+                continue
+            results.append({"case": name, "size": size, **stats})
+            print(f"{name:<22}{size:>6}{stats['median_ms']:>11.2f}{stats['mean_ms']:>10.2f}"
+                  f"{stats['p95_ms']:>10.2f}{stats['stddev_ms']:>9.2f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "latency_scale": args.latency_scale,
+                "analytics": args.analytics,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\nSlower than {args.compare} by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
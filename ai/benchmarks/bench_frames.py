@@ -0,0 +1,150 @@
+"""
+Memory and build time of the agents' DataFrames: raw dicts vs typed column buffers.
+
+Builds demand_predictor's stock and line-item frames, with their
+normalized name columns, from the same synthetic body (see synthetic.py):
+
+    dicts      json.loads, DataFrames of every field the client sent,
+               names normalized with .apply() (the original construction)
+    columns    stream_ingest buffers of the needed columns as object
+               strings and int64/float64, names normalized with .apply()
+    typed      stream_ingest buffers with categorical names, downcast
+               numbers and vectorized normalization (what the agents use)
+
+"parse" is reading the body, "frames" is building the DataFrames from
+what was read, and "MB" is DataFrame.memory_usage(deep=True) of both
+frames. Needs pandas. Run from ai/:
+
+    python benchmarks/bench_frames.py --sizes 10k,100k --json benchmarks/results/frames.json
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+METHODS = ["dicts", "columns", "typed"]
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+def _specs(stream_ingest, name_kind):
+    # demand_predictor's STOCK_COLUMNS / ITEM_COLUMNS, without importing the agent
+    stock = {"product_name": name_kind, "qty": stream_ingest.NUM,
+             "base_cost_usd": stream_ingest.NUM, "suggested_price_usd": stream_ingest.NUM}
+    items = {"product_name": name_kind, "qty": stream_ingest.NUM, "createdAt": stream_ingest.TIME}
+    return stock, items
+
+
+def run_dicts(body, pd):
+    start = time.perf_counter()
+    data = json.loads(body)
+    parsed = time.perf_counter()
+    df_stock = pd.DataFrame(data["stock_data"])
+    flat = []
+    for t in data["transaction_data"]:
+        for item in t.get("items", []):
+            flat_item = item.copy()
+            flat_item["createdAt"] = t.get("createdAt")
+            flat.append(flat_item)
+    df_items = pd.DataFrame(flat)
+    df_stock["name_norm"] = df_stock["product_name"].apply(normalize_name)
+    df_items["product_name_norm"] = df_items["product_name"].apply(normalize_name)
+    return parsed - start, time.perf_counter() - parsed, (df_stock, df_items)
+
+
+def run_columns(body, pd):
+    import stream_ingest
+
+    stock_spec, item_spec = _specs(stream_ingest, stream_ingest.STR)
+    start = time.perf_counter()
+    payload = stream_ingest.read(io.BytesIO(body), stock_spec, item_spec)
+    parsed = time.perf_counter()
+    frames = []
+    for columns, norm in ((payload.stock, "name_norm"), (payload.items, "product_name_norm")):
+        import numpy as np
+        data = {}
+        for name, column in columns.columns.items():
+            if isinstance(column, stream_ingest._StringColumn):
+                data[name] = column.values
+            elif isinstance(column, stream_ingest._TimeColumn):
+                data[name] = pd.to_datetime(np.frombuffer(column.values, dtype=np.float64), unit="s")
+            else:
+                data[name] = np.frombuffer(column.values, dtype=np.int64 if column.ints else np.float64)
+        frame = pd.DataFrame(data)
+        frame[norm] = frame["product_name"].apply(normalize_name)
+        frames.append(frame)
+    return parsed - start, time.perf_counter() - parsed, tuple(frames)
+
+
+def run_typed(body, pd):
+    import stream_ingest
+
+    stock_spec, item_spec = _specs(stream_ingest, stream_ingest.NAME)
+    start = time.perf_counter()
+    payload = stream_ingest.read(io.BytesIO(body), stock_spec, item_spec)
+    parsed = time.perf_counter()
+    df_stock = payload.stock.to_frame(normalized={"product_name": "name_norm"})
+    df_items = payload.items.to_frame(normalized={"product_name": "product_name_norm"})
+    return parsed - start, time.perf_counter() - parsed, (df_stock, df_items)
+
+
+RUNNERS = {"dicts": run_dicts, "columns": run_columns, "typed": run_typed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k", help="comma-separated dataset sizes: 100, 10k, 1m or a number")
+    parser.add_argument("--methods", default=",".join(METHODS))
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    try:
+        import pandas as pd
+    except ImportError:
+        sys.exit("pandas is not installed")
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    results = []
+    print(f"{'size':>6}{'method':>9}{'rows':>10}{'MB':>9}{'parse s':>9}{'frames s':>10}{'total s':>9}")
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        data = synthetic.dataset(synthetic.parse_size(size), args.seed)
+        body = json.dumps({"stock_data": data["stock_data"], "transaction_data": data["transaction_data"]}).encode()
+        del data
+        for method in methods:
+            runs = []
+            for _ in range(args.repeat):
+                parse_s, frames_s, frames = RUNNERS[method](body, pd)
+                runs.append((parse_s + frames_s, parse_s, frames_s))
+                frame_bytes = sum(int(f.memory_usage(deep=True).sum()) for f in frames)
+                rows = sum(len(f) for f in frames)
+                del frames
+            total_s, parse_s, frames_s = min(runs)
+            results.append({"size": size, "method": method, "rows": rows, "frame_bytes": frame_bytes,
+                            "parse_s": round(parse_s, 4), "frames_s": round(frames_s, 4)})
+            print(f"{size:>6}{method:>9}{rows:>10}{frame_bytes / 2**20:>9.1f}{parse_s:>9.3f}"
+                  f"{frames_s:>10.3f}{total_s:>9.3f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "pandas": pd.__version__,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
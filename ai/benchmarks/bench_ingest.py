@@ -0,0 +1,174 @@
+"""
+Peak memory of reading a /predict_demand body: get_json() + DataFrames vs stream_ingest.
+
+Each method runs in its own subprocess on the same synthetic body (see
+synthetic.py), so its peak RSS is not inflated by an earlier run:
+
+    get_json     json.loads of the whole body, then the frames the agents
+                 used to build (transaction items flattened into dicts)
+    stream       stream_ingest column buffers for every row, then frames
+    filtered     stream_ingest keeping one product's last 90 days only
+
+Reported memory is the peak RSS above the process's RSS just before
+reading the body; the body is read from a file, as it would be from the
+socket. DataFrames are skipped when pandas is not installed. Run from ai/:
+
+    python benchmarks/bench_ingest.py --sizes 10k,1m --json benchmarks/results/ingest.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+METHODS = ["get_json", "stream", "filtered"]
+
+# The columns demand_predictor keeps (STOCK_COLUMNS / ITEM_COLUMNS there), without importing the agent
+STOCK_COLUMNS = {"product_name": "str", "qty": "num", "base_cost_usd": "num", "suggested_price_usd": "num"}
+ITEM_COLUMNS = {"product_name": "str", "qty": "num", "createdAt": "time"}
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _peak_rss_bytes():
+    # VmHWM starts over at exec; ru_maxrss on Linux keeps the parent's peak (the generated dataset)
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _pandas():
+    try:
+        import pandas
+        return pandas
+    except ImportError:
+        return None
+
+
+# ----------------------
+# Methods (run in the worker subprocess)
+# ----------------------
+def run_get_json(path, product, pd):
+    with open(path, "rb") as f:
+        data = json.loads(f.read())
+    rows = len(data["stock_data"])
+    if pd is not None:
+        df_stock = pd.DataFrame(data["stock_data"])
+        flat = []
+        for t in data["transaction_data"]:
+            for item in t.get("items", []):
+                flat_item = item.copy()
+                flat_item["createdAt"] = t.get("createdAt")
+                flat.append(flat_item)
+        df_transactions = pd.DataFrame(flat)
+        rows = len(df_stock) + len(df_transactions)
+    return rows
+
+
+def run_stream(path, product, pd, filtered=False):
+    from datetime import datetime, timedelta
+
+    import stream_ingest
+
+    def plan(fields):
+        if not filtered:
+            return None
+        return stream_ingest.Filters(products=[product], since=datetime.now() - timedelta(days=90))
+
+    with open(path, "rb") as f:
+        payload = stream_ingest.read(f, STOCK_COLUMNS, ITEM_COLUMNS, plan=plan)
+    rows = payload.stock.rows + payload.items.rows
+    if pd is not None:
+        frames = payload.stock.to_frame(), payload.items.to_frame()
+        rows = sum(len(frame) for frame in frames)
+    return rows
+
+
+def worker(method, path, product):
+    pd = _pandas()
+    if method != "get_json":
+        # Import what the streaming path needs before the baseline, as a running agent already has
+        import stream_ingest  # noqa: F401
+    baseline = _rss_bytes()
+    start = time.perf_counter()
+    if method == "get_json":
+        rows = run_get_json(path, product, pd)
+    else:
+        rows = run_stream(path, product, pd, filtered=method == "filtered")
+    print(json.dumps({
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_bytes": max(0, _peak_rss_bytes() - baseline),
+        "rows": rows,
+        "frames": pd is not None,
+    }))
+
+
+# ----------------------
+# Driver
+# ----------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k", help="comma-separated dataset sizes: 100, 10k, 1m or a number")
+    parser.add_argument("--methods", default=",".join(METHODS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--worker", nargs=3, metavar=("METHOD", "BODY", "PRODUCT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    results = []
+    print(f"{'size':>6}{'method':>10}{'body MB':>10}{'peak MB':>10}{'x body':>8}{'seconds':>9}{'rows':>10}")
+    with tempfile.TemporaryDirectory(prefix="bench-ingest-") as tmp:
+        for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+            data = synthetic.dataset(synthetic.parse_size(size), args.seed)
+            path = os.path.join(tmp, f"{size}.json")
+            with open(path, "w") as f:
+                json.dump({"query": f"predict demand for {data['products'][0]}",
+                           "stock_data": data["stock_data"], "transaction_data": data["transaction_data"]}, f)
+            body_bytes = os.path.getsize(path)
+            product = data["products"][0]
+            del data
+            for method in methods:
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", method, path, product],
+                    capture_output=True, text=True,
+                )
+                if out.returncode != 0:
+                    print(f"{size:>6}{method:>10}  failed: {out.stderr.strip().splitlines()[-1:]}")
+                    results.append({"size": size, "method": method, "error": out.stderr.strip()[-500:]})
+                    continue
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                results.append({"size": size, "method": method, "body_bytes": body_bytes, **r})
+                print(f"{size:>6}{method:>10}{body_bytes / 2**20:>10.1f}{r['peak_bytes'] / 2**20:>10.1f}"
+                      f"{r['peak_bytes'] / body_bytes:>8.2f}{r['seconds']:>9.2f}{r['rows']:>10}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
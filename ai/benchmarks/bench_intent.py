@@ -0,0 +1,106 @@
+"""
+Routing accuracy and latency of the /ai intent classifier.
+
+Compares the local classifier against the substring rules the router used
+before it, on the held-out queries in intent_eval.jsonl. Run from ai/:
+
+    python benchmarks/bench_intent.py [--eval benchmarks/intent_eval.jsonl] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_classifier import CONFIDENCE_THRESHOLD, classify, get_classifier  # noqa: E402
+
+DEFAULT_EVAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_eval.jsonl")
+
+
+def legacy_route(query):
+    """The ordered substring checks /ai used before the classifier."""
+    query_lower = query.lower()
+    if "predict" in query_lower and "demand" in query_lower:
+        return "demand"
+    if "optimize" in query or "order" in query:
+        return "optimize"
+    if "best supplier" in query or "who are the best suppliers" in query or "who are best supplier" in query:
+        return "best_supplier"
+    if "negotiate" in query or "email supplier" in query:
+        return "negotiate"
+    if "supply" in query:
+        return "supply"
+    return "fallback"
+
+
+def evaluate(name, router, rows, repeat):
+    correct = 0
+    llm_calls = 0
+    avoidable_llm_calls = 0
+    confusion = {}
+    timings_us = []
+    for query, expected in rows:
+        got = router(query)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            router(query)
+            timings_us.append((time.perf_counter() - start) * 1e6)
+        correct += got == expected
+        if got == "fallback":
+            llm_calls += 1
+            avoidable_llm_calls += expected != "fallback"
+        if got != expected:
+            confusion[f"{expected}->{got}"] = confusion.get(f"{expected}->{got}", 0) + 1
+
+    timings_us.sort()
+    return {
+        "router": name,
+        "queries": len(rows),
+        "accuracy": round(correct / len(rows), 4),
+        "fallback_llm_calls": llm_calls,
+        "avoidable_llm_calls": avoidable_llm_calls,
+        "latency_us_mean": round(statistics.mean(timings_us), 2),
+        "latency_us_p50": round(timings_us[len(timings_us) // 2], 2),
+        "latency_us_p99": round(timings_us[int(len(timings_us) * 0.99) - 1], 2),
+        "errors": confusion,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--eval", default=DEFAULT_EVAL)
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per query")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with open(args.eval, encoding="utf-8") as f:
+        rows = [(r["query"], r["intent"]) for r in map(json.loads, filter(str.strip, f))]
+
+    start = time.perf_counter()
+    get_classifier()
+    train_ms = (time.perf_counter() - start) * 1000
+
+    results = [
+        evaluate("legacy_substring", legacy_route, rows, args.repeat),
+        evaluate(f"classifier@{CONFIDENCE_THRESHOLD}", lambda q: classify(q).intent, rows, args.repeat),
+    ]
+
+    print(f"classifier training: {train_ms:.1f} ms")
+    print(f"{'router':<22}{'accuracy':>10}{'llm calls':>11}{'avoidable':>11}{'mean us':>10}{'p50 us':>9}{'p99 us':>9}")
+    for r in results:
+        print(f"{r['router']:<22}{r['accuracy']:>10.3f}{r['fallback_llm_calls']:>11}{r['avoidable_llm_calls']:>11}"
+              f"{r['latency_us_mean']:>10.1f}{r['latency_us_p50']:>9.1f}{r['latency_us_p99']:>9.1f}")
+    for r in results:
+        if r["errors"]:
+            print(f"\n{r['router']} misroutes: " + ", ".join(f"{k} x{v}" for k, v in sorted(r["errors"].items())))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"train_ms": round(train_ms, 2), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
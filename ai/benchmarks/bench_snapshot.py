@@ -0,0 +1,139 @@
+"""
+Per-worker memory of a tenant's catalog: Python objects vs a mapped catalog snapshot.
+
+Loads one synthetic tenant (see synthetic.py) into a scratch analytics
+store, which publishes its catalog snapshot, then starts --workers
+processes that each answer --lookups stock and sales lookups either from:
+
+    objects    the stock and transaction rows loaded as Python dicts, as a
+               worker holding the request data does
+    snapshot   catalog_snapshot.get() over the shared mapped file
+
+Each worker reports its private memory (USS: what one more worker adds) and
+the shared pages it maps, from /proc/self/smaps_rollup (Linux). Run from ai/:
+
+    python benchmarks/bench_snapshot.py --size 100k --workers 4 --json benchmarks/results/snapshot.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+TENANT = "bench"
+MODES = ["objects", "snapshot"]
+
+
+def _memory():
+    """(private, shared) bytes of this process."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return private, shared
+
+
+def worker(mode, data_path, lookups):
+    from datetime import datetime, timedelta
+
+    import catalog_snapshot
+
+    baseline_private, baseline_shared = _memory()
+    since = datetime.now() - timedelta(days=90)
+    start = time.perf_counter()
+    if mode == "objects":
+        with open(data_path) as f:
+            data = json.load(f)
+        stock = {}
+        for row in data["stock_data"]:
+            stock.setdefault(row["product_name"].strip().lower(), row)
+        names = list(stock)
+        for i in range(lookups):
+            name = names[i % len(names)]
+            _ = stock[name]["qty"]
+            _ = [item["qty"] for t in data["transaction_data"][-200:] for item in t["items"]
+                 if item["product_name"].strip().lower() == name]
+    else:
+        snapshot = catalog_snapshot.get(TENANT)
+        names = snapshot.products()
+        for i in range(lookups):
+            name = names[i % len(names)]
+            snapshot.current_stock(TENANT, name)
+            snapshot.sales_since(TENANT, name, since)
+    private, shared = _memory()
+    print(json.dumps({
+        "seconds": round(time.perf_counter() - start, 3),
+        "private_bytes": private - baseline_private,
+        "shared_bytes": shared - baseline_shared,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", default="100k", help="dataset size: 100, 10k, 1m or a number")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--worker", nargs=3, metavar=("MODE", "DATA", "LOOKUPS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], args.worker[1], int(args.worker[2]))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-snapshot-") as tmp:
+        os.environ["ANALYTICS_PATH"] = os.path.join(tmp, "analytics.sqlite3")
+        os.environ["SNAPSHOT_DIR"] = os.path.join(tmp, "snapshots")
+        import analytics_store
+
+        data = synthetic.dataset(synthetic.parse_size(args.size), args.seed)
+        data_path = os.path.join(tmp, "data.json")
+        with open(data_path, "w") as f:
+            json.dump({"stock_data": data["stock_data"], "transaction_data": data["transaction_data"]}, f)
+        start = time.perf_counter()
+        analytics_store.get_store().sync(TENANT, "bench", data["stock_data"], data["transaction_data"])
+        snapshot_path = analytics_store.catalog_snapshot.get(TENANT).path
+        print(f"-- {args.size}: synced and published in {time.perf_counter() - start:.1f}s, "
+              f"snapshot {os.path.getsize(snapshot_path) / 2**20:.1f} MB, data {os.path.getsize(data_path) / 2**20:.1f} MB")
+        del data
+
+        print(f"{'mode':>10}{'workers':>9}{'private MB':>12}{'shared MB':>11}{'total private':>15}{'seconds':>9}")
+        for mode in MODES:
+            procs = [
+                subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", mode, data_path,
+                                  str(args.lookups)], stdout=subprocess.PIPE, text=True, env=os.environ)
+                for _ in range(args.workers)
+            ]
+            runs = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+            private = sum(r["private_bytes"] for r in runs)
+            shared = max(r["shared_bytes"] for r in runs)
+            seconds = max(r["seconds"] for r in runs)
+            results.append({"mode": mode, "size": args.size, "workers": args.workers, "runs": runs})
+            print(f"{mode:>10}{args.workers:>9}{private / args.workers / 2**20:>12.1f}{shared / 2**20:>11.1f}"
+                  f"{private / 2**20:>15.1f}{seconds:>9.2f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Import-time profile of the agent modules.
+
+Imports each module in a fresh interpreter under `python -X importtime`
+with the API credentials removed from the environment, so a module that
+still needs the network or a key at import fails here. Reports wall time
+and the slowest imports for each module. Run from ai/:
+
+    python benchmarks/bench_startup.py [module ...] [--top 10] [--budget-ms 1000] [--save DIR] [--json out.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "ai", "demand_predictor", "order_optimizer", "supply_checker",
+    "negotiation_service", "auto_reply_agent", "order_generator",
+]
+CREDENTIAL_VARS = [
+    "GEMINI_API_KEY", "SERPAPI_API_KEY", "MAILTRAP_API_TOKEN", "MAILTRAP_PASSWORD",
+    "GOOGLE_APPLICATION_CREDENTIALS",
+]
+
+# "import time:      self [us] |  cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def parse_importtime(stderr):
+    """[(cumulative_us, self_us, depth, module)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(cumulative_us), int(self_us), (len(indent) - 1) // 2, name.strip()))
+    return rows
+
+
+def profile(module):
+    # Empty rather than unset, so load_dotenv() can't fill them back in from .env
+    env = dict(os.environ, **{var: "" for var in CREDENTIAL_VARS})
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AI_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    rows = parse_importtime(proc.stderr)
+    errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(next((r[0] for r in rows if r[3] == module), 0) / 1000, 1),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(cum / 1000, 1), "self_ms": round(own / 1000, 1)}
+            for cum, own, depth, name in sorted(rows, reverse=True) if name != module
+        ],
+        "error": errors[-1] if proc.returncode and errors else "",
+        "raw": proc.stderr,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to show per module")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="exit non-zero if any import exceeds this")
+    parser.add_argument("--save", help="directory to write each module's raw -X importtime output to")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = [profile(module) for module in args.modules]
+
+    print(f"{'module':<22}{'import ms':>11}{'wall ms':>10}  status")
+    for r in results:
+        status = "ok" if r["ok"] else f"FAILED: {r['error']}"
+        print(f"{r['module']:<22}{r['import_ms']:>11.1f}{r['wall_ms']:>10.1f}  {status}")
+    for r in results:
+        if r["ok"]:
+            print(f"\n{r['module']} slowest imports (cumulative ms):")
+            for row in r["slowest"][:args.top]:
+                print(f"  {row['cumulative_ms']:>9.1f}  {row['module']}")
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for r in results:
+            with open(os.path.join(args.save, f"{r['module']}.importtime.txt"), "w") as f:
+                f.write(r["raw"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([{k: v for k, v in r.items() if k != "raw"} for r in results], f, indent=2)
+
+    over = [r["module"] for r in results if not r["ok"] or r["import_ms"] > args.budget_ms]
+    if over:
+        print(f"\nOver the {args.budget_ms:.0f} ms budget or failed: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
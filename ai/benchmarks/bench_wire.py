@@ -0,0 +1,119 @@
+"""
+Size and codec time of an agent request body: JSON vs msgpack (row-wise and columnar).
+
+Encodes the same synthetic /predict_demand body (see synthetic.py) with:
+
+    json         json.dumps / json.loads, what the services send today
+    msgpack      msgpack.packb / unpackb of the same rows, keys repeated per row
+    columnar     wire_format.pack / unpack: every list of objects as one table
+
+and reports the encoded size and the best of --repeat encode and decode
+times. "ingest" is the receiving agent's side: stream_ingest reading the
+body into demand_predictor's column buffers. Needs msgpack. Run from ai/:
+
+    python benchmarks/bench_wire.py --sizes 10k,100k --json benchmarks/results/wire.json
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+import wire_format  # noqa: E402
+
+CODECS = ["json", "msgpack", "columnar"]
+
+# The columns demand_predictor keeps (STOCK_COLUMNS / ITEM_COLUMNS there), without importing the agent
+STOCK_COLUMNS = {"product_name": "str", "qty": "num", "base_cost_usd": "num", "suggested_price_usd": "num"}
+ITEM_COLUMNS = {"product_name": "str", "qty": "num", "createdAt": "time"}
+
+
+def _codec(name):
+    msgpack = wire_format.msgpack
+    if name == "json":
+        return lambda v: json.dumps(v).encode(), json.loads
+    if name == "msgpack":
+        return msgpack.packb, lambda b: msgpack.unpackb(b, raw=False)
+    return wire_format.pack, wire_format.unpack
+
+
+def _ingest(name, data):
+    import stream_ingest
+
+    if name == "json":
+        return stream_ingest.read(io.BytesIO(data), STOCK_COLUMNS, ITEM_COLUMNS)
+    if name == "columnar":
+        return stream_ingest.read_msgpack(data, STOCK_COLUMNS, ITEM_COLUMNS)
+    return None  # plain msgpack bodies are not a wire format the agents accept
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k", help="comma-separated dataset sizes: 100, 10k, 1m or a number")
+    parser.add_argument("--codecs", default=",".join(CODECS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if not wire_format.available():
+        sys.exit("msgpack is not installed")
+    codecs = [c.strip() for c in args.codecs.split(",") if c.strip()]
+    results = []
+    print(f"{'size':>6}{'codec':>10}{'MB':>9}{'x json':>8}{'encode ms':>11}{'decode ms':>11}{'ingest ms':>11}")
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        data = synthetic.dataset(synthetic.parse_size(size), args.seed)
+        body = {"query": f"predict demand for {data['products'][0]}",
+                "stock_data": data["stock_data"], "transaction_data": data["transaction_data"]}
+        del data
+        json_bytes = None
+        for name in codecs:
+            encode, decode = _codec(name)
+            encoded, encode_s = _best(lambda: encode(body), args.repeat)
+            decoded, decode_s = _best(lambda: decode(encoded), args.repeat)
+            if decoded != body:
+                sys.exit(f"{name} did not round-trip the {size} body")
+            del decoded
+            ingest_s = None
+            if name != "msgpack":
+                _, ingest_s = _best(lambda: _ingest(name, encoded), args.repeat)
+            if name == "json":
+                json_bytes = len(encoded)
+            ratio = len(encoded) / json_bytes if json_bytes else float("nan")
+            results.append({
+                "size": size, "codec": name, "bytes": len(encoded),
+                "encode_ms": round(encode_s * 1000, 2), "decode_ms": round(decode_s * 1000, 2),
+                "ingest_ms": round(ingest_s * 1000, 2) if ingest_s is not None else None,
+            })
+            ingest = f"{ingest_s * 1000:>11.1f}" if ingest_s is not None else f"{'-':>11}"
+            print(f"{size:>6}{name:>10}{len(encoded) / 2**20:>9.2f}{ratio:>8.2f}"
+                  f"{encode_s * 1000:>11.1f}{decode_s * 1000:>11.1f}{ingest}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "msgpack": ".".join(map(str, wire_format.msgpack.version)),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Load generator for the /ai router.
+
+Sends a mix of dashboard queries (demand, optimize, best_supplier,
+negotiate, fallback) to /ai, either synthetic (--mix) or replayed from a
+JSONL file of {"query", "route"?, "ts"?} records (--replay; intent_eval.jsonl
+works too). Two modes:
+
+  open    requests arrive at --rate per second (Poisson) whether or not
+          earlier ones finished; latency counts from the scheduled send
+          time, so queueing in the client is not hidden.
+  closed  --concurrency users each send a request, wait for the answer and
+          think for --think-ms before the next.
+
+--sweep runs one step per rate (open) or concurrency (closed) and reports
+per route the throughput, latency percentiles, error rate and the step at
+which the route saturated. Start the services with stubbed externals
+first, then run from ai/:
+
+    python benchmarks/stubs.py serve all --workers 2 --threads 8
+    python benchmarks/load_replay.py --mode open --sweep 2,5,10,20 --duration 30 --json load.json
+    python benchmarks/load_replay.py --mode closed --sweep 1,4,16 --replay recorded.jsonl
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services  # noqa: E402
+import synthetic  # noqa: E402
+
+QUERY_TEMPLATES = {
+    "demand": ["predict demand for {p}", "forecast for {p} next month", "how much {p} will we sell"],
+    "optimize": ["optimize order for {p}", "how much {p} should we restock", "reorder qty for {p}"],
+    "best_supplier": ["best supplier for {p}", "who sells {p} in bulk", "find me vendors for {p}"],
+    "negotiate": ["negotiate price for {p}", "email the supplier for a discount on {p}"],
+    "fallback": ["what are your opening hours", "summarize how the shop is doing", "hello there"],
+}
+DEFAULT_MIX = "demand=35,optimize=25,best_supplier=15,negotiate=5,fallback=20"
+PERCENTILES = (50, 90, 95, 99)
+
+
+# ----------------------
+# Workloads
+# ----------------------
+def parse_mix(text):
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        route, _, weight = part.partition("=")
+        if route not in QUERY_TEMPLATES:
+            raise ValueError(f"unknown route {route!r} (known: {', '.join(QUERY_TEMPLATES)})")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """Thread-safe source of (route, query, offset_s) requests."""
+
+    def __init__(self, items, cycle=True):
+        self._items = itertools.cycle(items) if cycle else iter(items)
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            return next(self._items, None)
+
+
+def synthetic_workload(mix, products, seed):
+    rng = random.Random(seed)
+    routes, weights = list(mix), list(mix.values())
+
+    def items():
+        while True:
+            route = rng.choices(routes, weights)[0]
+            yield route, rng.choice(QUERY_TEMPLATES[route]).format(p=rng.choice(products).lower()), None
+    return Workload(items(), cycle=False)
+
+
+def recorded_workload(path, keep_timing):
+    """Queries from a JSONL file; with keep_timing, "ts" values become send offsets."""
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise ValueError(f"{path} has no records")
+    t0 = min((r["ts"] for r in records if "ts" in r), default=None)
+    items = [
+        (r.get("route") or r.get("intent") or "recorded", r["query"],
+         r["ts"] - t0 if keep_timing and t0 is not None and "ts" in r else None)
+        for r in records
+    ]
+    if keep_timing:
+        items.sort(key=lambda item: item[2] or 0)
+    return Workload(items, cycle=not keep_timing)
+
+
+# ----------------------
+# Recording results
+# ----------------------
+class Recorder:
+    """
+    Outcomes per route. Rates are per second of the sending window; answers
+    that arrive after it (the backlog drained at the end of a step) count
+    for latency but not for throughput, so an overloaded step shows up as
+    throughput below the offered rate.
+    """
+
+    def __init__(self, window_s):
+        self._lock = threading.Lock()
+        self.routes = {}  # route -> {"latencies": [...], "errors": {kind: n}, "sent", "dropped", "in_window"}
+        self.window_s = window_s
+        self.window_end = time.perf_counter() + window_s
+
+    def _route(self, route):
+        return self.routes.setdefault(route, {"latencies": [], "errors": {}, "sent": 0, "dropped": 0, "in_window": 0})
+
+    def sent(self, route):
+        with self._lock:
+            self._route(route)["sent"] += 1
+
+    def dropped(self, route):
+        with self._lock:
+            self._route(route)["dropped"] += 1
+
+    def done(self, route, latency_s, error=None):
+        with self._lock:
+            row = self._route(route)
+            if error:
+                row["errors"][error] = row["errors"].get(error, 0) + 1
+            else:
+                row["latencies"].append(latency_s)
+                row["in_window"] += time.perf_counter() <= self.window_end
+
+    def summary(self):
+        with self._lock:
+            rows = {route: dict(row, latencies=list(row["latencies"]), errors=dict(row["errors"]))
+                    for route, row in self.routes.items()}
+        merged = {"latencies": [], "errors": {}, "sent": 0, "dropped": 0, "in_window": 0}
+        for row in rows.values():
+            merged["latencies"] += row["latencies"]
+            for key in ("sent", "dropped", "in_window"):
+                merged[key] += row[key]
+            for kind, n in row["errors"].items():
+                merged["errors"][kind] = merged["errors"].get(kind, 0) + n
+        result = {route: _summarize(row, self.window_s) for route, row in sorted(rows.items())}
+        result["all"] = _summarize(merged, self.window_s)
+        return result
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def _summarize(row, window_s):
+    latencies = sorted(row["latencies"])
+    errors = sum(row["errors"].values())
+    attempted = len(latencies) + errors + row["dropped"]
+    summary = {
+        "sent": row["sent"],
+        "ok": len(latencies),
+        "errors": row["errors"],
+        "dropped": row["dropped"],
+        "error_rate": round((errors + row["dropped"]) / attempted, 4) if attempted else 0.0,
+        "offered_rps": round(row["sent"] / window_s, 3),
+        "throughput_rps": round(row["in_window"] / window_s, 3),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+    for pct in PERCENTILES:
+        value = _percentile(latencies, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+    return summary
+
+
+# ----------------------
+# Sending
+# ----------------------
+class Client:
+    """Posts queries to /ai with the dataset attached, one keep-alive session per thread."""
+
+    def __init__(self, url, data, timeout_s):
+        self.url = url
+        self.timeout_s = timeout_s
+        # The dataset is the same for every request, so encode it once and splice the query in
+        self._body_prefix = json.dumps({
+            "stock_data": data["stock_data"], "transaction_data": data["transaction_data"],
+        })[:-1]
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, query):
+        """None on success, otherwise a short error kind."""
+        body = f'{self._body_prefix}, "query": {json.dumps(query)}}}'
+        try:
+            response = self._session().post(self.url, data=body.encode(), timeout=self.timeout_s,
+                                            headers={"Content-Type": "application/json"})
+        except requests.Timeout:
+            return "timeout"
+        except requests.RequestException as e:
+            return type(e).__name__
+        if response.status_code >= 400:
+            return f"http_{response.status_code}"
+        try:
+            if "error" in response.json():
+                return "agent_error"
+        except ValueError:
+            return "bad_json"
+        return None
+
+
+def _request(client, recorder, route, query, scheduled, inflight=None):
+    try:
+        error = client.send(query)
+        recorder.done(route, time.perf_counter() - scheduled, error)
+    finally:
+        if inflight is not None:
+            inflight.release()
+
+
+def run_open(client, workload, rate, duration_s, max_inflight, seed):
+    """Send at `rate` requests/s (Poisson arrivals, or recorded offsets) for duration_s."""
+    recorder = Recorder(duration_s)
+    rng = random.Random(seed)
+    inflight = threading.BoundedSemaphore(max_inflight)
+    pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="load")
+    start = time.perf_counter()
+    next_at = start
+    while True:
+        item = workload.next()
+        if item is None:
+            break
+        route, query, offset = item
+        if offset is not None:
+            next_at = start + offset
+        if next_at - start >= duration_s:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        recorder.sent(route)
+        if inflight.acquire(blocking=False):
+            pool.submit(_request, client, recorder, route, query, next_at, inflight)
+        else:
+            recorder.dropped(route)  # the client itself is saturated
+        if offset is None:
+            next_at += rng.expovariate(rate)
+    pool.shutdown(wait=True)
+    return recorder.summary()
+
+
+def run_closed(client, workload, concurrency, duration_s, think_ms, seed):
+    """concurrency users, each sending, waiting for the answer and thinking, for duration_s."""
+    recorder = Recorder(duration_s)
+    stop_at = recorder.window_end
+
+    def user(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < stop_at:
+            item = workload.next()
+            if item is None:
+                return
+            route, query, _ = item
+            recorder.sent(route)
+            _request(client, recorder, route, query, time.perf_counter())
+            if think_ms:
+                time.sleep(rng.expovariate(1000 / think_ms))
+
+    users = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    return recorder.summary()
+
+
+# ----------------------
+# Saturation
+# ----------------------
+def saturation_points(steps, mode, max_error_rate, slo_ms):
+    """
+    Per route, the first step where it stopped keeping up: errors above
+    max_error_rate, p95 above slo_ms, throughput under 90% of the offered
+    rate (open) or under 10% more than the previous step (closed).
+    """
+    points = {}
+    routes = sorted({route for step in steps for route in step["routes"]})
+    for route in routes:
+        previous = None
+        for step in steps:
+            s = step["routes"].get(route)
+            if s is None:
+                continue
+            reasons = []
+            if s["error_rate"] > max_error_rate:
+                reasons.append(f"error rate {s['error_rate']:.1%}")
+            if slo_ms and s["p95_ms"] is not None and s["p95_ms"] > slo_ms:
+                reasons.append(f"p95 {s['p95_ms']:.0f} ms")
+            if mode == "open" and s["throughput_rps"] < 0.9 * s["offered_rps"]:
+                reasons.append("throughput below offered rate")
+            if mode == "closed" and previous and s["throughput_rps"] < 1.1 * previous["throughput_rps"]:
+                reasons.append("throughput stopped growing")
+            if reasons:
+                points[route] = {"level": step["level"], "reasons": reasons}
+                break
+            previous = s
+    return points
+
+
+def wait_ready(url, timeout_s):
+    """Poll the router's /readyz so the first step doesn't measure model loading."""
+    ready_url = url.rsplit("/", 1)[0] + "/readyz"
+    give_up = time.time() + timeout_s
+    while time.time() < give_up:
+        try:
+            if requests.get(ready_url, timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def print_step(step):
+    print(f"\n== {step['mode']} level {step['level']} ({step['elapsed_s']:.1f}s)")
+    print(f"{'route':<15}{'sent':>7}{'ok':>7}{'err%':>7}{'drop':>6}{'rps':>8}"
+          + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f"{'max':>9}")
+    for route, s in step["routes"].items():
+        cells = "".join(f"{s[f'p{p}_ms'] if s[f'p{p}_ms'] is not None else '-':>9}" for p in PERCENTILES)
+        print(f"{route:<15}{s['sent']:>7}{s['ok']:>7}{s['error_rate'] * 100:>7.1f}{s['dropped']:>6}"
+              f"{s['throughput_rps']:>8.2f}{cells}{s['max_ms'] if s['max_ms'] is not None else '-':>9}")
+        if s["errors"]:
+            print(f"{'':<15}errors: " + ", ".join(f"{k} x{v}" for k, v in sorted(s["errors"].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=services.url("ai", "/ai"))
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--rate", type=float, default=5, help="open mode: requests per second")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed mode: concurrent users")
+    parser.add_argument("--sweep", help="comma-separated rates (open) or concurrencies (closed), one step each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per step")
+    parser.add_argument("--think-ms", type=float, default=0, help="closed mode: mean pause between requests")
+    parser.add_argument("--max-inflight", type=int, default=256, help="open mode: client-side request limit")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight,... for synthetic queries")
+    parser.add_argument("--replay", help="JSONL of recorded queries instead of the synthetic mix")
+    parser.add_argument("--keep-timing", action="store_true",
+                        help="open mode with --replay: send at the recorded \"ts\" offsets instead of --rate")
+    parser.add_argument("--rows", default="100", help="synthetic stock and transaction rows sent with every query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--slo-ms", type=float, help="p95 latency above this counts as saturated")
+    parser.add_argument("--no-wait", action="store_true", help="don't wait for /readyz before starting")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    data = synthetic.dataset(synthetic.parse_size(args.rows), args.seed)
+    client = Client(args.url, data, args.timeout)
+    if not args.no_wait and not wait_ready(args.url, 120):
+        parser.exit(1, f"{args.url} is not ready; start the services first (benchmarks/stubs.py serve all)\n")
+
+    default_level = args.rate if args.mode == "open" else args.concurrency
+    levels = [float(v) for v in args.sweep.split(",")] if args.sweep else [default_level]
+    steps = []
+    for level in levels:
+        if args.replay:
+            workload = recorded_workload(args.replay, args.keep_timing and args.mode == "open")
+        else:
+            workload = synthetic_workload(parse_mix(args.mix), data["products"], args.seed)
+        start = time.perf_counter()
+        if args.mode == "open":
+            routes = run_open(client, workload, level, args.duration, args.max_inflight, args.seed)
+        else:
+            level = int(level)
+            routes = run_closed(client, workload, level, args.duration, args.think_ms, args.seed)
+        step = {"mode": args.mode, "level": level, "elapsed_s": round(time.perf_counter() - start, 2),
+                "routes": routes}
+        steps.append(step)
+        print_step(step)
+
+    points = saturation_points(steps, args.mode, args.max_error_rate, args.slo_ms)
+    print("\nsaturation (first level that didn't keep up):")
+    for route in sorted({r for step in steps for r in step["routes"]}):
+        point = points.get(route)
+        print(f"  {route:<15}" + (f"{point['level']}  ({'; '.join(point['reasons'])})" if point else "not reached"))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"url": args.url, "mode": args.mode, "rows": args.rows,
+                       "replay": args.replay, "mix": None if args.replay else args.mix,
+                       "steps": steps, "saturation": points}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
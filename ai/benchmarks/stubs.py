@@ -0,0 +1,308 @@
+"""
+Local stand-ins for the external services the agents call: Gemini,
+SerpAPI, Google Trends (pytrends), Mailtrap (SMTP and inbox API) and
+Firestore. install() patches them in-process, so benchmarks and load tests
+measure the agents' own work plus a fixed, configurable latency per call
+instead of the network and the providers' quotas.
+
+Latencies default to LATENCY_MS and can be overridden per stub with
+STUB_<NAME>_MS (e.g. STUB_GEMINI_MS=800) or scaled all at once with
+install(latency_scale=0). Run a stubbed service from ai/ with
+
+    python benchmarks/stubs.py serve ai demand_predictor    # like serve.py, stubs installed
+    python benchmarks/stubs.py serve combined --dev --workers 2
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import types
+
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_DIR)
+
+LATENCY_MS = {
+    "gemini": 400,
+    "serpapi": 800,
+    "scrape": 150,
+    "pytrends": 500,
+    "smtp": 300,
+    "mailtrap": 200,
+    "firestore": 50,
+}
+BATCH_MARKER = "Return ONLY a JSON object whose keys are the item numbers"
+
+_latency_scale = 1.0
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def _wait(name):
+    with _calls_lock:
+        _calls[name] = _calls.get(name, 0) + 1
+    ms = float(os.getenv(f"STUB_{name.upper()}_MS", LATENCY_MS[name])) * _latency_scale
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+def call_counts():
+    """Calls each stub has answered since install()."""
+    with _calls_lock:
+        return dict(_calls)
+
+
+# ----------------------
+# Gemini
+# ----------------------
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _Response:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeGeminiModel:
+    """Answers any prompt with short canned text; batch prompts get one answer per item."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def answer(self, prompt):
+        if BATCH_MARKER in prompt:
+            items = re.findall(r"^### Item (\d+)", prompt, flags=re.MULTILINE)
+            return json.dumps({n: f"Stub insight for item {n}: keep stock near forecast." for n in items})
+        if "<p>" in prompt or "HTML" in prompt:
+            return "<p>Thanks for your message. Your order is being prepared.</p>"
+        return "Stub insight: demand is steady, reorder in line with the forecast."
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        _wait("gemini")
+        text = self.answer(prompt)
+        usage = _Usage(len(prompt) // 4, len(text) // 4)
+        if not stream:
+            return _Response(text, usage)
+        words = text.split(" ")
+        pieces = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+        return iter([_Response(p) for p in pieces[:-1]] + [_Response(pieces[-1].rstrip(), usage)])
+
+
+def _install_gemini():
+    import llm_gateway
+    llm_gateway.set_model_factory(FakeGeminiModel)
+
+
+# ----------------------
+# SerpAPI and supplier websites
+# ----------------------
+class FakeGoogleSearch:
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        _wait("serpapi")
+        query = self.params.get("q", "")
+        return {"organic_results": [
+            {"title": f"{query} supplier {i}", "link": f"https://supplier{i}.example.com/",
+             "snippet": f"Wholesale {query} from supplier {i}"}
+            for i in range(1, 6)
+        ]}
+
+
+def _install_serpapi():
+    module = types.ModuleType("serpapi")
+    module.GoogleSearch = FakeGoogleSearch
+    sys.modules["serpapi"] = module
+
+
+def _install_requests():
+    import requests
+
+    real_get = requests.get
+
+    def fake_get(url, *args, **kwargs):
+        if "mailtrap.io" in url:
+            _wait("mailtrap")
+            return _http_response(url, json.dumps([{
+                "subject": "Re: Price request",
+                "text": "Thanks for reaching out. Our price is 4.20 per unit with a 5% discount over 500 units.",
+            }]), "application/json")
+        if ".example.com" in url:
+            _wait("scrape")
+            host = url.split("//", 1)[-1].split("/", 1)[0]
+            return _http_response(url, (
+                f"<html><body><a href='/contact'>Contact</a>"
+                f"<p>Email: sales@{host} Phone: +94 11 234 5678</p></body></html>"
+            ), "text/html")
+        return real_get(url, *args, **kwargs)
+
+    requests.get = fake_get
+
+
+def _http_response(url, body, content_type):
+    import requests
+
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers["Content-Type"] = content_type
+    response.encoding = "utf-8"
+    response._content = body.encode()
+    return response
+
+
+# ----------------------
+# Google Trends
+# ----------------------
+class FakeTrendReq:
+    def __init__(self, *args, **kwargs):
+        self.keywords = []
+
+    def build_payload(self, keywords, **kwargs):
+        self.keywords = list(keywords)
+
+    def interest_over_time(self):
+        import pandas as pd
+
+        _wait("pytrends")
+        index = pd.date_range(end=time.strftime("%Y-%m-%d"), periods=13, freq="W")
+        return pd.DataFrame({kw: [40 + (i * 3) % 25 for i in range(len(index))] for kw in self.keywords}, index=index)
+
+
+def _install_pytrends():
+    package = types.ModuleType("pytrends")
+    request_module = types.ModuleType("pytrends.request")
+    request_module.TrendReq = FakeTrendReq
+    package.request = request_module
+    sys.modules["pytrends"] = package
+    sys.modules["pytrends.request"] = request_module
+
+
+# ----------------------
+# Mailtrap SMTP
+# ----------------------
+class FakeSMTP:
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        self.sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, *args, **kwargs):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        _wait("smtp")
+        self.sent.append((from_addr, to_addrs, len(msg)))
+        return {}
+
+    def send_message(self, msg, from_addr=None, to_addrs=None, **kwargs):
+        return self.sendmail(from_addr, to_addrs, msg.as_string())
+
+    def quit(self):
+        pass
+
+
+def _install_smtp():
+    import smtplib
+    smtplib.SMTP = FakeSMTP
+
+
+# ----------------------
+# Firestore
+# ----------------------
+class _Doc:
+    def __init__(self, data):
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeFirestore:
+    """Just enough of the client for collection().document().collection().stream()."""
+
+    def __init__(self, products=()):
+        self.products = list(products)
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return self
+
+    def stream(self):
+        _wait("firestore")
+        return iter([_Doc({"name": name}) for name in self.products])
+
+
+def set_firestore_products(products):
+    """Serve products (a list of names) from the fake Firestore used by order_generator."""
+    import order_generator
+    order_generator._db = FakeFirestore(products)
+
+
+# ----------------------
+# Install
+# ----------------------
+def install(latency_scale=1.0, firestore_products=None):
+    """
+    Patch every external dependency with its stub. Call before the first
+    request; safe to call again to change the latency scale.
+    """
+    global _latency_scale
+    _latency_scale = latency_scale
+    os.environ.setdefault("LLM_CACHE_PATH", "")  # no disk tier, so runs don't warm each other
+    os.environ.setdefault("TRACE_FILE", "")
+    os.environ.setdefault("GEMINI_API_KEY", "stub")
+    os.environ.setdefault("SERPAPI_API_KEY", "stub")
+    with _calls_lock:
+        _calls.clear()
+    _install_gemini()
+    _install_serpapi()
+    _install_pytrends()
+    _install_requests()
+    _install_smtp()
+    if firestore_products is not None:
+        set_firestore_products(firestore_products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agents with their external services stubbed.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="run services like serve.py, with stubs installed")
+    serve_parser.add_argument("services", nargs="+")
+    serve_parser.add_argument("--latency-scale", type=float, default=1.0,
+                              help="multiply every stub latency (0 = answer instantly)")
+    serve_parser.add_argument("--products", type=int, default=200,
+                              help="product names the fake Firestore returns")
+    args, passthrough = parser.parse_known_args()
+
+    import serve
+    from synthetic import product_names
+
+    install(args.latency_scale)
+    if args.services in (["order_generator"], ["combined"]):
+        set_firestore_products(product_names(args.products))
+    # Multi-service runs spawn this script again per service so every child is stubbed too
+    sys.argv = [os.path.abspath(serve.__file__), *args.services, *passthrough]
+    serve.SELF_SCRIPT = [os.path.abspath(__file__), "serve", "--latency-scale", str(args.latency_scale),
+                         "--products", str(args.products)]
+    serve.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Synthetic catalogs, transaction histories, customer emails and order PDFs
+for the agent benchmarks.
+
+Rows follow the Firestore documents the backend sends (products and
+transactions with nested items) plus the fields supply_checker and
+order_optimizer read (name, supplierName, purchase_price, flat
+transaction rows). Supplier names come from src/data/supplierDummy.json.
+Everything is seeded, so the same size and seed give the same data. Run
+from ai/ to write a dataset to disk:
+
+    python benchmarks/synthetic.py --rows 10k --out benchmarks/data/10k.json
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SUPPLIER_FILE = os.path.join(REPO_DIR, "src", "data", "supplierDummy.json")
+
+SIZES = {"100": 100, "10k": 10_000, "1m": 1_000_000}
+
+ADJECTIVES = ["Organic", "Classic", "Premium", "Fresh", "Golden", "Crystal", "Air Drift", "Eco", "Pure", "Royal"]
+NOUNS = ["Rice", "Sugar", "Flour", "Tee", "Hoodie", "Tea", "Coffee", "Lentils", "Oats", "Honey", "Cap", "Soap"]
+CUSTOMERS = ["Kavindya", "Nimal", "Ayesha", "Ruwan", "Dilini", "Tharindu", "Sahan", "Ishara"]
+
+
+def parse_size(value):
+    value = str(value).lower()
+    return SIZES.get(value) or int(value.replace("k", "000").replace("m", "000000"))
+
+
+def load_suppliers():
+    try:
+        with open(SUPPLIER_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        return ["Green Farms", "Agri Co", "Harvest Mills", "Pure Mills"]
+
+
+def _letters(n):
+    """0 -> "A", 25 -> "Z", 26 -> "AA", ..."""
+    code = ""
+    n += 1
+    while n:
+        n, rem = divmod(n - 1, 26)
+        code = chr(ord("A") + rem) + code
+    return code
+
+
+def product_names(count):
+    """
+    count distinct product names, e.g. "Golden Rice", then "Golden Rice Line B".
+    Names carry no digits, so quantity parsers can't mistake them for amounts.
+    """
+    names = []
+    base = [f"{a} {n}" for a in ADJECTIVES for n in NOUNS]
+    for i in range(count):
+        name = base[i % len(base)]
+        names.append(name if i < len(base) else f"{name} Line {_letters(i // len(base))}")
+    return names
+
+
+def product_count(rows):
+    """Distinct products for a dataset of rows: about one per 20 rows, at least 10."""
+    return max(10, rows // 20)
+
+
+def catalog(rows, seed=0):
+    """
+    rows stock lots (one product from one supplier each). Carries both the
+    dashboard fields (product_name, stock_amount, prices) and the
+    supply_checker fields (name, supplierName, qty, purchase_price).
+    """
+    rng = random.Random(seed)
+    suppliers = load_suppliers()
+    names = product_names(product_count(rows))
+    start = datetime(2024, 1, 1)
+    lots = []
+    for i in range(rows):
+        name = names[i % len(names)]
+        cost = round(rng.uniform(0.5, 40), 2)
+        qty = rng.randint(0, 500)
+        lots.append({
+            "product_id": f"P{i:07d}",
+            "product_name": name,
+            "name": name,
+            "qty": qty,
+            "stock_amount": qty,
+            "supplierName": rng.choice(suppliers),
+            "purchase_price": cost,
+            "base_cost_usd": cost,
+            "suggested_price_usd": round(cost * rng.uniform(1.2, 2.0), 2),
+            "createdAt": (start + timedelta(minutes=i)).isoformat() + "Z",
+        })
+    return lots
+
+
+def transactions(rows, seed=0, products=None, days=120, items_per_tx=3):
+    """
+    Transactions with about rows line items in total, spread over the last
+    `days` days so demand_predictor's 90-day window sees most of them.
+    """
+    rng = random.Random(seed + 1)
+    names = products or product_names(product_count(rows))
+    now = datetime.now()
+    result = []
+    remaining = rows
+    t = 0
+    while remaining > 0:
+        n_items = min(remaining, rng.randint(1, items_per_tx * 2 - 1))
+        items = []
+        for _ in range(n_items):
+            qty = rng.randint(1, 20)
+            price = round(rng.uniform(1, 60), 2)
+            discount = rng.choice([0, 0, 0, 5, 10])
+            subtotal = round(qty * price, 2)
+            items.append({
+                "product_name": rng.choice(names),
+                "qty": qty,
+                "selling_price": price,
+                "discount": discount,
+                "subtotal": subtotal,
+                "discounted_subtotal": round(subtotal * (1 - discount / 100), 2),
+            })
+        result.append({
+            "tid": f"TID{t:08d}",
+            "cus_name": rng.choice(CUSTOMERS),
+            "items": items,
+            "total_amount": round(sum(i["discounted_subtotal"] for i in items), 2),
+            "createdAt": (now - timedelta(seconds=rng.randint(0, days * 86400))).isoformat(),
+        })
+        remaining -= n_items
+        t += 1
+    return result
+
+
+def flat_transactions(txs):
+    """One row per line item with the transaction's createdAt (order_optimizer's shape)."""
+    return [{**item, "createdAt": tx["createdAt"]} for tx in txs for item in tx["items"]]
+
+
+def dataset(rows, seed=0):
+    """{"stock_data", "transaction_data", "products"} with rows stock lots and rows line items."""
+    stock = catalog(rows, seed)
+    products = sorted({lot["product_name"] for lot in stock})
+    return {"stock_data": stock, "transaction_data": transactions(rows, seed, products), "products": products}
+
+
+def customer_emails(products, count=20, seed=0):
+    """Order emails with the items they ask for, for auto_reply and parse_order_from_message."""
+    rng = random.Random(seed + 2)
+    templates = [
+        "Hi, I'd like to order {items}. Do you have them in stock?",
+        "Hello team,\nplease send {items} to our shop by Friday.\nThanks",
+        "Can I get {items}? Let me know the total.",
+    ]
+    emails = []
+    for i in range(count):
+        chosen = rng.sample(products, k=min(len(products), rng.randint(1, 3)))
+        wanted = [(name, rng.randint(1, 30)) for name in chosen]
+        text = ", ".join(f"{qty} {name}" for name, qty in wanted)
+        emails.append({
+            "email": {
+                "from": f"{rng.choice(CUSTOMERS)} <customer{i}@example.com>",
+                "subject": "New order",
+                "body": rng.choice(templates).format(items=text),
+            },
+            "expected": [{"product_name": name, "qty": qty} for name, qty in wanted],
+        })
+    return emails
+
+
+def order_pdf(products, lines=40, seed=0, lines_per_page=40):
+    """
+    A text PDF order form ("Supplier: ..." then "Product - qty" lines) as
+    bytes, built by hand so the benchmark needs no PDF writer library.
+    """
+    rng = random.Random(seed + 3)
+    text_lines = [f"Supplier: {rng.choice(load_suppliers())}"]
+    text_lines += [f"{rng.choice(products)} - {rng.randint(1, 50)}" for _ in range(lines)]
+    pages = [text_lines[i:i + lines_per_page] for i in range(0, len(text_lines), lines_per_page)]
+
+    def escape(s):
+        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in pages:
+        stream = "BT /F1 11 Tf 14 TL 50 800 Td " + " ".join(f"({escape(line)}) '" for line in page) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", default="10k", help="100, 10k, 1m or a number")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="JSON file for the dataset (or .pdf for an order form)")
+    args = parser.parse_args()
+
+    rows = parse_size(args.rows)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    if args.out.endswith(".pdf"):
+        with open(args.out, "wb") as f:
+            f.write(order_pdf(product_names(product_count(rows)), lines=rows, seed=args.seed))
+        return
+    with open(args.out, "w") as f:
+        json.dump(dataset(rows, args.seed), f)
+
+
+if __name__ == "__main__":
+    main()
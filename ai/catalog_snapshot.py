@@ -0,0 +1,323 @@
+"""
+Read-only catalog snapshots shared by every process through mmap.
+
+For each tenant and dataset version, the process that syncs the analytics
+store writes one file holding, per product:
+- the current stock row (qty and prices);
+- all-time sales totals;
+- daily sales for the last SNAPSHOT_DAYS days.
+
+Columns are fixed-width arrays behind a small JSON header. Product names
+are stored as sorted UTF-8 blobs that serve as the normalized-name index.
+Every agent process and worker maps the file read-only, so the operating
+system keeps a single copy in the page cache however many workers run.
+Lookups slice the mapping with memoryview.cast(); nothing is copied into
+Python objects:
+
+    snapshot = catalog_snapshot.get(tenant, version)
+    row = snapshot.index("organic rice")     # binary search, None if absent
+    snapshot.current_stock(tenant, "organic rice")
+
+A file is written to a temporary name and renamed into place, and then the
+tenant's CURRENT pointer is swapped the same way, so readers see either
+the old version or the new one. Only the newest SNAPSHOT_KEEP versions are
+kept. On POSIX, a reader that still has an older file mapped keeps it
+until it closes the mapping. SNAPSHOT_DIR="" turns snapshots off.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+import metrics
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_DAYS = int(os.getenv("SNAPSHOT_DAYS", 120))  # daily buckets: a 90-day window plus a month of drift
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 2))
+
+MAGIC = b"NXSNAP1\n"
+_HEADER_LEN = struct.Struct("<I")
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("catalog_snapshot_bytes", "gauge", "Bytes of catalog snapshots mapped by this process.")
+
+
+def _tenant_dir(tenant):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(tenant.encode()).hexdigest()[:16])
+
+
+def _pad(n):
+    return (-n) % 8
+
+
+def _blob(strings):
+    """(offsets array, utf-8 blob) for a list of strings."""
+    offsets, parts, end = array("q", [0]), [], 0
+    for s in strings:
+        encoded = s.encode()
+        parts.append(encoded)
+        end += len(encoded)
+        offsets.append(end)
+    return offsets, b"".join(parts)
+
+
+# ----------------------
+# Writing
+# ----------------------
+def build(tenant, version, catalog_rows, daily_rows, today=None):
+    """
+    Snapshot file contents from AnalyticsStore.catalog() and .daily_sales()
+    rows. Products are sorted by normalized name, which is the index.
+    """
+    today = today or date.today()
+    day0 = today - timedelta(days=SNAPSHOT_DAYS - 1)
+    rows = sorted(catalog_rows, key=lambda r: r["product"])
+    row_of = {r["product"]: i for i, r in enumerate(rows)}
+    n, days = len(rows), SNAPSHOT_DAYS
+
+    def floats(key):
+        return array("d", (math.nan if r.get(key) is None else float(r[key]) for r in rows))
+
+    daily_qty = array("d", bytes(8 * n * days))
+    daily_items = array("i", bytes(4 * n * days))
+    for product, day, qty, items in daily_rows:
+        i = row_of.get(product)
+        offset = (date.fromisoformat(day) - day0).days
+        if i is not None and 0 <= offset < days:
+            daily_qty[i * days + offset] += qty
+            daily_items[i * days + offset] += items
+
+    name_offsets, name_blob = _blob(r["product"] for r in rows)
+    display_offsets, display_blob = _blob(r.get("product_name") or r["product"] for r in rows)
+    columns = {
+        "name_offsets": name_offsets,
+        "name_blob": name_blob,
+        "display_offsets": display_offsets,
+        "display_blob": display_blob,
+        "position": array("q", (-1 if r.get("position") is None else r["position"] for r in rows)),
+        "qty": floats("qty"),
+        "base_cost": floats("base_cost"),
+        "suggested_price": floats("suggested_price"),
+        "total_qty": floats("total_qty"),
+        "total_items": array("q", (int(r.get("total_items") or 0) for r in rows)),
+        "daily_qty": daily_qty,
+        "daily_items": daily_items,
+    }
+
+    layout, chunks, offset = {}, [], 0
+    for name, data in columns.items():
+        raw = data if isinstance(data, bytes) else data.tobytes()
+        typecode = "B" if isinstance(data, bytes) else data.typecode
+        layout[name] = [offset, typecode, len(raw)]
+        chunks += [raw, bytes(_pad(len(raw)))]
+        offset += len(raw) + _pad(len(raw))
+
+    header = json.dumps({
+        "tenant": tenant, "version": version, "created_at": time.time(),
+        "rows": n, "days": days, "day0": day0.isoformat(), "columns": layout,
+    }).encode()
+    header += b" " * _pad(len(MAGIC) + _HEADER_LEN.size + len(header))
+    return b"".join([MAGIC, _HEADER_LEN.pack(len(header)), header, *chunks])
+
+
+def _replace(path, data):
+    """Write data next to path and rename it into place."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def publish(store, tenant, version):
+    """Write the tenant's snapshot for version from the analytics store and make it current."""
+    if not SNAPSHOT_DIR:
+        return None
+    directory = _tenant_dir(tenant)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{version}.snap")
+    with metrics.timed("catalog_snapshot_publish"):
+        since = date.today() - timedelta(days=SNAPSHOT_DAYS - 1)
+        _replace(path, build(tenant, version, store.catalog(tenant), store.daily_sales(tenant, since)))
+        _replace(os.path.join(directory, "CURRENT"), version.encode())
+    cleanup(directory, keep={version})
+    return path
+
+
+def cleanup(directory, keep=()):
+    """Remove all but the newest SNAPSHOT_KEEP snapshots, and temporary files left by crashed writers."""
+    try:
+        entries = [os.path.join(directory, e) for e in os.listdir(directory)]
+    except OSError:
+        return
+    snapshots = sorted((p for p in entries if p.endswith(".snap")), key=os.path.getmtime, reverse=True)
+    stale = [p for p in snapshots[SNAPSHOT_KEEP:] if os.path.basename(p)[:-5] not in keep]
+    stale += [p for p in entries if p.endswith(".tmp") and time.time() - os.path.getmtime(p) > 3600]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ----------------------
+# Reading
+# ----------------------
+class Snapshot:
+    """One mapped snapshot file. Methods mirror AnalyticsStore's query helpers (tenant is ignored)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        (header_len,) = _HEADER_LEN.unpack_from(view, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LEN.size
+        header = json.loads(bytes(view[start:start + header_len]))
+        base = start + header_len
+        self.path = path
+        self.version = header["version"]
+        self.rows = header["rows"]
+        self.days = header["days"]
+        self.day0 = date.fromisoformat(header["day0"])
+        self.nbytes = len(self._map)
+        self._columns = {
+            name: view[base + offset:base + offset + length].cast(typecode)
+            for name, (offset, typecode, length) in header["columns"].items()
+        }
+        self._months = []  # (first day, end day, "YYYY-MM") of each calendar month in the buckets
+        for d in range(self.days):
+            label = (self.day0 + timedelta(days=d)).strftime("%Y-%m")
+            if self._months and self._months[-1][2] == label:
+                self._months[-1][1] = d + 1
+            else:
+                self._months.append([d, d + 1, label])
+        self._names = _Strings(self._columns["name_offsets"], self._columns["name_blob"])
+        self._display = _Strings(self._columns["display_offsets"], self._columns["display_blob"])
+
+    def index(self, product):
+        """Row of a product by normalized name, or None."""
+        name = product.strip().lower() if isinstance(product, str) else ""
+        i = bisect.bisect_left(self._names, name)
+        return i if i < self.rows and self._names[i] == name else None
+
+    def _value(self, column, i):
+        value = self._columns[column][i]
+        return None if value != value else value
+
+    def products(self, tenant=None):
+        """Product names in stock, in stock order."""
+        position = self._columns["position"]
+        stocked = sorted((position[i], i) for i in range(self.rows) if position[i] >= 0)
+        return [self._display[i] for _, i in stocked]
+
+    def current_stock(self, tenant, product):
+        i = self.index(product)
+        if i is None or self._columns["position"][i] < 0:
+            return None
+        qty = self._columns["qty"][i]
+        return {"product_name": self._display[i], "qty": int(qty) if float(qty).is_integer() else qty,
+                "base_cost": self._value("base_cost", i), "suggested_price": self._value("suggested_price", i)}
+
+    def sales_mean(self, tenant, product):
+        i = self.index(product)
+        items = self._columns["total_items"][i] if i is not None else 0
+        return self._columns["total_qty"][i] / items if items else None
+
+    def sales_since(self, tenant, product, since):
+        """
+        AnalyticsStore.sales_since() from the daily buckets, to the day: a
+        whole day counts when since falls on it.
+        """
+        i = self.index(product)
+        if i is None:
+            return [], None
+        since_day = since.date() if isinstance(since, datetime) else since
+        first = max(0, (since_day - self.day0).days)
+        qty, items = self._columns["daily_qty"], self._columns["daily_items"]
+        base = i * self.days
+        monthly, total_qty, total_items = [], 0.0, 0
+        for start, end, month in self._months:
+            start = max(start, first)
+            if start >= end or not any(items[base + start:base + end]):
+                continue
+            q = sum(qty[base + start:base + end])
+            monthly.append((month, int(q) if q.is_integer() else q))
+            total_qty += q
+            total_items += sum(items[base + start:base + end])
+        return monthly, (total_qty / total_items if total_items else None)
+
+    def covers(self, since):
+        """True when the daily buckets reach back to since."""
+        since_day = since.date() if isinstance(since, datetime) else since
+        return since_day >= self.day0
+
+
+class _Strings:
+    """Read-only sequence over an offsets array and a UTF-8 blob, decoded on access (for bisect)."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode()
+
+
+_open = {}  # tenant -> Snapshot most recently opened by this process
+_open_lock = threading.Lock()
+
+
+def get(tenant, version=None):
+    """
+    The tenant's snapshot for version (the CURRENT one when version is
+    None), mapped once per process; None when there is none.
+    """
+    if not SNAPSHOT_DIR or not tenant:
+        return None
+    directory = _tenant_dir(tenant)
+    if version is None:
+        try:
+            with open(os.path.join(directory, "CURRENT"), "rb") as f:
+                version = f.read().decode().strip()
+        except OSError:
+            return None
+    with _open_lock:
+        snapshot = _open.get(tenant)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        try:
+            snapshot = Snapshot(os.path.join(directory, f"{version}.snap"))
+        except (OSError, ValueError):
+            return None
+        # The previous version stays mapped until no lookup references it
+        _open[tenant] = snapshot
+    return snapshot
+
+
+def _metric_samples():
+    with _open_lock:
+        return [("catalog_snapshot_bytes", {}, sum(s.nbytes for s in _open.values()))]
+
+
+metrics.register_collector(_metric_samples)
@@ -0,0 +1,117 @@
+"""
+End-to-end request deadlines shared across the agent chain.
+
+The router fixes a deadline when a request arrives and forwards it to every
+agent in the X-Request-Deadline header (absolute Unix time in milliseconds).
+Each agent reads it back with init_app(), checks allows(stage) before an
+expensive stage and calls skip(stage) when it takes a cheaper path instead.
+Skipped stages are returned in the X-Skipped-Stages header and in the
+"skipped_stages" field of agent responses.
+"""
+import contextvars
+import os
+import time
+
+from flask import request
+
+DEADLINE_HEADER = "X-Request-Deadline"
+SKIPPED_HEADER = "X-Skipped-Stages"
+DEFAULT_BUDGET_S = float(os.getenv("AI_REQUEST_BUDGET_S", 20))
+
+# Rough time each stage needs; a stage only runs if at least this much
+# budget (plus SAFETY_MARGIN_S) is left.
+STAGE_COST_S = {
+    "prophet": 2.0,
+    "pytrends": 3.0,
+    "llm": 2.5,
+    "serpapi": 3.0,
+    "scrape": 4.0,
+    "smtp": 3.0,
+    "mailtrap_poll": 2.0,
+}
+SAFETY_MARGIN_S = 0.25
+
+
+class RequestBudget:
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.skipped = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+
+_budget = contextvars.ContextVar("request_budget", default=None)
+
+
+def start(budget_s=DEFAULT_BUDGET_S, headers=None):
+    """Begin a request budget, honouring an incoming deadline header if present."""
+    expires_at = time.time() + budget_s
+    raw = (headers or {}).get(DEADLINE_HEADER)
+    if raw:
+        try:
+            expires_at = min(expires_at, int(raw) / 1000)
+        except ValueError:
+            pass
+    budget = RequestBudget(expires_at)
+    _budget.set(budget)
+    return budget
+
+
+def current():
+    """The active request's budget; code running outside a request gets a fresh default one."""
+    budget = _budget.get()
+    return budget if budget is not None else RequestBudget(time.time() + DEFAULT_BUDGET_S)
+
+
+def remaining():
+    return current().remaining()
+
+
+def allows(stage):
+    """True if there is enough budget left to run stage."""
+    return current().remaining() >= STAGE_COST_S.get(stage, 0.0) + SAFETY_MARGIN_S
+
+
+def skip(stage, reason="budget"):
+    skipped = current().skipped
+    for entry in skipped:
+        if entry["stage"] == stage and entry["reason"] == reason:
+            entry["count"] = entry.get("count", 1) + 1
+            return
+    skipped.append({"stage": stage, "reason": reason})
+
+
+def skipped_stages():
+    return list(current().skipped)
+
+
+def merge_skipped(response):
+    """Fold a downstream agent's skipped stages into this request's list."""
+    if isinstance(response, dict):
+        for entry in response.get("skipped_stages") or []:
+            skip(entry.get("stage", "unknown"), entry.get("reason", "budget"))
+
+
+def timeout(cap):
+    """Timeout for a downstream call: the remaining budget, but never more than cap."""
+    return max(0.1, min(cap, current().remaining()))
+
+
+def outgoing_headers():
+    return {DEADLINE_HEADER: str(int(current().expires_at * 1000))}
+
+
+def init_app(app, budget_s=DEFAULT_BUDGET_S):
+    """Start a budget for every request and report skipped stages on the way out."""
+
+    @app.before_request
+    def _start_budget():
+        start(budget_s, request.headers)
+
+    @app.after_request
+    def _report_skipped(response):
+        skipped = _budget.get().skipped if _budget.get() is not None else []
+        if skipped:
+            response.headers[SKIPPED_HEADER] = ",".join(s["stage"] for s in skipped)
+        return response
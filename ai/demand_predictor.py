@@ -1,33 +1,48 @@
-import spacy
 from flask import Flask, request, jsonify
 import pandas as pd
-from prophet import Prophet
-import google.generativeai as genai
-from pytrends.request import TrendReq
+from llm_batcher import InsightBatcher
+from llm_gateway import generate_stream
+from streaming import ndjson_response
+import analytics_store
+import deadline
+import log_setup
+import metrics
+import services
+import stream_ingest
+import tracing
+import wire_format
+import functools
 import logging
-import os
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
 # =========================================================
 # 🔧 Environment Setup
 # =========================================================
-load_dotenv()
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-
-genai.configure(api_key=gemini_api_key)
+load_dotenv()  # GEMINI_API_KEY is checked by llm_gateway on the first model call
 
 # Logging
-logging.basicConfig(filename='demand_predictor_logs.txt', level=logging.INFO,
-                    format='%(asctime)s %(levelname)s: %(message)s')
+log_setup.configure("demand_predictor", "demand_predictor_logs.txt")
+
+# NLP model, loaded on first use
+_nlp = None
+_nlp_lock = threading.Lock()
 
-# NLP model
-nlp = spacy.load("en_core_web_sm")
+def get_nlp():
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load("en_core_web_sm")
+    return _nlp
 
 # Flask app
 app = Flask(__name__)
+deadline.init_app(app, budget_s=60)
+
+SKIPPED_INSIGHT_TEXT = "AI insight skipped to answer within the response deadline."
 
 # =========================================================
 # 🧩 Utility Functions
@@ -35,207 +50,535 @@ app = Flask(__name__)
 def normalize_name(name: str):
     return name.strip().lower() if isinstance(name, str) else ""
 
-def flatten_transactions(transactions_list):
-    flat_list = []
-    for t in transactions_list:
-        items = t.get('items', [])
-        for item in items:
-            flat_item = item.copy()
-            flat_item['createdAt'] = t.get('createdAt')
-            flat_list.append(flat_item)
-    return pd.DataFrame(flat_list)
+# Request body columns kept by stream_ingest (transaction items are flattened as they are read)
+STOCK_COLUMNS = {
+    'product_name': stream_ingest.NAME,
+    'qty': stream_ingest.NUM,
+    'base_cost_usd': stream_ingest.NUM,
+    'suggested_price_usd': stream_ingest.NUM,
+}
+ITEM_COLUMNS = {'product_name': stream_ingest.NAME, 'qty': stream_ingest.NUM, 'createdAt': stream_ingest.TIME}
+HISTORY_DAYS = 90
+
+TREND_CACHE_TTL_S = 6 * 3600
+_trend_cache = {}  # product -> (score, change, fetched_at)
 
 def get_google_trend_score(product_name: str):
-    """Fetch trend score and change over last 3 months from Google Trends."""
+    """
+    Fetch trend score and change over last 3 months from Google Trends.
+    Results are cached; when the request budget is low a stale cached value
+    (or a neutral 50/0) is returned instead of calling Google.
+    """
+    cached = _trend_cache.get(product_name)
+    if cached and time.time() - cached[2] < TREND_CACHE_TTL_S:
+        return cached[0], cached[1]
+    if not deadline.allows("pytrends"):
+        deadline.skip("pytrends")
+        return (cached[0], cached[1]) if cached else (50, 0)
+
     try:
-        pytrends = TrendReq()
-        pytrends.build_payload([product_name], timeframe='today 3-m')
-        trend_data = pytrends.interest_over_time()
+        from pytrends.request import TrendReq
+
+        with metrics.timed("pytrends"):
+            pytrends = TrendReq(timeout=(2, deadline.timeout(10)))
+            pytrends.build_payload([product_name], timeframe='today 3-m')
+            trend_data = pytrends.interest_over_time()
         if trend_data.empty:
             return 50, 0
         score = int(trend_data[product_name].iloc[-1])
         change = int(trend_data[product_name].iloc[-1] - trend_data[product_name].iloc[0])
+        _trend_cache[product_name] = (score, change, time.time())
         return score, change
     except Exception as e:
         logging.error(f"Google Trends error: {e}")
         return 50, 0
 
-def fetch_ai_insight(product, current_stock, forecasted_demand, trend_score, trend_change, price_info, historical_sales):
-    """
-    Generate concise, actionable sales + inventory recommendation using Gemini 2.0.
-    Output should be short, structured, and user-friendly.
-    """
+def _sales_summary(historical_sales):
     # Convert historical_sales to simple comma-separated string
-    sales_summary = ", ".join(map(str, historical_sales)) if historical_sales else "No recent data"
+    return ", ".join(map(str, historical_sales)) if historical_sales else "No recent data"
+
+
+def render_insight_facts(fields):
+    """Product facts block shared by the single and the batched insight prompts."""
+    price_info = fields['price_info']
+    return (
+        f"Product: {fields['product']}\n"
+        f"Current Stock: {fields['current_stock']}\n"
+        f"Forecasted Demand (next month): {fields['forecasted_demand']}\n"
+        f"Historical Sales (last 3 months): {_sales_summary(fields['historical_sales'])}\n"
+        f"Google Trends Score: {fields['trend_score']}/100 (change: {fields['trend_change']})\n"
+        f"Base Cost: ${price_info.get('base_cost', '?')}, Suggested Price: ${price_info.get('suggested_price', '?')}"
+    )
+
 
-    prompt = (
+INSIGHT_INSTRUCTIONS = (
+    "You are a sales assistant helping manage inventory, pricing, and marketing.\n"
+    "For each product, provide a concise, actionable summary with 3 sections:\n"
+    "1. Stock Management: what to order or adjust\n"
+    "2. Pricing: any changes or promotions\n"
+    "3. Marketing: simple, effective steps to increase sales\n"
+    "Keep it short, easy to read, and suitable for a business user. Use bullet points if helpful."
+)
+
+
+def build_insight_prompt(fields):
+    return (
         f"You are a sales assistant helping manage inventory, pricing, and marketing.\n"
-        f"Product: {product}\n"
-        f"Current Stock: {current_stock}\n"
-        f"Forecasted Demand (next month): {forecasted_demand}\n"
-        f"Historical Sales (last 3 months): {sales_summary}\n"
-        f"Google Trends Score: {trend_score}/100 (change: {trend_change})\n"
-        f"Base Cost: ${price_info.get('base_cost', '?')}, Suggested Price: ${price_info.get('suggested_price', '?')}\n\n"
+        f"{render_insight_facts(fields)}\n\n"
         f"Instructions: Provide a concise, actionable summary with 3 sections:\n"
         f"1. Stock Management: what to order or adjust\n"
         f"2. Pricing: any changes or promotions\n"
         f"3. Marketing: simple, effective steps to increase sales\n"
         f"Keep it short, easy to read, and suitable for a business user. Use bullet points if helpful."
     )
+
+
+insight_batcher = InsightBatcher(
+    call_site="demand_insight",
+    single_prompt=build_insight_prompt,
+    render_item=render_insight_facts,
+    instructions=INSIGHT_INSTRUCTIONS,
+    model="gemini-2.5-flash-lite",
+)
+
+
+def _insight_fields(product, current_stock, forecasted_demand, trend_score, trend_change, price_info, historical_sales):
+    return {
+        'product': product,
+        'current_stock': current_stock,
+        'forecasted_demand': forecasted_demand,
+        'trend_score': trend_score,
+        'trend_change': trend_change,
+        'price_info': price_info,
+        'historical_sales': historical_sales,
+    }
+
+
+def fetch_ai_insight(product, current_stock, forecasted_demand, trend_score, trend_change, price_info, historical_sales):
+    """
+    Generate concise, actionable sales + inventory recommendation using Gemini 2.0.
+    Output should be short, structured, and user-friendly.
+    Concurrent calls are coalesced into batched prompts by insight_batcher.
+    """
+    if not deadline.allows("llm"):
+        deadline.skip("llm")
+        return SKIPPED_INSIGHT_TEXT
+
+    fields = _insight_fields(product, current_stock, forecasted_demand, trend_score,
+                             trend_change, price_info, historical_sales)
     try:
-        model_gemini = genai.GenerativeModel("gemini-2.5-flash-lite")
-        response = model_gemini.generate_content(prompt)
-        return response.text
+        return insight_batcher.insight(fields, timeout=deadline.timeout(30))
     except Exception as e:
         logging.error(f"Gemini AI error: {e}")
         return "Unable to generate AI insight."
 
-# =========================================================
-# 🔮 Demand Prediction Route
-# =========================================================
-@app.route('/predict_demand', methods=['POST'])
-def predict_demand():
+
+@functools.lru_cache(maxsize=1024)
+@metrics.timed("spacy")  # inside the cache, so only real spaCy calls are timed and traced
+def extract_product(query):
+    """Extract the product name from a demand query."""
+    doc = get_nlp()(query)
+    product = next((ent.text for ent in doc.ents if ent.label_ == 'PRODUCT'), None)
+    if not product:
+        product = query.lower().replace('predict demand for', '').replace('next month', '').strip()
+    return product
+
+
+def read_payload(source, products_of):
+    """
+    Stream the request body into column buffers, keeping only the last
+    HISTORY_DAYS of sales for the products products_of(fields) names (all
+    when it returns None), or no rows when the analytics store answers.
+    """
+    def plan(fields):
+        if source is not None:
+            return stream_ingest.Filters(skip=True)
+        return stream_ingest.Filters(products=products_of(fields),
+                                     since=datetime.now() - timedelta(days=HISTORY_DAYS))
+    return stream_ingest.read_request(request, STOCK_COLUMNS, ITEM_COLUMNS, plan=plan)
+
+
+def _query_product(fields):
+    query = fields.get('query')
+    return [extract_product(query)] if isinstance(query, str) and query else None
+
+
+@metrics.timed("dataframe")
+def build_frames(payload):
+    """DataFrames from the request's column buffers, with normalized name columns."""
+    df_stock = payload.stock.to_frame(normalized={'product_name': 'name_norm'})
+    df_transactions = payload.items.to_frame(normalized={'product_name': 'product_name_norm'})
+    return df_stock, df_transactions
+
+
+def prophet_forecast(df_sales_ts, recent_mean):
+    """Next-month forecast from monthly totals, falling back to the recent mean quantity per sale."""
     try:
-        data = request.json
-        query = data.get('query')
-        stock_data = data.get('stock_data')
-        transaction_data = data.get('transaction_data')
+        from prophet import Prophet  # slow import (cmdstanpy, plotting backends), so deferred
 
-        if not query or not stock_data or not transaction_data:
-            return jsonify({'error': 'Missing required data'}), 400
+        with metrics.timed("prophet"):
+            model = Prophet(yearly_seasonality=False, weekly_seasonality=False, daily_seasonality=False)
+            model.fit(df_sales_ts[['ds', 'y']])
+            future = model.make_future_dataframe(periods=1, freq='M')
+            forecast = model.predict(future)
+        forecasted_demand = float(forecast['yhat'].iloc[-1])
 
-        # Extract product name
-        doc = nlp(query)
-        product = next((ent.text for ent in doc.ents if ent.label_ == 'PRODUCT'), None)
-        if not product:
-            product = query.lower().replace('predict demand for', '').replace('next month', '').strip()
-        product_norm = normalize_name(product)
-
-        # Convert data to DataFrames
-        df_stock = pd.DataFrame(stock_data)
-        df_transactions = flatten_transactions(transaction_data)
-
-        # Normalize names
-        if not df_stock.empty and 'product_name' in df_stock.columns:
-            df_stock['name_norm'] = df_stock['product_name'].apply(normalize_name)
-        if not df_transactions.empty and 'product_name' in df_transactions.columns:
-            df_transactions['product_name_norm'] = df_transactions['product_name'].apply(normalize_name)
-
-        # Validate product
-        if df_stock.empty or product_norm not in df_stock['name_norm'].values:
-            return jsonify({'error': f'Product {product} not found in stock'}), 400
+        # ✅ Fallback: if Prophet gives 0 or NaN, use recent average
+        if forecasted_demand <= 0 or pd.isna(forecasted_demand):
+            forecasted_demand = recent_mean
 
-        # Extract stock info
-        stock_row = df_stock[df_stock['name_norm'] == product_norm].iloc[0]
-        current_stock = int(stock_row['qty'])
-        price_info = {
-            'base_cost': stock_row.get('base_cost_usd', '?'),
-            'suggested_price': stock_row.get('suggested_price_usd', '?')
-        }
+    except Exception as e:
+        logging.error(f"Prophet error: {e}")
+        forecasted_demand = recent_mean
 
-        # ===============================
-        # 📊 Historical Sales + Forecast
-        # ===============================
-        forecasted_demand = 0
-        historical_sales = []
+    return forecasted_demand
 
-        if not df_transactions.empty:
-            df_sales = df_transactions[df_transactions['product_name_norm'] == product_norm]
-            df_sales['createdAt'] = pd.to_datetime(df_sales['createdAt']).dt.tz_localize(None)
 
-            # Filter recent 3 months
-            three_months_ago = datetime.now() - timedelta(days=90)
-            df_sales_recent = df_sales[df_sales['createdAt'] >= three_months_ago]
+def warm_models():
+    """Run spaCy and one small Prophet fit so the first request doesn't pay their setup cost."""
+    get_nlp()("predict demand for rice")
+    history = pd.DataFrame({"ds": pd.date_range("2024-01-01", periods=6, freq="MS"), "y": [3, 4, 5, 4, 6, 5]})
+    prophet_forecast(history, history["y"].mean())
 
-            if not df_sales_recent.empty:
-                df_sales_recent['month'] = df_sales_recent['createdAt'].dt.to_period('M')
-                monthly_sales = df_sales_recent.groupby('month')['qty'].sum().reset_index()
-                historical_sales = monthly_sales['qty'].tolist()
 
-                # Prepare Prophet-friendly data
-                df_sales_ts = monthly_sales.copy()
-                df_sales_ts['ds'] = df_sales_ts['month'].dt.to_timestamp()
-                df_sales_ts['y'] = df_sales_ts['qty']
+services.init_app(app, "demand_predictor", warmup=warm_models)
+tracing.init_app(app, "demand_predictor")
+metrics.init_app(app, "demand_predictor")
+wire_format.init_app(app)
 
-                try:
-                    model = Prophet(yearly_seasonality=False, weekly_seasonality=False, daily_seasonality=False)
-                    model.fit(df_sales_ts[['ds', 'y']])
-                    future = model.make_future_dataframe(periods=1, freq='M')
-                    forecast = model.predict(future)
-                    forecasted_demand = float(forecast['yhat'].iloc[-1])
 
-                    # ✅ Fallback: if Prophet gives 0 or NaN, use recent average
-                    if forecasted_demand <= 0 or pd.isna(forecasted_demand):
-                        forecasted_demand = df_sales_recent['qty'].mean()
+def forecast_product(product, df_stock, df_transactions):
+    """
+    Stock position and next-month forecast for one product.
+    Returns None if the product is not in stock_data.
+    """
+    product_norm = normalize_name(product)
+
+    # Validate product
+    if df_stock.empty or 'name_norm' not in df_stock.columns or product_norm not in df_stock['name_norm'].values:
+        return None
+
+    # Extract stock info
+    stock_row = df_stock[df_stock['name_norm'] == product_norm].iloc[0]
+    current_stock = int(stock_row['qty'])
+    price_info = {
+        'base_cost': stock_row.get('base_cost_usd', '?'),
+        'suggested_price': stock_row.get('suggested_price_usd', '?')
+    }
+
+    # ===============================
+    # 📊 Historical Sales
+    # ===============================
+    monthly_sales, recent_mean = [], None
+
+    if not df_transactions.empty and 'product_name_norm' in df_transactions.columns:
+        df_sales = df_transactions[df_transactions['product_name_norm'] == product_norm].copy()
+        df_sales['createdAt'] = pd.to_datetime(df_sales['createdAt']).dt.tz_localize(None)
+
+        # Filter recent 3 months
+        three_months_ago = datetime.now() - timedelta(days=90)
+        df_sales_recent = df_sales[df_sales['createdAt'] >= three_months_ago].copy()
+
+        if not df_sales_recent.empty:
+            df_sales_recent['month'] = df_sales_recent['createdAt'].dt.to_period('M')
+            by_month = df_sales_recent.groupby('month')['qty'].sum()
+            monthly_sales = [(month.to_timestamp(), qty) for month, qty in by_month.items()]
+            recent_mean = df_sales_recent['qty'].mean()
+
+    return _forecast(product, product_norm, current_stock, price_info, monthly_sales, recent_mean)
+
+
+def forecast_product_from_store(product, store, tenant):
+    """forecast_product() over the tenant's data in the analytics store."""
+    product_norm = normalize_name(product)
+    stock = store.current_stock(tenant, product_norm)
+    if stock is None:
+        return None
+
+    price_info = {
+        'base_cost': stock['base_cost'] if stock['base_cost'] is not None else '?',
+        'suggested_price': stock['suggested_price'] if stock['suggested_price'] is not None else '?'
+    }
+    months, recent_mean = store.sales_since(tenant, product_norm, datetime.now() - timedelta(days=90))
+    monthly_sales = [(pd.Timestamp(f"{month}-01"), qty) for month, qty in months]
+    return _forecast(product, product_norm, int(stock['qty']), price_info, monthly_sales, recent_mean)
+
+
+def _forecast(product, product_norm, current_stock, price_info, monthly_sales, recent_mean):
+    """Forecast and stock analysis from [(month start, qty sold)] over the last 3 months."""
+    forecasted_demand = 0
+    historical_sales = [qty for _, qty in monthly_sales]
+
+    if monthly_sales:
+        # Prepare Prophet-friendly data
+        df_sales_ts = pd.DataFrame({'ds': [month for month, _ in monthly_sales], 'y': historical_sales})
+
+        if deadline.allows("prophet"):
+            forecasted_demand = prophet_forecast(df_sales_ts, recent_mean)
+        else:
+            # Not enough budget left to fit a model: use the recent mean
+            deadline.skip("prophet")
+            forecasted_demand = recent_mean
+
+    # Default if no data at all
+    if forecasted_demand == 0:
+        forecasted_demand = 10  # minimal fallback
+
+    # ===============================
+    # 📈 Stock Analysis
+    # ===============================
+    stock_coverage = int((current_stock / forecasted_demand) * 100) if forecasted_demand > 0 else 0
+    reorder_qty = max(0, int(forecasted_demand - current_stock))
+
+    return {
+        'product': product,
+        'product_norm': product_norm,
+        'current_stock': current_stock,
+        'price_info': price_info,
+        'historical_sales': historical_sales,
+        'forecasted_demand': forecasted_demand,
+        'stock_coverage': stock_coverage,
+        'reorder_qty': reorder_qty,
+    }
+
+
+def product_forecaster(source, payload):
+    """
+    forecast_product() bound to this request's data: the analytics store
+    when request_source() found it there, else frames built from the body.
+    """
+    if source is not None:
+        store, tenant = source
+        return lambda product: forecast_product_from_store(product, store, tenant)
+    df_stock, df_transactions = build_frames(payload)
+    return lambda product: forecast_product(product, df_stock, df_transactions)
+
+
+def public_result(result):
+    """Copy of a forecast_product() result with plain JSON-serializable values."""
+    public = dict(result)
+    public['forecasted_demand'] = int(result['forecasted_demand'])
+    public['historical_sales'] = [int(q) for q in result['historical_sales']]
+    public['price_info'] = {k: (v.item() if hasattr(v, 'item') else v) for k, v in result['price_info'].items()}
+    return public
+
+
+def format_report(result, trend_score, trend_change, ai_insight):
+    product = result['product']
+    price_info = result['price_info']
+    historical_sales = result['historical_sales']
+    return f"""
+🌿 Nexabiz AI Demand Forecast Report
 
-                except Exception as e:
-                    logging.error(f"Prophet error: {e}")
-                    forecasted_demand = df_sales_recent['qty'].mean()
+🧵 Product: {product.title()}
+📅 Forecast Period: Next Month
+📈 Historical Sales (Last 3 Months): {historical_sales if historical_sales else 'No recent data'}
+📊 Forecasted Demand: {int(result['forecasted_demand'])} units
+📦 Current Stock: {result['current_stock']} units
+📉 Stock Coverage: {result['stock_coverage']}% of forecasted demand
+🧮 Suggested Reorder Quantity: {result['reorder_qty']} units
+🌍 Google Trends (3-Month): {trend_score}/100 ({'increasing' if trend_change > 0 else 'decreasing'} by {abs(trend_change)})
+💰 Pricing: Base ${price_info.get('base_cost')}, Suggested ${price_info.get('suggested_price')}
 
-        # Default if no data at all
-        if forecasted_demand == 0:
-            forecasted_demand = 10  # minimal fallback
+🧠 AI Recommendation:
+{ai_insight}
+"""
 
-        # ===============================
-        # 📈 Stock Analysis
-        # ===============================
-        stock_coverage = int((current_stock / forecasted_demand) * 100) if forecasted_demand > 0 else 0
-        reorder_qty = max(0, int(forecasted_demand - current_stock))
+# =========================================================
+# 🔮 Demand Prediction Route
+# =========================================================
+@app.route('/predict_demand', methods=['POST'])
+def predict_demand():
+    try:
+        source = analytics_store.request_source()
+        payload = read_payload(source, _query_product)
+        query = payload.fields.get('query')
+
+        if not query or not (source or (payload.counts['stock_data'] and payload.counts['transaction_data'])):
+            return jsonify({'error': 'Missing required data'}), 400
+
+        # Extract product name
+        product = extract_product(query)
+
+        result = product_forecaster(source, payload)(product)
+        if result is None:
+            return jsonify({'error': f'Product {product} not found in stock'}), 400
 
         # ===============================
         # 🌍 Google Trends
         # ===============================
-        trend_score, trend_change = get_google_trend_score(product_norm)
+        trend_score, trend_change = get_google_trend_score(result['product_norm'])
 
         # ===============================
         # 🧠 AI Recommendation
         # ===============================
         ai_insight = fetch_ai_insight(
-            product, current_stock, int(forecasted_demand),
-            trend_score, trend_change, price_info, historical_sales
+            product, result['current_stock'], int(result['forecasted_demand']),
+            trend_score, trend_change, result['price_info'], result['historical_sales']
         )
 
         # ===============================
         # 🪶 Response Formatting
         # ===============================
-        readable_text = f"""
-🌿 Nexabiz AI Demand Forecast Report
-
-🧵 Product: {product.title()}
-📅 Forecast Period: Next Month
-📈 Historical Sales (Last 3 Months): {historical_sales if historical_sales else 'No recent data'}
-📊 Forecasted Demand: {int(forecasted_demand)} units
-📦 Current Stock: {current_stock} units
-📉 Stock Coverage: {stock_coverage}% of forecasted demand
-🧮 Suggested Reorder Quantity: {reorder_qty} units
-🌍 Google Trends (3-Month): {trend_score}/100 ({'increasing' if trend_change > 0 else 'decreasing'} by {abs(trend_change)})
-💰 Pricing: Base ${price_info.get('base_cost')}, Suggested ${price_info.get('suggested_price')}
-
-🧠 AI Recommendation:
-{ai_insight}
-"""
+        readable_text = format_report(result, trend_score, trend_change, ai_insight)
 
         # Logging for debugging
-        logging.info({
+        logging.info("demand forecast", extra={
             'product': product,
-            'current_stock': current_stock,
-            'forecasted_demand': forecasted_demand,
-            'historical_sales': historical_sales,
-            'stock_coverage': stock_coverage,
-            'reorder_qty': reorder_qty,
+            'current_stock': result['current_stock'],
+            'forecasted_demand': result['forecasted_demand'],
+            'history_months': len(result['historical_sales']),
+            'stock_coverage': result['stock_coverage'],
+            'reorder_qty': result['reorder_qty'],
             'trend_score': trend_score,
             'trend_change': trend_change
         })
 
-        return jsonify({'readable_text': readable_text})
+        return jsonify({'readable_text': readable_text, 'skipped_stages': deadline.skipped_stages()})
 
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
     except Exception as e:
         logging.error(f"Error in predict_demand: {e}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
+@app.route('/predict_demand/stream', methods=['POST'])
+def predict_demand_stream():
+    """
+    Streamed variant of /predict_demand (NDJSON events).
+    Forecast numbers are sent as soon as they are computed, then the trend
+    score, then the AI insight piece by piece, then the full report.
+    """
+    source = analytics_store.request_source()
+    try:
+        payload = read_payload(source, _query_product)
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
+    query = payload.fields.get('query')
+
+    if not query or not (source or (payload.counts['stock_data'] and payload.counts['transaction_data'])):
+        return jsonify({'error': 'Missing required data'}), 400
+
+    def events():
+        try:
+            product = extract_product(query)
+            result = product_forecaster(source, payload)(product)
+            if result is None:
+                yield 'error', {'error': f'Product {product} not found in stock'}
+                return
+            yield 'forecast', public_result(result)
+
+            trend_score, trend_change = get_google_trend_score(result['product_norm'])
+            yield 'trends', {'trend_score': trend_score, 'trend_change': trend_change}
+
+            prompt = build_insight_prompt(_insight_fields(
+                product, result['current_stock'], int(result['forecasted_demand']),
+                trend_score, trend_change, result['price_info'], result['historical_sales']
+            ))
+            parts = []
+            if not deadline.allows("llm"):
+                deadline.skip("llm")
+                parts.append(SKIPPED_INSIGHT_TEXT)
+                yield 'insight_delta', {'text': parts[0]}
+            else:
+                try:
+                    for piece in generate_stream(prompt, model="gemini-2.5-flash-lite", call_site="demand_insight",
+                                                 deadline=deadline.remaining()):
+                        parts.append(piece)
+                        yield 'insight_delta', {'text': piece}
+                except Exception as e:
+                    logging.error(f"Gemini AI error: {e}")
+                    if not parts:
+                        parts.append("Unable to generate AI insight.")
+                        yield 'insight_delta', {'text': parts[0]}
+
+            yield 'done', {
+                'readable_text': format_report(result, trend_score, trend_change, "".join(parts)),
+                'skipped_stages': deadline.skipped_stages(),
+            }
+
+        except Exception as e:
+            logging.error(f"Error in predict_demand_stream: {e}")
+            yield 'error', {'error': f'Server error: {str(e)}'}
+
+    return ndjson_response(events())
+
+
+@app.route('/predict_demand_bulk', methods=['POST'])
+def predict_demand_bulk():
+    """
+    Forecast every product in stock_data (or just `products`) in one run.
+    AI insights for all products are generated through batched prompts.
+    Google Trends lookups are off unless include_trends is true.
+    """
+    try:
+        source = analytics_store.request_source()
+        payload = read_payload(source, lambda fields: fields.get('products') or None)
+        data = payload.fields
+        include_trends = bool(data.get('include_trends', False))
+        include_insights = bool(data.get('include_insights', True))
+
+        if not (source or payload.counts['stock_data']):
+            return jsonify({'error': 'Missing required data'}), 400
+
+        forecast = product_forecaster(source, payload)
+        products = data.get('products') or (
+            source[0].products(source[1]) if source
+            else [n for n in payload.stock.columns['product_name'].categories if n]  # distinct, in first-seen order
+        )
+
+        results, missing = [], []
+        for product in products:
+            result = forecast(product)
+            if result is None:
+                missing.append(product)
+                continue
+            if include_trends:
+                result['trend_score'], result['trend_change'] = get_google_trend_score(result['product_norm'])
+            else:
+                result['trend_score'], result['trend_change'] = 50, 0
+            results.append(result)
+
+        if include_insights and results and not deadline.allows("llm"):
+            deadline.skip("llm")
+            include_insights = False
+            for r in results:
+                r['ai_insight'] = SKIPPED_INSIGHT_TEXT
+
+        if include_insights and results:
+            futures = [
+                insight_batcher.submit(_insight_fields(
+                    r['product'], r['current_stock'], int(r['forecasted_demand']),
+                    r['trend_score'], r['trend_change'], r['price_info'], r['historical_sales']
+                ))
+                for r in results
+            ]
+            for r, future in zip(results, futures):
+                try:
+                    r['ai_insight'] = future.result(timeout=deadline.timeout(60))
+                except Exception as e:
+                    logging.error(f"Gemini AI error for {r['product']}: {e}")
+                    r['ai_insight'] = "Unable to generate AI insight."
+
+        for r in results:
+            r['readable_text'] = format_report(r, r['trend_score'], r['trend_change'], r.get('ai_insight', ''))
+
+        return jsonify({
+            'results': [public_result(r) for r in results],
+            'not_found': missing,
+            'skipped_stages': deadline.skipped_stages(),
+        })
+
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
+    except Exception as e:
+        logging.error(f"Error in predict_demand_bulk: {e}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
 # =========================================================
 # 🚀 Run Server
 # =========================================================
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=services.port("demand_predictor"), debug=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Reduce a customer email to its new content before order parsing and prompting.
+
+Gmail replies carry the whole quoted thread, signatures and legal
+disclaimers. Parsing all of that costs time, the prompt grows with every
+reply, and quantities from old orders in the thread get detected again.
+clean() keeps only what the sender wrote in this message:
+
+    cleaned = email_preprocess.clean(email.get("body", ""))
+    cleaned.text         # new content, at most EMAIL_MAX_CHARS characters
+    cleaned.removed      # what was dropped, e.g. ["quoted", "signature"]
+
+The steps are:
+- HTML bodies lose their quoted blocks and are turned into text.
+- Text is cut at the first reply header ("On ... wrote:", "-----Original
+  Message-----", an Outlook From:/Sent: block).
+- Lines quoted with ">" are dropped.
+- Signatures, sign-offs, "Sent from my ..." lines and disclaimers are cut.
+- A message that only forwards another keeps the forwarded body.
+
+fingerprint() identifies a message by its sender and cleaned text, so
+auto_reply can tell a message it has already answered.
+"""
+import hashlib
+import html
+import json
+import os
+import re
+
+import metrics
+
+MAX_CHARS = int(os.getenv("EMAIL_MAX_CHARS", 4000))
+SIGN_OFF_TAIL_LINES = 5  # a sign-off only ends the message when at most this many lines follow it
+SIGNATURE_LINE_CHARS = 40  # longer lines after a sign-off are message text, not a signature
+
+metrics.describe("email_preprocess_chars_total", "counter", "Characters of email bodies before and after preprocessing.")
+
+_HTML = re.compile(r"^\s*<[a-z!]|<(?:html|body|div|br)\b", re.IGNORECASE)
+_HTML_QUOTE = re.compile(
+    r'<(?:div[^>]*class="[^"]*gmail_quote|blockquote|div[^>]*id="(?:divRplyFwdMsg|appendonsend)")', re.IGNORECASE
+)
+_HTML_BREAK = re.compile(r"<\s*(?:br|/p|/div|/li|/tr|/h\d)\s*/?>", re.IGNORECASE)
+_HTML_DROP = re.compile(r"<(style|script|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+_WROTE = re.compile(r"^\s*on\b.{0,300}\bwrote:\s*$", re.IGNORECASE)
+_ORIGINAL = re.compile(r"^\s*-{2,}\s*original message\s*-{2,}\s*$", re.IGNORECASE)
+_FORWARD = re.compile(r"^\s*(?:-{2,}\s*forwarded message\s*-{2,}|begin forwarded message:)\s*$", re.IGNORECASE)
+_RULE = re.compile(r"^\s*_{10,}\s*$")
+_HEADER = re.compile(r"^\s*(?:from|sent|date|to|cc|subject):", re.IGNORECASE)
+_SIGNATURE = re.compile(r"^(?:--|__)\s*$")
+_DEVICE = re.compile(r"^\s*(?:sent from my\b|get outlook for\b|sent from (?:mail|yahoo mail|outlook)\b)", re.IGNORECASE)
+_DISCLAIMER = re.compile(
+    r"^\s*(?:confidentiality notice|disclaimer\b|this (?:e-?mail|message)(?: and any attachments?)?"
+    r" (?:is|are|may (?:be|contain)|contains?) (?:confidential|privileged|intended))",
+    re.IGNORECASE,
+)
+_CONTACT = re.compile(r"^(?:tel|phone|mobile|cell|fax|[tmp])\s*[:.]|^(?:https?://|www\.)", re.IGNORECASE)
+_SIGN_OFF = re.compile(
+    r"^\s*(?:(?:best|kind|warm|warmest)\s+regards|regards|best wishes|best|thanks(?: again)?|thank you|"
+    r"many thanks|cheers|sincerely|yours (?:truly|sincerely))\s*[,.!]?\s*$",
+    re.IGNORECASE,
+)
+
+
+class CleanEmail:
+    """A message body reduced to its new content."""
+
+    def __init__(self, text, original_chars, removed, truncated):
+        self.text = text
+        self.original_chars = original_chars
+        self.removed = removed
+        self.truncated = truncated
+
+    def summary(self):
+        """Sizes and removed parts, for logs and responses."""
+        return {"original_chars": self.original_chars, "kept_chars": len(self.text),
+                "removed": self.removed, "truncated": self.truncated}
+
+
+# ----------------------
+# Steps
+# ----------------------
+def html_to_text(body):
+    """Text of an HTML body without its quoted reply blocks."""
+    quote = _HTML_QUOTE.search(body)
+    if quote:
+        body = body[:quote.start()]
+    body = _HTML_DROP.sub("", body)
+    body = _HTML_BREAK.sub("\n", body)
+    return html.unescape(_HTML_TAG.sub("", body))
+
+
+def _reply_header(lines, i):
+    """Kind of thread header starting at line i ("quoted", "forwarded"), or None."""
+    line = lines[i]
+    if _FORWARD.match(line):
+        return "forwarded"
+    if _WROTE.match(line) or _ORIGINAL.match(line):
+        return "quoted"
+    # "On <date>, <name> <address>" wrapped before "wrote:"
+    if line.lstrip().lower().startswith("on ") and i + 1 < len(lines) and lines[i + 1].rstrip().endswith("wrote:"):
+        return "quoted"
+    # Outlook: an optional rule, then From: followed by Sent:/Date: within a few lines
+    start = i + 1 if _RULE.match(line) else i
+    if start < len(lines) and lines[start].lstrip().lower().startswith("from:"):
+        if any(re.match(r"^\s*(?:sent|date):", l, re.IGNORECASE) for l in lines[start + 1:start + 4]):
+            return "quoted"
+    return None
+
+
+def _forwarded_body(lines):
+    """Lines of a forwarded message after its header block."""
+    i = 0
+    while i < len(lines) and (not lines[i].strip() or _HEADER.match(lines[i])):
+        i += 1
+    return lines[i:]
+
+
+def strip_thread(lines, removed):
+    """Lines before the first reply or forward header, without ">" quotes."""
+    for i in range(len(lines)):
+        kind = _reply_header(lines, i)
+        if kind is None:
+            continue
+        own = [l for l in lines[:i] if l.strip()]
+        if kind == "forwarded" and not own:
+            # Only a forward: the forwarded message is the content
+            removed.append("forwarded_headers")
+            return strip_thread(_forwarded_body(lines[i + 1:]), removed)
+        removed.append(kind)
+        lines = lines[:i]
+        break
+    kept = [l for l in lines if not l.lstrip().startswith(">")]
+    if len(kept) != len(lines):
+        removed.append("quoted")
+    return kept
+
+
+def _signature_block(tail):
+    """
+    True when the lines after a sign-off look like a name and contact block:
+    short, no quantities, no questions, not a sentence carried on from the
+    sign-off ("Best" / "price you can do on 20 bags?").
+    """
+    if tail and tail[0][0].islower():
+        return False
+    for line in tail:
+        if _CONTACT.match(line) or "@" in line:
+            continue
+        if len(line) > SIGNATURE_LINE_CHARS or re.search(r"\d", line) or line.endswith(("?", ":")):
+            return False
+    return True
+
+
+def strip_signature(lines, removed):
+    """Lines before a signature delimiter, device footer, disclaimer or closing sign-off."""
+    for i, line in enumerate(lines):
+        if _SIGNATURE.match(line) or _DEVICE.match(line):
+            removed.append("signature")
+            return lines[:i]
+        if _DISCLAIMER.match(line):
+            removed.append("disclaimer")
+            return lines[:i]
+        if _SIGN_OFF.match(line) and i > 0:
+            tail = [l.strip() for l in lines[i + 1:] if l.strip()]
+            if len(tail) <= SIGN_OFF_TAIL_LINES and _signature_block(tail):
+                removed.append("signature")
+                return lines[:i]
+    return lines
+
+
+def cap(text, max_chars):
+    """text cut to max_chars at a line or word boundary; (text, truncated)."""
+    if len(text) <= max_chars:
+        return text, False
+    cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return text[:cut].rstrip(), True
+
+
+# ----------------------
+# Public API
+# ----------------------
+def clean(body, max_chars=None):
+    """The new content of an email body as a CleanEmail."""
+    body = body if isinstance(body, str) else ""
+    removed = []
+    text = body.replace("\r\n", "\n").replace("\r", "\n")
+    if _HTML.search(text):
+        text = html_to_text(text)
+        removed.append("html")
+    lines = strip_signature(strip_thread(text.split("\n"), removed), removed)
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(l.rstrip() for l in lines)).strip()
+    if not text and body.strip() and "quoted" not in removed:
+        text = body.strip()  # only a signature-like line: better the whole body than nothing
+        removed = []
+    text, truncated = cap(text, MAX_CHARS if max_chars is None else max_chars)
+    metrics.inc("email_preprocess_chars_total", len(body), stage="original")
+    metrics.inc("email_preprocess_chars_total", len(text), stage="kept")
+    return CleanEmail(text, len(body), sorted(set(removed)), truncated)
+
+
+def sender_address(sender):
+    """Lowercased address from a From value such as 'Jane <jane@example.com>'."""
+    sender = sender if isinstance(sender, str) else ""
+    match = re.search(r"<([^>]+)>", sender)
+    return (match.group(1) if match else sender).strip().lower()
+
+
+def fingerprint(sender, text, *context):
+    """Stable id of a message: its sender's address, its cleaned text (case and spacing ignored) and context."""
+    payload = json.dumps(
+        [sender_address(sender), re.sub(r"\s+", " ", text).strip().lower(), list(context)],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
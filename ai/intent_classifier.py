@@ -0,0 +1,178 @@
+"""
+Local intent classifier for the /ai router.
+
+A multinomial naive Bayes model over unigram and bigram features of the
+normalized query, trained on first use from intent_queries.jsonl (one
+{"query": ..., "intent": ...} object per line). classify() returns the
+intent, a confidence score and the product the query is about, so the
+router only needs Gemini for queries the model is unsure about.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+TRAINING_FILE = os.getenv(
+    "INTENT_TRAINING_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_queries.jsonl")
+)
+CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.6))
+SMOOTHING = 0.5
+
+INTENTS = ("demand", "optimize", "best_supplier", "negotiate", "supply", "fallback")
+
+# Words that describe the intent rather than the product; removed when
+# the product slot has to be guessed from the query itself.
+INTENT_WORDS = {
+    "predict", "prediction", "forecast", "forecasting", "demand", "next", "month", "week", "sales", "sell",
+    "optimize", "optimise", "order", "reorder", "restock", "how", "much", "many", "should", "we", "i",
+    "best", "supplier", "suppliers", "vendor", "vendors", "who", "is", "are", "the", "top", "find",
+    "negotiate", "negotiation", "email", "mail", "write", "to", "price", "discount", "supply", "check",
+    "stock", "level", "levels", "for", "of", "on", "a", "an", "what", "will", "be", "please", "me", "our",
+    "give", "show", "get", "do", "need", "can", "you", "about", "with", "and", "units", "buy",
+    "sells", "sell", "near", "where", "wholesale", "bulk", "which", "company", "in",
+}
+
+_PUNCT_RE = re.compile(r"[^a-z0-9\s\-]")
+_SPACE_RE = re.compile(r"\s+")
+_TAIL_RE = re.compile(r"\b(?:for|of|on|about)\s+(.+)$")
+_FILLER_RE = re.compile(r"\b(?:next month|this month|next week|please|now|today|asap)\b")
+
+
+def normalize_text(text: str) -> str:
+    text = _PUNCT_RE.sub(" ", (text or "").lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def features(normalized: str):
+    tokens = normalized.split()
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+@dataclass
+class IntentResult:
+    intent: str
+    confidence: float
+    product: str = ""
+    scores: dict = field(default_factory=dict)
+
+
+class IntentClassifier:
+    """Naive Bayes over n-gram features with precomputed log probabilities."""
+
+    def __init__(self, examples):
+        class_counts = Counter()
+        feature_counts = defaultdict(Counter)
+        vocabulary = set()
+        for query, intent in examples:
+            feats = features(normalize_text(query))
+            class_counts[intent] += 1
+            feature_counts[intent].update(feats)
+            vocabulary.update(feats)
+
+        total = sum(class_counts.values())
+        vocab_size = len(vocabulary)
+        self.intents = sorted(class_counts)
+        self.log_prior = {c: math.log(class_counts[c] / total) for c in self.intents}
+        self.log_likelihood = {}
+        self.log_unseen = {}
+        for c in self.intents:
+            denominator = sum(feature_counts[c].values()) + SMOOTHING * vocab_size
+            self.log_unseen[c] = math.log(SMOOTHING / denominator)
+            self.log_likelihood[c] = {
+                f: math.log((n + SMOOTHING) / denominator) for f, n in feature_counts[c].items()
+            }
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_file(cls, path=TRAINING_FILE):
+        examples = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    examples.append((row["query"], row["intent"]))
+        return cls(examples)
+
+    def scores(self, normalized):
+        # Features never seen in training carry no evidence either way
+        feats = [f for f in features(normalized) if f in self.vocabulary]
+        log_scores = {
+            c: self.log_prior[c] + sum(self.log_likelihood[c].get(f, self.log_unseen[c]) for f in feats)
+            for c in self.intents
+        }
+        top = max(log_scores.values())
+        exp_scores = {c: math.exp(v - top) for c, v in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {c: v / norm for c, v in exp_scores.items()}, len(feats)
+
+    def classify(self, query, product_names=None):
+        normalized = normalize_text(query)
+        probabilities, known = self.scores(normalized)
+        intent = max(probabilities, key=probabilities.get)
+        confidence = probabilities[intent] if known else 0.0
+        return IntentResult(
+            intent=intent,
+            confidence=round(confidence, 4),
+            product=extract_product(normalized, product_names),
+            scores={c: round(p, 4) for c, p in probabilities.items()},
+        )
+
+
+def extract_product(normalized, product_names=None):
+    """
+    Find the product slot in a normalized query: the longest known product
+    name it mentions, else the "for/of/on <product>" tail, else whatever is
+    left once intent words are removed.
+    product_names maps normalized names to the names as stored in stock.
+    """
+    if product_names:
+        padded = f" {normalized} "
+        matches = [name for name in product_names if name and f" {name} " in padded]
+        if matches:
+            return product_names[max(matches, key=len)]
+
+    tail = _TAIL_RE.search(normalized)
+    if tail:
+        candidate = _SPACE_RE.sub(" ", _FILLER_RE.sub(" ", tail.group(1))).strip()
+        if candidate:
+            return candidate
+
+    leftover = [t for t in _FILLER_RE.sub(" ", normalized).split() if t not in INTENT_WORDS]
+    return " ".join(leftover)
+
+
+def catalog_names(stock_data):
+    """{normalized name: stored name} for the products in a stock_data payload."""
+    names = {}
+    for row in stock_data or []:
+        for key in ("product_name", "name"):
+            value = row.get(key) if isinstance(row, dict) else None
+            if isinstance(value, str) and value.strip():
+                names.setdefault(normalize_text(value), value.strip())
+    return names
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_classifier():
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier.from_file()
+    return _classifier
+
+
+def classify(query, product_names=None, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Classify query with the shared model. Results under threshold are
+    reported as "fallback" (the original best guess stays in .scores).
+    """
+    result = get_classifier().classify(query, product_names)
+    if result.confidence < threshold:
+        result.intent = "fallback"
+    return result
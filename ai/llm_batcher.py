@@ -0,0 +1,166 @@
+"""
+Micro-batching of per-product LLM insight prompts.
+
+An InsightBatcher collects insight requests for a short window (or until a
+size limit), sends them to Gemini as one structured multi-item prompt and
+splits the JSON answer back into per-item results. Items that are missing
+from the answer or fail to parse fall back to one individual call each.
+Per-item answers are written to the response cache under their individual
+prompts, so a later single request for the same item is a cache hit.
+Batches and fallback calls run on a pool as wide as the gateway's
+concurrency limit, each with the deadline of the request that submitted it.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import deadline
+from llm_gateway import DEFAULT_MODEL, MAX_CONCURRENCY, cache_response, cached_response, generate
+
+BATCH_WINDOW_S = float(os.getenv("LLM_BATCH_WINDOW_MS", 50)) / 1000
+BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", 25))
+
+logger = logging.getLogger(__name__)
+
+# The gateway's slots bound the model calls; this pool only has to keep that many in flight
+_call_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="llm-batch")
+
+
+def _budget(expires_at):
+    """Seconds left until expires_at, for generate(deadline=...)."""
+    return max(0.0, expires_at - time.time())
+
+
+def _parse_batch_answer(text):
+    """Pull the JSON object out of a model answer, tolerating markdown fences."""
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object in batch answer")
+    return json.loads(text[start:end + 1])
+
+
+class InsightBatcher:
+    """
+    Coalesces insight requests for one call site.
+
+    single_prompt(fields) builds the prompt for one item on its own.
+    render_item(fields) builds the item's block inside a batch prompt.
+    instructions is the shared task description placed once at the top
+    of a batch prompt.
+    """
+
+    def __init__(self, call_site, single_prompt, render_item, instructions,
+                 model=DEFAULT_MODEL, window_s=BATCH_WINDOW_S, max_items=BATCH_MAX_ITEMS):
+        self.call_site = call_site
+        self.single_prompt = single_prompt
+        self.render_item = render_item
+        self.instructions = instructions
+        self.model = model
+        self.window_s = window_s
+        self.max_items = max_items
+        self._pending = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def submit(self, fields):
+        """
+        Queue one item and return a Future for its insight text. The model
+        call gets the submitting request's remaining deadline.
+        """
+        future = Future()
+        cached = cached_response(self.single_prompt(fields), self.model, self.call_site)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        with self._cond:
+            self._pending.append((fields, future, deadline.current().expires_at))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"batch-{self.call_site}", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future
+
+    def insight(self, fields, timeout=None):
+        return self.submit(fields).result(timeout=timeout)
+
+    def insights_many(self, items, timeout=None):
+        """Submit every item at once and return their insights in order."""
+        futures = [self.submit(fields) for fields in items]
+        return [future.result(timeout=timeout) for future in futures]
+
+    # ----------------------
+    # Background loop
+    # ----------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                window_end = time.monotonic() + self.window_s
+                while len(self._pending) < self.max_items:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_items]
+                del self._pending[:self.max_items]
+            _call_pool.submit(self._dispatch_safe, batch)
+
+    def _dispatch_safe(self, batch):
+        try:
+            self._dispatch(batch)
+        except Exception as e:  # never leave a caller waiting
+            logger.error(f"Batch dispatch failed for {self.call_site}: {e}")
+            for fields, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _dispatch(self, batch):
+        if len(batch) == 1:
+            self._single(*batch[0])
+            return
+
+        blocks = "\n\n".join(
+            f"### Item {i}\n{self.render_item(fields)}" for i, (fields, _, _) in enumerate(batch, start=1)
+        )
+        prompt = (
+            f"{self.instructions}\n\n"
+            f"Answer every item below independently.\n"
+            f"Return ONLY a JSON object whose keys are the item numbers as strings "
+            f"(\"1\" to \"{len(batch)}\") and whose values are the answer text for that item.\n\n"
+            f"{blocks}"
+        )
+
+        answers = {}
+        try:
+            answers = _parse_batch_answer(
+                generate(prompt, model=self.model, call_site=f"{self.call_site}_batch", cache=False,
+                         deadline=_budget(max(expires_at for _, _, expires_at in batch)))
+            )
+        except Exception as e:
+            logger.warning(f"Batched {self.call_site} call for {len(batch)} items failed: {e}")
+
+        for i, (fields, future, expires_at) in enumerate(batch, start=1):
+            answer = answers.get(str(i)) if isinstance(answers, dict) else None
+            if isinstance(answer, str) and answer.strip():
+                answer = answer.strip()
+                cache_response(self.single_prompt(fields), self.model, self.call_site, answer)
+                future.set_result(answer)
+            else:
+                _call_pool.submit(self._single, fields, future, expires_at)
+
+    def _single(self, fields, future, expires_at):
+        try:
+            future.set_result(generate(self.single_prompt(fields), model=self.model, call_site=self.call_site,
+                                       deadline=_budget(expires_at)))
+        except Exception as e:
+            future.set_exception(e)
@@ -0,0 +1,212 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed by a hash of the model name, the whitespace-normalized
+prompt and the generation settings. Lookups go to an in-memory LRU first
+and a SQLite file second; concurrent misses for the same key are coalesced
+so only one caller goes upstream while the others wait for its answer.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import deadline
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+MAX_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2048))
+
+# Seconds each call site may reuse an answer; 0 disables caching.
+# Override per site with LLM_CACHE_TTL_<CALL_SITE>, e.g. LLM_CACHE_TTL_AI_FALLBACK=600
+CALL_SITE_TTLS = {
+    "ai_fallback": 24 * 3600,
+    "order_insight": 6 * 3600,
+    "supplier_insight": 6 * 3600,
+    "demand_insight": 3600,
+    "auto_reply": 0,
+    "negotiation_email": 0,
+}
+
+
+def ttl_for(call_site):
+    override = os.getenv(f"LLM_CACHE_TTL_{call_site.upper()}")
+    if override is not None:
+        return float(override)
+    return CALL_SITE_TTLS.get(call_site, 0)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def cache_key(model, prompt, generation_config=None):
+    payload = json.dumps(
+        [model, normalize_prompt(prompt), generation_config or {}],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache with single-flight misses."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0,
+                          "wait_timeouts": 0}
+        self._db_lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    # ---- tiers ----
+    def _memory_get(self, key, now):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < now:
+            return None
+        return row
+
+    def _disk_put(self, key, value, expires_at):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+    # ---- public API ----
+    def get(self, key):
+        """Return a fresh cached value without computing on a miss."""
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+            if value is not None:
+                self._counters["memory_hits"] += 1
+                return value
+        row = self._disk_get(key, now)
+        if row is None:
+            return None
+        with self._lock:
+            self._memory_put(key, row[0], row[1])
+            self._counters["disk_hits"] += 1
+        return row[0]
+
+    def put(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+        self._disk_put(key, value, expires_at)
+
+    def get_or_compute(self, key, ttl, compute, timeout=None):
+        """
+        Return the cached value for key, or compute it once and cache it for
+        ttl seconds. A caller that finds the same key being computed waits
+        for that result up to timeout seconds (default: the request's
+        remaining deadline), then computes it itself.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self._counters["misses"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=deadline.remaining() if timeout is None else timeout)
+            except FutureTimeout:
+                with self._lock:
+                    self._counters["wait_timeouts"] += 1
+                value = compute()
+                self.put(key, value, ttl)
+                return value
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        self._disk_put(key, value, expires_at)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"] + counters["coalesced"]
+        counters["hit_ratio"] = round((lookups - counters["misses"]) / lookups, 3) if lookups else 0.0
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide response cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,449 @@
+"""
+Shared gateway for every Gemini call made by the agents.
+
+All services go through generate() instead of building their own
+GenerativeModel per request. The gateway keeps one model object per model
+name, caps in-flight calls per process, paces requests with a token bucket
+that backs off when Gemini answers 429, enforces a deadline per call, hedges
+slow attempts and records latency and token counts per call site.
+Answers for call sites with a cache TTL (see llm_cache.CALL_SITE_TTLS) are
+served from the shared response cache.
+
+Tests and benchmarks can swap the real SDK for a local fake with
+set_model_factory(); the fake only needs a generate_content(prompt) method
+returning an object with a .text attribute.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import tracing
+from llm_cache import cache_key, get_cache, ttl_for
+
+DEFAULT_MODEL = "gemini-2.0-flash-001"
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", 5))
+BURST = int(os.getenv("LLM_BURST", 10))
+DEFAULT_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", 20))
+HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", 4))
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+BACKOFF_BASE_S = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Raised when the model could not produce an answer."""
+
+
+class LLMTimeout(LLMError):
+    """Raised when a call ran past its deadline."""
+
+# ----------------------
+# Rate limiting
+# ----------------------
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate halves on every throttle response and
+    creeps back up (additive increase) on every success.
+    """
+
+    def __init__(self, rate, burst, min_rate=0.2):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout):
+        """Take one token, waiting up to timeout seconds. Returns False on timeout."""
+        end = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_s = (1 - self.tokens) / self.rate
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(wait_s, remaining))
+
+    def on_throttle(self):
+        with self._cond:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+
+    def on_success(self):
+        with self._cond:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+                self._cond.notify_all()
+
+
+_bucket = AdaptiveTokenBucket(RATE_PER_SEC, BURST)
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_attempt_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY * 2, thread_name_prefix="llm")
+
+# ----------------------
+# Model objects
+# ----------------------
+_models = {}
+_models_lock = threading.Lock()
+_model_factory = None
+_configured = False
+
+
+def _genai():
+    global _configured
+    import google.generativeai as genai
+
+    if not _configured:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise LLMError("GEMINI_API_KEY not found in environment")
+        genai.configure(api_key=api_key)
+        _configured = True
+    return genai
+
+
+def _default_factory(model_name):
+    return _genai().GenerativeModel(model_name)
+
+
+def list_models():
+    """Names of the models available to the configured API key."""
+    return [model.name for model in _genai().list_models()]
+
+
+def set_model_factory(factory):
+    """Replace the model constructor (e.g. with a local fake) and drop cached models."""
+    global _model_factory
+    with _models_lock:
+        _model_factory = factory
+        _models.clear()
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """Return the cached model object for model_name, creating it once."""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = (_model_factory or _default_factory)(model_name)
+            _models[model_name] = model
+        return model
+
+# ----------------------
+# Metrics
+# ----------------------
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.throttled = 0
+        self.retries = 0
+        self.hedges = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies_ms = deque(maxlen=1000)
+
+
+_stats = defaultdict(_CallStats)
+_stats_lock = threading.Lock()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def stats():
+    """Snapshot of per-call-site counters, latency percentiles and cache counters."""
+    with _stats_lock:
+        calls = {
+            site: {
+                "calls": s.calls,
+                "errors": s.errors,
+                "timeouts": s.timeouts,
+                "throttled": s.throttled,
+                "retries": s.retries,
+                "hedges": s.hedges,
+                "prompt_tokens": s.prompt_tokens,
+                "output_tokens": s.output_tokens,
+                "latency_ms_p50": round(_percentile(s.latencies_ms, 50), 1),
+                "latency_ms_p95": round(_percentile(s.latencies_ms, 95), 1),
+                "rate_limit_per_sec": round(_bucket.rate, 3),
+            }
+            for site, s in _stats.items()
+        }
+    return {"calls": calls, "cache": get_cache().stats()}
+
+
+def _record(call_site, **increments):
+    with _stats_lock:
+        s = _stats[call_site]
+        for key, value in increments.items():
+            if key == "latency_ms":
+                s.latencies_ms.append(value)
+            else:
+                setattr(s, key, getattr(s, key) + value)
+    if "latency_ms" in increments:
+        metrics.observe("stage_seconds", increments["latency_ms"] / 1000, stage="llm", call_site=call_site)
+    if increments.get("errors"):
+        metrics.inc("stage_errors_total", increments["errors"], stage="llm", call_site=call_site)
+
+
+def _metric_samples():
+    """
+    Gateway and cache counters for the /metrics endpoint, grouped by metric
+    name since the exposition format needs each family in one block.
+    """
+    samples = []
+    with _stats_lock:
+        for field in ("calls", "timeouts", "throttled", "retries", "hedges", "prompt_tokens", "output_tokens"):
+            for site, s in _stats.items():
+                samples.append((f"llm_{field}_total", {"call_site": site}, getattr(s, field)))
+    for field, value in get_cache().stats().items():
+        if field == "memory_entries":
+            samples.append(("llm_cache_memory_entries", {}, value))
+        elif field != "hit_ratio":
+            samples.append((f"llm_cache_{field}_total", {}, value))  # monotonic: hits, misses, evictions
+    samples.append(("llm_rate_limit_per_second", {}, round(_bucket.rate, 3)))
+    return samples
+
+
+metrics.register_collector(_metric_samples)
+
+# ----------------------
+# Error classification
+# ----------------------
+def _is_throttle(exc):
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    return code == 429 or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(exc)
+
+
+def _is_retryable(exc):
+    if _is_throttle(exc):
+        return True
+    transient = ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+                 "GatewayTimeout", "ConnectionError", "Timeout", "TimeoutError")
+    return type(exc).__name__ in transient or isinstance(exc, (ConnectionError, TimeoutError))
+
+# ----------------------
+# Calls
+# ----------------------
+def _call_model(model, prompt, generation_config):
+    if generation_config:
+        response = model.generate_content(prompt, generation_config=generation_config)
+    else:
+        response = model.generate_content(prompt)
+    usage = getattr(response, "usage_metadata", None)
+    return (
+        response.text,
+        getattr(usage, "prompt_token_count", 0) or 0,
+        getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+def generate(prompt, model=DEFAULT_MODEL, call_site="default", deadline=None, generation_config=None,
+             cache=True):
+    """
+    Generate text for prompt and return it.
+    deadline is the total time budget in seconds for all attempts, including
+    waiting for a rate-limit token or a concurrency slot. Raises LLMTimeout
+    when it runs out and LLMError on non-retryable failures.
+    Pass cache=False to always go upstream.
+    """
+    ttl = ttl_for(call_site) if cache else 0
+    with tracing.span("llm", call_site=call_site, model=model):
+        if ttl > 0:
+            key = cache_key(model, prompt, generation_config)
+            return get_cache().get_or_compute(
+                key, ttl, lambda: _generate_uncached(prompt, model, call_site, deadline, generation_config),
+                timeout=deadline,
+            )
+        return _generate_uncached(prompt, model, call_site, deadline, generation_config)
+
+
+def cached_response(prompt, model=DEFAULT_MODEL, call_site="default"):
+    """Return a cached answer for this prompt, or None. Never calls the model."""
+    ttl = ttl_for(call_site)
+    if ttl <= 0:
+        return None
+    return get_cache().get(cache_key(model, prompt))
+
+
+def cache_response(prompt, model, call_site, text):
+    """Store an answer obtained elsewhere (e.g. from a batched prompt) under this prompt."""
+    ttl = ttl_for(call_site)
+    if ttl > 0:
+        get_cache().put(cache_key(model, prompt), text, ttl)
+
+
+def _generate_uncached(prompt, model, call_site, deadline, generation_config):
+    deadline = DEFAULT_DEADLINE_S if deadline is None else deadline
+    start = time.monotonic()
+    end = start + deadline
+    model_obj = get_model(model)
+    _record(call_site, calls=1)
+
+    pending = set()
+    attempts = 0
+    last_exc = None
+
+    def launch(hedge=False):
+        """Start one attempt. Hedges never wait for a token or slot; they are skipped instead."""
+        nonlocal attempts
+        remaining = 0.0 if hedge else end - time.monotonic()
+        if not _bucket.acquire(max(0.0, remaining)):
+            if hedge:
+                return False
+            raise LLMTimeout(f"{call_site}: no rate-limit token within deadline")
+        if not _slots.acquire(timeout=max(0.0, end - time.monotonic()) if not hedge else 0):
+            if hedge:
+                return False
+            raise LLMTimeout(f"{call_site}: no concurrency slot within deadline")
+        future = _attempt_pool.submit(_call_model, model_obj, prompt, generation_config)
+        future.add_done_callback(lambda _: _slots.release())
+        pending.add(future)
+        attempts += 1
+        return True
+
+    try:
+        launch()
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout(f"{call_site}: deadline of {deadline}s exceeded")
+            can_hedge = attempts < MAX_ATTEMPTS and len(pending) == 1 and remaining > HEDGE_AFTER_S
+            done, pending = wait(pending, timeout=HEDGE_AFTER_S if can_hedge else remaining,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                if can_hedge and launch(hedge=True):
+                    _record(call_site, hedges=1)
+                continue
+
+            for future in done:
+                exc = future.exception()
+                if exc is None:
+                    text, prompt_tokens, output_tokens = future.result()
+                    _bucket.on_success()
+                    _record(call_site, prompt_tokens=prompt_tokens, output_tokens=output_tokens,
+                            latency_ms=(time.monotonic() - start) * 1000)
+                    return text
+                last_exc = exc
+                if _is_throttle(exc):
+                    _record(call_site, throttled=1)
+                    _bucket.on_throttle()
+                elif not _is_retryable(exc):
+                    raise LLMError(f"{call_site}: {exc}") from exc
+
+            if not pending:
+                if attempts >= MAX_ATTEMPTS:
+                    break
+                backoff = BACKOFF_BASE_S * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+                if time.monotonic() + backoff >= end:
+                    raise LLMTimeout(f"{call_site}: deadline of {deadline}s exceeded") from last_exc
+                time.sleep(backoff)
+                _record(call_site, retries=1)
+                launch()
+
+        raise LLMError(f"{call_site}: {last_exc}") from last_exc
+
+    except LLMTimeout:
+        _record(call_site, errors=1, timeouts=1, latency_ms=(time.monotonic() - start) * 1000)
+        logger.warning(f"LLM call timed out at {call_site} after {attempts} attempt(s)")
+        raise
+    except LLMError:
+        _record(call_site, errors=1, latency_ms=(time.monotonic() - start) * 1000)
+        raise
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text or ""
+    except ValueError:  # chunk without text parts (e.g. only safety metadata)
+        return ""
+
+
+def generate_stream(prompt, model=DEFAULT_MODEL, call_site="default", deadline=None):
+    """
+    Yield the answer to prompt in pieces as Gemini streams it.
+    A cached answer is yielded in one piece. Failures before the first piece
+    are retried like generate(); after text has been yielded they are raised
+    as LLMError, since the caller has already forwarded part of the answer.
+    """
+    cached = cached_response(prompt, model, call_site)
+    if cached is not None:
+        yield cached
+        return
+
+    deadline = DEFAULT_DEADLINE_S if deadline is None else deadline
+    start = time.monotonic()
+    end = start + deadline
+    model_obj = get_model(model)
+    _record(call_site, calls=1)
+    attempts = 0
+
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0 or not _bucket.acquire(remaining) \
+                or not _slots.acquire(timeout=max(0.0, end - time.monotonic())):
+            _record(call_site, errors=1, timeouts=1, latency_ms=(time.monotonic() - start) * 1000)
+            raise LLMTimeout(f"{call_site}: no capacity within deadline")
+        attempts += 1
+        parts = []
+        usage = None
+        try:
+            for chunk in model_obj.generate_content(prompt, stream=True):
+                if time.monotonic() > end:
+                    raise LLMTimeout(f"{call_site}: deadline of {deadline}s exceeded while streaming")
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                text = _chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        except LLMTimeout:
+            _record(call_site, errors=1, timeouts=1, latency_ms=(time.monotonic() - start) * 1000)
+            raise
+        except Exception as exc:
+            if _is_throttle(exc):
+                _record(call_site, throttled=1)
+                _bucket.on_throttle()
+            backoff = BACKOFF_BASE_S * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            if parts or not _is_retryable(exc) or attempts >= MAX_ATTEMPTS \
+                    or time.monotonic() + backoff >= end:
+                _record(call_site, errors=1, latency_ms=(time.monotonic() - start) * 1000)
+                raise LLMError(f"{call_site}: {exc}") from exc
+            _record(call_site, retries=1)
+            time.sleep(backoff)
+            continue
+        finally:
+            _slots.release()
+
+        _bucket.on_success()
+        _record(call_site,
+                prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+                output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+                latency_ms=(time.monotonic() - start) * 1000)
+        cache_response(prompt, model, call_site, "".join(parts))
+        return
@@ -0,0 +1,219 @@
+"""
+Shared logging setup for the agents.
+
+configure() sends every record through a QueueHandler, so request threads
+only enqueue; a QueueListener thread formats and writes them. Records are
+written as one JSON object per line to a size-rotated file, with long
+fields truncated and the current trace id attached. Identical messages
+beyond LOG_RATE_LIMIT per LOG_RATE_WINDOW_S are dropped and the number
+dropped is reported on the next one let through.
+
+Each record's "service" is the Flask app it was logged in (services.init_app
+sets it), so the agents mounted in one serve.py combined process stay
+apart; outside a request it is the service that configured logging first.
+Processes forked from the configuring one (gunicorn workers) write to
+their own "<name>.<pid>" file, since several processes rotating one file
+lose records.
+
+Log request payloads with payload_summary(), which keeps counts, sizes and
+a hash instead of the contents:
+
+    logger.info("/ai received", extra={"payload": payload_summary(data)})
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+import tracing
+
+LOG_DIR = os.getenv("LOG_DIR", ".")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 5))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", 1000))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW_S = float(os.getenv("LOG_RATE_WINDOW_S", 60))
+LOG_TO_STDERR = os.getenv("LOG_TO_STDERR", "") == "1"
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(value, limit=LOG_MAX_FIELD_CHARS):
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= limit:
+        return value
+    return f"{text[:limit]}...[{len(text) - limit} more chars]"
+
+
+def payload_summary(payload):
+    """Shape of a request payload: list lengths, key names, byte size and a short hash."""
+    raw = json.dumps(payload, sort_keys=True, default=str).encode()
+    summary = {"bytes": len(raw), "sha256": hashlib.sha256(raw).hexdigest()[:12]}
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            if isinstance(value, (list, dict)):
+                summary[f"{key}_count"] = len(value)
+            elif isinstance(value, str):
+                summary[f"{key}_chars"] = len(value)
+    elif isinstance(payload, list):
+        summary["count"] = len(payload)
+    return summary
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "service": getattr(record, "service", None) or self.service,
+            "logger": record.name,
+            "msg": truncate(record.getMessage()),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = truncate(value)
+        if record.exc_text:
+            entry["exc"] = truncate(record.exc_text, LOG_MAX_FIELD_CHARS * 4)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `limit` records per message template and level per window."""
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window_s=LOG_RATE_WINDOW_S):
+        super().__init__()
+        self.limit = limit
+        self.window_s = window_s
+        self._counts = {}  # key -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg)[:200])
+        now = time.monotonic()
+        with self._lock:
+            window = self._counts.get(key)
+            if window is None or now - window[0] >= self.window_s:
+                suppressed = window[2] if window else 0
+                window = self._counts[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                if len(self._counts) > 10000:
+                    self._counts = {key: window}
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class _TraceFilter(logging.Filter):
+    def filter(self, record):
+        span = tracing.current_span()  # runs in the caller's thread, before the record is queued
+        if span is not None:
+            record.trace_id = span.trace_id
+        return True
+
+
+class _ServiceFilter(logging.Filter):
+    def filter(self, record):
+        if has_app_context():  # runs in the caller's thread, like _TraceFilter
+            record.service = current_app.config.get("SERVICE_NAME")
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        """Render the message and traceback now, but leave the JSON formatting to the listener."""
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+def _start_listener(handlers):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()  # flushes whatever is still queued
+
+
+def _file_handler(path, service):
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8", delay=True,
+    )
+    handler.setFormatter(JsonFormatter(service))
+    return handler
+
+
+def _per_process(path):
+    """path with the process id before its extension: ai_router_logs.txt -> ai_router_logs.1234.txt."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{os.getpid()}{ext}"
+
+
+def configure(service, filename=None):
+    """
+    Route the root logger through the background listener, writing JSON
+    lines to LOG_DIR/filename (default "<service>_logs.txt"). Safe to call
+    more than once; later calls in the same process are ignored.
+    """
+    global _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            return
+        path = os.path.join(LOG_DIR, filename or f"{service}_logs.txt")
+        handlers = [_file_handler(path, service)]
+        if LOG_TO_STDERR:
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(JsonFormatter(service))
+            handlers.append(stream_handler)
+
+        _queue_handler = _QueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(RateLimitFilter())
+        _queue_handler.addFilter(_TraceFilter())
+        _queue_handler.addFilter(_ServiceFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _start_listener(handlers)
+        atexit.register(_stop_listener)
+        # The listener thread doesn't survive a fork (gunicorn preload); start a fresh one in the child,
+        # writing to the child's own file
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(
+                after_in_child=lambda: _start_listener([_file_handler(_per_process(path), service), *handlers[1:]])
+            )
@@ -0,0 +1,171 @@
+"""
+Low-overhead stage timers and counters, exposed in Prometheus text format.
+
+Wrap a stage with timed():
+
+    with metrics.timed("prophet"):
+        ...
+
+    @metrics.timed("serpapi")
+    def get_web_suppliers(...): ...
+
+Each stage feeds the stage_seconds histogram and, when it raises, the
+stage_errors_total counter, and is recorded as a tracing span. init_app(app, service) adds a request latency
+histogram per route and serves everything at /metrics. With
+METRICS_SAMPLE_RATE below 1 only that fraction of stage timings is
+recorded; errors are always counted. Under gunicorn every worker keeps its
+own registry, so /metrics shows the worker that answered the scrape
+(the pid label tells them apart).
+"""
+import bisect
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+
+import tracing
+
+SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", 1.0))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_help = {
+    "stage_seconds": ("histogram", "Time spent in each processing stage."),
+    "stage_errors_total": ("counter", "Stages that raised an exception."),
+    "http_request_seconds": ("histogram", "Request latency per route."),
+    "http_requests_total": ("counter", "Requests per route and status code."),
+}
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """Add one observation to a histogram."""
+    key = _key(name, labels)
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        row[index] += 1
+        row[-1] += seconds
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def describe(name, kind, help_text):
+    """Register the TYPE and HELP lines for a metric."""
+    _help[name] = (kind, help_text)
+
+
+def register_collector(collect):
+    """
+    Add a function called on every scrape that returns extra samples as
+    (name, labels dict, value) tuples, e.g. counters kept by another module.
+    """
+    _collectors.append(collect)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time a block (or, as a decorator, a function) as stage, inside a trace span of the same name."""
+    sampled = SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE
+    start = time.perf_counter()
+    with tracing.span(stage, **labels):
+        try:
+            yield
+        except Exception:
+            inc("stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            if sampled:
+                observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+# ----------------------
+# Exposition
+# ----------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _header(lines, seen, name, default_kind):
+    if name in seen:
+        return
+    seen.add(name)
+    kind, help_text = _help.get(name, (default_kind, ""))
+    if help_text:
+        lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    pid = (("pid", str(os.getpid())),)
+    with _lock:
+        histograms = {key: list(row) for key, row in _histograms.items()}
+        counters = dict(_counters)
+
+    lines, seen = [], set()
+    for (name, labels), row in sorted(histograms.items()):
+        _header(lines, seen, name, "histogram")
+        labels = labels + pid
+        cumulative = 0
+        for bound, count in zip(BUCKETS, row):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+        cumulative += row[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {row[-1]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    for (name, labels), value in sorted(counters.items()):
+        _header(lines, seen, name, "counter")
+        lines.append(f"{name}{_format_labels(labels + pid)} {value}")
+
+    for collect in _collectors:
+        for name, labels, value in collect():
+            _header(lines, seen, name, "counter" if name.endswith("_total") else "gauge")
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())) + pid)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app, service):
+    """Time every request by route and serve /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        request.environ["metrics.start"] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = request.environ.get("metrics.start")
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        if start is not None and route != "/metrics":
+            observe("http_request_seconds", time.perf_counter() - start, service=service, route=route)
+            inc("http_requests_total", service=service, route=route, status=response.status_code)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_handler():
+        return Response(render(), content_type=CONTENT_TYPE)
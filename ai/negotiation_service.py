@@ -8,10 +8,16 @@ import os
 from dotenv import load_dotenv
 import logging
 import re
-import google.generativeai as genai
+from llm_gateway import generate
+import deadline
+import log_setup
+import metrics
+import services
+import tracing
+import wire_format
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+log_setup.configure("negotiation", "negotiation_service_logs.txt")
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -23,19 +29,16 @@ MAILTRAP_PASSWORD = os.getenv("MAILTRAP_PASSWORD")
 MAILTRAP_API_TOKEN = os.getenv("MAILTRAP_API_TOKEN")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "buyer@wac.com")
 MAILTRAP_INBOX_ID = os.getenv("MAILTRAP_INBOX_ID", "4122577")
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-##unit_testing
-for model in genai.list_models():
-    print(model.name)
 
 # Initialize Flask app
 app = Flask(__name__)
+deadline.init_app(app, budget_s=10)
+services.init_app(app, "negotiation")
+tracing.init_app(app, "negotiation")
+metrics.init_app(app, "negotiation")
+wire_format.init_app(app)
 CORS(app)
 
-# Logging
-logging.basicConfig(filename='negotiation_service_logs.txt', level=logging.INFO)
-
 # Mock LLM function
 def generate_negotiation_email(product_name, supplier, user_request):
     """
@@ -51,24 +54,31 @@ def generate_negotiation_email(product_name, supplier, user_request):
         f"Include a subject line and sign it as 'Supply Manager, NexxaBiz'."
     )
 
+    if not deadline.allows("llm"):
+        deadline.skip("llm")
+        return template_negotiation_email(product_name, company_name, user_request)
+
     try:
-        model = genai.GenerativeModel("models/gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        email_content = response.text.strip()
+        email_content = generate(prompt, model="models/gemini-2.5-flash", call_site="negotiation_email",
+                                 deadline=deadline.remaining()).strip()
         logger.info("Gemini email generated successfully.")
         return email_content
 
     except Exception as e:
         logger.error(f"Gemini API Error: {e}")
         # fallback text if Gemini API fails
-        return (
-            f"Subject: Inquiry About {product_name} Pricing and Terms\n\n"
-            f"Dear {company_name} Team,\n\n"
-            f"I hope this message finds you well. I am reaching out regarding {product_name}. "
-            f"We are interested in {user_request.lower()}. Could you please share your best pricing, "
-            f"bulk discounts, and delivery terms?\n\n"
-            f"Best regards,\nSupply Manager\nNexxaBiz\n{SENDER_EMAIL}"
-        )
+        return template_negotiation_email(product_name, company_name, user_request)
+
+
+def template_negotiation_email(product_name, company_name, user_request):
+    return (
+        f"Subject: Inquiry About {product_name} Pricing and Terms\n\n"
+        f"Dear {company_name} Team,\n\n"
+        f"I hope this message finds you well. I am reaching out regarding {product_name}. "
+        f"We are interested in {user_request.lower()}. Could you please share your best pricing, "
+        f"bulk discounts, and delivery terms?\n\n"
+        f"Best regards,\nSupply Manager\nNexxaBiz\n{SENDER_EMAIL}"
+    )
 
 def send_email(to_email, subject, body):
     """Send email via Mailtrap SMTP."""
@@ -79,7 +89,8 @@ def send_email(to_email, subject, body):
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'plain'))
 
-        with smtplib.SMTP(MAILTRAP_SMTP_HOST, MAILTRAP_SMTP_PORT) as server:
+        with metrics.timed("smtp"), \
+                smtplib.SMTP(MAILTRAP_SMTP_HOST, MAILTRAP_SMTP_PORT, timeout=deadline.timeout(10)) as server:
             server.starttls()
             server.login(MAILTRAP_USERNAME, MAILTRAP_PASSWORD)
             server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
@@ -89,11 +100,13 @@ def send_email(to_email, subject, body):
         logger.error(f"Failed to send email to {to_email}: {e}")
         return False
 
+@metrics.timed("mailtrap_poll")
 def parse_supplier_response(inbox_id=MAILTRAP_INBOX_ID):
     """Retrieve and parse supplier responses from Mailtrap inbox."""
     try:
         headers = {"Api-Token": MAILTRAP_API_TOKEN}
-        response = requests.get(f"https://mailtrap.io/api/v1/inboxes/{inbox_id}/messages", headers=headers)
+        response = requests.get(f"https://mailtrap.io/api/v1/inboxes/{inbox_id}/messages", headers=headers,
+                                timeout=deadline.timeout(5))
         response.raise_for_status()
         messages = response.json()
 
@@ -143,12 +156,17 @@ def negotiate():
             return jsonify({"error": "Failed to send negotiation email"}), 500
 
         # Optionally parse supplier responses (for demonstration)
-        response_status = parse_supplier_response()
+        if deadline.allows("mailtrap_poll"):
+            response_status = parse_supplier_response()
+        else:
+            deadline.skip("mailtrap_poll")
+            response_status = {"status": "skipped", "details": "Inbox check skipped to meet the response deadline."}
 
         return jsonify({
             "status": "email_sent",
             "email_content": email_content,
-            "response_status": response_status
+            "response_status": response_status,
+            "skipped_stages": deadline.skipped_stages()
         })
 
     except Exception as e:
@@ -156,4 +174,4 @@ def negotiate():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5003, debug=False)
+    app.run(host="127.0.0.1", port=services.port("negotiation"), debug=False)
@@ -1,70 +1,52 @@
-from flask import Flask, request, jsonify
-import pdfplumber
+from flask import Flask, request, jsonify, Response
+import json
+import os
+import time
 import logging
+import threading
 from flask_cors import CORS
-import re
-from rapidfuzz import process
-import firebase_admin
-from firebase_admin import credentials, firestore
+from pdf_order_parser import parse_order_pdf
+from pdf_jobs import get_job_queue, TERMINAL_STATES
+import log_setup
+import metrics
+import services
+import tracing
+import wire_format
 
 # Initialize Flask
 app = Flask(__name__)
 CORS(app)
+services.init_app(app, "order_generator")
+tracing.init_app(app, "order_generator")
+metrics.init_app(app, "order_generator")
+wire_format.init_app(app)
 
 # Logging
-logging.basicConfig(filename="order_generator_logs.txt", level=logging.INFO)
+log_setup.configure("order_generator", "order_generator_logs.txt")
 
-# Initialize Firebase Admin
-cred = credentials.Certificate('./firebaseKey.json')  # replace with your Firebase service key
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Firebase Admin, initialized on first use
+FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH", "./firebaseKey.json")  # your Firebase service key
+_db = None
+_db_lock = threading.Lock()
 
-# Helper functions
-def normalize_line(line: str) -> str:
-    """Normalize dash types and trim spaces."""
-    line = line.replace("–", "-").replace("—", "-")
-    line = re.sub(r"-{2,}", "-", line)  # collapse --- or ---- into a single -
-    return line.strip()
+def get_db():
+    global _db
+    with _db_lock:
+        if _db is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
 
+            firebase_admin.initialize_app(credentials.Certificate(FIREBASE_KEY_PATH))
+            _db = firestore.client()
+    return _db
 
+# Helper functions
+@metrics.timed("firestore")
 def fetch_products_from_firestore(user_id: str):
     """Fetch product names from Firestore for the current user."""
-    product_docs = db.collection("users").document(user_id).collection("products").stream()
+    product_docs = get_db().collection("users").document(user_id).collection("products").stream()
     return [doc.to_dict()["name"] for doc in product_docs]
 
-def fuzzy_match_product(name: str, firestore_products: list) -> str:
-    """Fuzzy match product name against Firestore product list."""
-    best_match, score, _ = process.extractOne(name, firestore_products)
-    if score > 80:  # threshold can be adjusted
-        return best_match
-    return None  # ignore unknown products
-
-def parse_product_line(line: str, firestore_products: list):
-    """Parse a line to extract product name and quantity."""
-    line = normalize_line(line)
-
-    # Case 1: "Product - Quantity"
-    if "-" in line:
-        parts = line.split("-")
-        if len(parts) == 2:
-            product_name = parts[0].strip()
-            qty_str = parts[1].strip()
-            qty = int(re.sub(r"\D", "", qty_str) or 0)
-            product_name = fuzzy_match_product(product_name, firestore_products)
-            if product_name and qty > 0:
-                return product_name, qty
-
-    # Case 2: "10 kg of Sugar" or "10 Sugar"
-    match = re.match(r"(\d+)\s*(\w*)\s*(?:of\s+)?(.+)", line, re.IGNORECASE)
-    if match:
-        qty = int(match.group(1))
-        product_name = match.group(3).strip()
-        product_name = fuzzy_match_product(product_name, firestore_products)
-        if product_name and qty > 0:
-            return product_name, qty
-
-    return None, None
-
 
 @app.route("/generate_order_from_pdf", methods=["POST"])
 def generate_order_from_pdf():
@@ -78,24 +60,9 @@ def generate_order_from_pdf():
         # Get Firestore products
         firestore_products = fetch_products_from_firestore(user_id)
 
-        # Extract text from PDF
-        text = ""
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-
-        lines = text.split("\n")
-        order_data = {"supplier": "", "products": []}
-
-        for line in lines:
-            line = normalize_line(line)
-            # Supplier
-            if "supplier:" in line.lower():
-                order_data["supplier"] = line.split(":")[1].strip()
-            else:
-                product_name, qty = parse_product_line(line, firestore_products)
-                if product_name and qty:
-                    order_data["products"].append({"name": product_name, "qty": qty})
+        # Extract order from PDF
+        with metrics.timed("pdf_parse"):
+            order_data = parse_order_pdf(file, firestore_products)
 
         return jsonify({
             "readable_text": "PDF parsed successfully!",
@@ -107,5 +74,72 @@ def generate_order_from_pdf():
         return jsonify({"error": str(e)}), 500
 
 
+# ----------------------
+# Bulk PDF job endpoints
+# ----------------------
+@app.route("/jobs/generate_order_from_pdf", methods=["POST"])
+def submit_pdf_jobs():
+    """Queue one or many PDFs for background parsing and return their job ids."""
+    try:
+        files = request.files.getlist("file") + request.files.getlist("files")
+        if not files or "user_id" not in request.form:
+            return jsonify({"error": "No file or user_id provided"}), 400
+
+        user_id = request.form["user_id"]
+        firestore_products = fetch_products_from_firestore(user_id)
+
+        queue = get_job_queue()
+        jobs = []
+        for file in files:
+            job_id = queue.submit(user_id, file.filename, file.read(), firestore_products)
+            jobs.append({"job_id": job_id, "filename": file.filename, "status": "queued"})
+
+        return jsonify({"jobs": jobs}), 202
+
+    except Exception as e:
+        logging.error(f"Error queueing PDF jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/jobs", methods=["GET"])
+def list_pdf_jobs():
+    user_id = request.args.get("user_id")
+    job_ids = [j for j in request.args.get("ids", "").split(",") if j]
+    limit = min(int(request.args.get("limit", 100)), 1000)
+    return jsonify({"jobs": get_job_queue().store.list(user_id=user_id, job_ids=job_ids, limit=limit)})
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_pdf_job(job_id):
+    job = get_job_queue().store.get(job_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_pdf_job(job_id):
+    """Server-Sent Events feed of a job's progress until it finishes."""
+    store = get_job_queue().store
+    if not store.get(job_id):
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+
+    def events():
+        last = None
+        while True:
+            job = store.get(job_id)
+            snapshot = (job["status"], job["pages_done"], job["total_pages"])
+            if snapshot != last:
+                last = snapshot
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+            if job["status"] in TERMINAL_STATES:
+                return
+            time.sleep(0.5)
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5004, debug=True)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_job_queue()  # resume unfinished jobs in the reloader's serving process
+    app.run(host="0.0.0.0", port=services.port("order_generator"), debug=True)
@@ -1,9 +1,18 @@
 from flask import Flask, request, jsonify
 import pandas as pd
 import logging
-import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+from llm_batcher import InsightBatcher
+from llm_gateway import generate_stream
+from streaming import ndjson_response
+import analytics_store
+import deadline
+import log_setup
+import metrics
+import services
+import stream_ingest
+import tracing
+import wire_format
 
 from flask_cors import CORS   # Allow frontend requests
 
@@ -11,17 +20,16 @@ from flask_cors import CORS   # Allow frontend requests
 # Setup
 # ----------------------
 app = Flask(__name__)
+deadline.init_app(app, budget_s=10)
+services.init_app(app, "order_optimizer")
+tracing.init_app(app, "order_optimizer")
+metrics.init_app(app, "order_optimizer")
+wire_format.init_app(app)
 CORS(app)  # enable CORS for frontend
-logging.basicConfig(filename="order_optimizer_logs.txt", level=logging.INFO)
+log_setup.configure("order_optimizer", "order_optimizer_logs.txt")
 
 # Load environment variables
-load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-
-print("Gemini API Key loaded:", gemini_api_key[:6], "…")
-genai.configure(api_key=gemini_api_key)
+load_dotenv()  # GEMINI_API_KEY is checked by llm_gateway on the first model call
 
 # ----------------------
 # Helper
@@ -29,97 +37,298 @@ genai.configure(api_key=gemini_api_key)
 def normalize_name(name: str) -> str:
     return name.strip().lower() if isinstance(name, str) else ""
 
+
+# Request body columns kept by stream_ingest; nested transactions are flattened to their items
+STOCK_COLUMNS = {"name": stream_ingest.NAME, "qty": stream_ingest.NUM}
+ITEM_COLUMNS = {"product_name": stream_ingest.NAME, "qty": stream_ingest.NUM}
+
+
+def read_payload(source, products_of):
+    """
+    Stream the request body into column buffers, keeping only rows for the
+    products products_of(fields) names (all when it returns None), or no
+    rows when the analytics store answers.
+    """
+    def plan(fields):
+        return stream_ingest.Filters(skip=source is not None, products=products_of(fields))
+    return stream_ingest.read_request(request, STOCK_COLUMNS, ITEM_COLUMNS, plan=plan)
+
+
+def query_product(query):
+    return query.lower().replace("optimize order for", "").strip()
+
+
+def _query_product(fields):
+    query = fields.get("query")
+    return [query_product(query)] if isinstance(query, str) and query else None
+
+
+@metrics.timed("dataframe")
+def build_frames(payload):
+    """DataFrames from the request's column buffers, with normalized name columns."""
+    df_stock = payload.stock.to_frame(normalized={"name": "name_norm"})
+    df_transactions = payload.items.to_frame(normalized={"product_name": "product_name_norm"})
+
+    # Filtering can leave no rows for the product: keep the columns compute_order_plan() reads
+    if "name_norm" not in df_stock.columns:
+        df_stock["name_norm"] = pd.Series(dtype=object)
+        df_stock["qty"] = pd.Series(dtype=float)
+    if "product_name_norm" not in df_transactions.columns:
+        df_transactions["product_name_norm"] = pd.Series(dtype=object)
+        df_transactions["qty"] = pd.Series(dtype=float)
+    return df_stock, df_transactions
+
+
+@metrics.timed("order_plan")
+def compute_order_plan(product, df_stock, df_transactions):
+    """Current stock, average sales, safety stock and suggested order for one product."""
+    product_norm = normalize_name(product)
+
+    # Current stock
+    current_stock = int(
+        df_stock[df_stock["name_norm"] == product_norm]["qty"].iloc[0]
+    ) if product_norm in df_stock["name_norm"].values else 0
+
+    # Past sales
+    product_sales = df_transactions[df_transactions["product_name_norm"] == product_norm]["qty"]
+    avg_sales = int(product_sales.mean()) if not product_sales.empty else 0
+
+    return _order_plan(product, current_stock, avg_sales)
+
+
+@metrics.timed("order_plan")
+def compute_order_plan_from_store(product, store, tenant):
+    """compute_order_plan() over the tenant's data in the analytics store."""
+    stock = store.current_stock(tenant, product)
+    current_stock = int(stock["qty"]) if stock else 0
+    avg_sales = store.sales_mean(tenant, product)
+    return _order_plan(product, current_stock, int(avg_sales) if avg_sales is not None else 0)
+
+
+def order_planner(source, payload):
+    """
+    compute_order_plan() bound to this request's data: the analytics store
+    when request_source() found it there, else frames built from the body.
+    """
+    if source is not None:
+        store, tenant = source
+        return lambda product: compute_order_plan_from_store(product, store, tenant)
+    df_stock, df_transactions = build_frames(payload)
+    return lambda product: compute_order_plan(product, df_stock, df_transactions)
+
+
+def _order_plan(product, current_stock, avg_sales):
+    # Safety stock rule
+    safety_stock = int(avg_sales * 0.2)  # 20% of avg monthly sales
+
+    # Suggested order
+    required_qty = max(0, (avg_sales + safety_stock) - current_stock)
+
+    return {
+        "product": product,
+        "current_stock": current_stock,
+        "avg_sales": avg_sales,
+        "safety_stock": safety_stock,
+        "suggested_order": required_qty,
+    }
+
+
+def render_plan_facts(plan):
+    return (
+        f"Product: {plan['product'].title()}\n"
+        f"Current stock: {plan['current_stock']}\n"
+        f"Average monthly sales: {plan['avg_sales']}\n"
+        f"Safety stock: {plan['safety_stock']}\n"
+        f"Suggested order: {plan['suggested_order']}"
+    )
+
+
+def build_insight_prompt(plan):
+    return (
+        f"You are an inventory management assistant.\n"
+        f"{render_plan_facts(plan)}\n\n"
+        f"👉 Provide a short, helpful insight about why this order makes sense "
+        f"and how it will prevent stockouts or overstocking. Keep it under 2 sentences."
+    )
+
+
+insight_batcher = InsightBatcher(
+    call_site="order_insight",
+    single_prompt=build_insight_prompt,
+    render_item=render_plan_facts,
+    instructions=(
+        "You are an inventory management assistant.\n"
+        "For each product, provide a short, helpful insight about why the suggested order makes sense "
+        "and how it will prevent stockouts or overstocking. Keep each insight under 2 sentences."
+    ),
+    model="gemini-2.0-flash-001",
+)
+
+
+SKIPPED_INSIGHT_TEXT = "Insight skipped to answer within the response deadline."
+
+
+def plan_insight(plan):
+    """Gemini insight for one plan, or a placeholder when the budget is too low."""
+    if not deadline.allows("llm"):
+        deadline.skip("llm")
+        return SKIPPED_INSIGHT_TEXT
+    try:
+        return insight_batcher.insight(plan, timeout=deadline.timeout(30))
+    except Exception as e:
+        logging.error(f"Gemini API error: {e}")
+        return "Unable to generate insight due to API error."
+
+
+def format_plan(plan, insight):
+    return (
+        f"🛒 Order Optimization:\n"
+        f"Product: {plan['product'].title()}\n"
+        f"Current stock: {plan['current_stock']}\n"
+        f"Avg. sales: {plan['avg_sales']} units/month\n"
+        f"Safety stock: {plan['safety_stock']} units\n"
+        f"👉 Suggested order: {plan['suggested_order']} units\n\n"
+        f"💡 Insight: {insight}"
+    )
+
 # ----------------------
 # Optimize Order Endpoint
 # ----------------------
 @app.route("/optimize_order", methods=["POST"])
 def optimize_order():
     try:
-        data = request.json
-        query = data.get("query")
-        stock_data = data.get("stock_data")
-        transaction_data = data.get("transaction_data")
+        source = analytics_store.request_source()
+        payload = read_payload(source, _query_product)
+        query = payload.fields.get("query")
 
-        if not query or not stock_data or not transaction_data:
+        if not query or not (source or (payload.counts["stock_data"] and payload.counts["transaction_data"])):
             return jsonify({"error": "Missing query, stock_data, or transaction_data"}), 400
 
         # Extract product
-        product = query.lower().replace("optimize order for", "").strip()
-        product_norm = normalize_name(product)
-
-        # Convert to DataFrames
-        df_stock = pd.DataFrame(stock_data)
-        df_transactions = pd.DataFrame(transaction_data)
-
-        if not df_stock.empty and "name" in df_stock.columns:
-            df_stock["name_norm"] = df_stock["name"].apply(normalize_name)
-        if not df_transactions.empty and "product_name" in df_transactions.columns:
-            df_transactions["product_name_norm"] = df_transactions["product_name"].apply(normalize_name)
+        product = query_product(query)
 
-        # Current stock
-        current_stock = int(
-            df_stock[df_stock["name_norm"] == product_norm]["qty"].iloc[0]
-        ) if product_norm in df_stock["name_norm"].values else 0
-
-        # Past sales
-        product_sales = df_transactions[df_transactions["product_name_norm"] == product_norm]["qty"]
-        avg_sales = int(product_sales.mean()) if not product_sales.empty else 0
-
-        # Safety stock rule
-        safety_stock = int(avg_sales * 0.2)  # 20% of avg monthly sales
-
-        # Suggested order
-        required_qty = max(0, (avg_sales + safety_stock) - current_stock)
+        plan = order_planner(source, payload)(product)
 
         # ----------------------
         # Gemini insight
         # ----------------------
-        prompt = (
-            f"You are an inventory management assistant.\n"
-            f"Product: {product.title()}\n"
-            f"Current stock: {current_stock}\n"
-            f"Average monthly sales: {avg_sales}\n"
-            f"Safety stock: {safety_stock}\n"
-            f"Suggested order: {required_qty}\n\n"
-            f"👉 Provide a short, helpful insight about why this order makes sense "
-            f"and how it will prevent stockouts or overstocking. Keep it under 2 sentences."
-        )
-
-        try:
-            model = genai.GenerativeModel("gemini-2.0-flash-001")
-            response = model.generate_content(prompt)
-            insight = response.text
-        except Exception as e:
-            logging.error(f"Gemini API error: {e}")
-            insight = "Unable to generate insight due to API error."
+        insight = plan_insight(plan)
 
         # Human-readable summary
-        readable_text = (
-            f"🛒 Order Optimization:\n"
-            f"Product: {product.title()}\n"
-            f"Current stock: {current_stock}\n"
-            f"Avg. sales: {avg_sales} units/month\n"
-            f"Safety stock: {safety_stock} units\n"
-            f"👉 Suggested order: {required_qty} units\n\n"
-            f"💡 Insight: {insight}"
-        )
+        readable_text = format_plan(plan, insight)
 
         return jsonify({
             "readable_text": readable_text,
-            "details": {
-                "product": product,
-                "current_stock": current_stock,
-                "avg_sales": avg_sales,
-                "safety_stock": safety_stock,
-                "suggested_order": required_qty,
-                "insight": insight
-            }
+            "details": {**plan, "insight": insight},
+            "skipped_stages": deadline.skipped_stages()
         })
 
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
     except Exception as e:
         logging.error(f"Error in optimize_order: {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/optimize_order/stream", methods=["POST"])
+def optimize_order_stream():
+    """Streamed variant of /optimize_order: the plan first, then the insight as it is generated."""
+    source = analytics_store.request_source()
+    try:
+        payload = read_payload(source, _query_product)
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
+    query = payload.fields.get("query")
+
+    if not query or not (source or (payload.counts["stock_data"] and payload.counts["transaction_data"])):
+        return jsonify({"error": "Missing query, stock_data, or transaction_data"}), 400
+
+    def events():
+        try:
+            product = query_product(query)
+            plan = order_planner(source, payload)(product)
+            yield "plan", plan
+
+            parts = []
+            if not deadline.allows("llm"):
+                deadline.skip("llm")
+                parts.append(SKIPPED_INSIGHT_TEXT)
+                yield "insight_delta", {"text": parts[0]}
+            else:
+                try:
+                    for piece in generate_stream(build_insight_prompt(plan), model="gemini-2.0-flash-001",
+                                                 call_site="order_insight", deadline=deadline.remaining()):
+                        parts.append(piece)
+                        yield "insight_delta", {"text": piece}
+                except Exception as e:
+                    logging.error(f"Gemini API error: {e}")
+                    if not parts:
+                        parts.append("Unable to generate insight due to API error.")
+                        yield "insight_delta", {"text": parts[0]}
+
+            insight = "".join(parts)
+            yield "done", {
+                "readable_text": format_plan(plan, insight),
+                "details": {**plan, "insight": insight},
+                "skipped_stages": deadline.skipped_stages(),
+            }
+
+        except Exception as e:
+            logging.error(f"Error in optimize_order_stream: {e}")
+            yield "error", {"error": str(e)}
+
+    return ndjson_response(events())
+
+
+@app.route("/optimize_order_bulk", methods=["POST"])
+def optimize_order_bulk():
+    """Reorder plan for every product in stock_data (or just `products`), with batched insights."""
+    try:
+        source = analytics_store.request_source()
+        payload = read_payload(source, lambda fields: fields.get("products") or None)
+        data = payload.fields
+        include_insights = bool(data.get("include_insights", True))
+
+        if source is not None:
+            store, tenant = source
+            products = data.get("products") or store.products(tenant)
+            plans = [compute_order_plan_from_store(product, store, tenant) for product in products]
+        else:
+            if not payload.counts["stock_data"]:
+                return jsonify({"error": "Missing stock_data"}), 400
+            if payload.stock.rows and not payload.stock.columns["name"].seen:
+                return jsonify({"error": "stock_data items need a name"}), 400
+
+            df_stock, df_transactions = build_frames(payload)
+            products = data.get("products") or list(df_stock["name"].dropna().unique())
+            plans = [compute_order_plan(product, df_stock, df_transactions) for product in products]
+
+        if include_insights and plans and not deadline.allows("llm"):
+            deadline.skip("llm")
+            include_insights = False
+            for plan in plans:
+                plan["insight"] = SKIPPED_INSIGHT_TEXT
+
+        if include_insights and plans:
+            futures = [insight_batcher.submit(plan) for plan in plans]
+            for plan, future in zip(plans, futures):
+                try:
+                    plan["insight"] = future.result(timeout=deadline.timeout(60))
+                except Exception as e:
+                    logging.error(f"Gemini API error for {plan['product']}: {e}")
+                    plan["insight"] = "Unable to generate insight due to API error."
+
+        for plan in plans:
+            plan["readable_text"] = format_plan(plan, plan.get("insight", ""))
+
+        return jsonify({"plans": plans, "skipped_stages": deadline.skipped_stages()})
+
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
+    except Exception as e:
+        logging.error(f"Error in optimize_order_bulk: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # ----------------------
 # Generate Order from PDF Endpoint
 # ----------------------
@@ -129,4 +338,4 @@ def optimize_order():
 # Run
 # ----------------------
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5003, debug=True)
+    app.run(host="0.0.0.0", port=services.port("order_optimizer"), debug=True)
@@ -0,0 +1,276 @@
+"""
+Background job queue for bulk PDF order ingestion.
+
+Uploaded PDFs are written to PDF_JOB_DIR and tracked in a small SQLite
+database, then parsed by a process pool sized to the machine's cores.
+Jobs that were queued or running when the service stopped are picked up
+again the next time the queue starts.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_order_parser import parse_order_pdf
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the single-process development server runs there
+    fcntl = None
+
+JOB_DIR = os.getenv("PDF_JOB_DIR", "pdf_jobs")
+JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", os.cpu_count() or 2))
+
+TERMINAL_STATES = ("done", "failed")
+
+# ----------------------
+# Job store
+# ----------------------
+class JobStore:
+    """SQLite-backed record of every submitted PDF job."""
+
+    COLUMNS = ("id", "user_id", "filename", "status", "pages_done", "total_pages",
+               "result", "error", "created_at", "updated_at")
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                filename TEXT,
+                status TEXT,
+                pages_done INTEGER DEFAULT 0,
+                total_pages INTEGER DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+        self._conn.commit()
+
+    def _row_to_job(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        total = job["total_pages"] or 0
+        job["progress"] = round(job["pages_done"] / total, 3) if total else (1.0 if job["status"] == "done" else 0.0)
+        return job
+
+    def create(self, user_id, filename):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_id, filename, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, user_id, filename, now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def update_progress(self, job_id, pages_done, total_pages):
+        """Record page progress unless the job already finished."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', pages_done = ?, total_pages = ?, updated_at = ? "
+                "WHERE id = ? AND status NOT IN ('done', 'failed')",
+                (pages_done, total_pages, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, user_id=None, job_ids=None, limit=100):
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+        clauses, params = [], []
+        if user_id:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if job_ids:
+            clauses.append(f"id IN ({', '.join('?' for _ in job_ids)})")
+            params.extend(job_ids)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+# ----------------------
+# Worker process side
+# ----------------------
+_progress_queue = None
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id, pdf_path, products):
+    """Parse one PDF in a worker process, reporting progress per page."""
+    _progress_queue.put((job_id, 0, 0))
+    pages = [0]
+
+    def report(pages_done, total_pages):
+        pages[0] = total_pages
+        _progress_queue.put((job_id, pages_done, total_pages))
+
+    order = parse_order_pdf(pdf_path, products, on_progress=report)
+    return order, pages[0]
+
+# ----------------------
+# Queue
+# ----------------------
+class PdfJobQueue:
+    """Bounded process pool that parses PDFs and records results in a JobStore."""
+
+    def __init__(self, job_dir=JOB_DIR, workers=JOB_WORKERS):
+        os.makedirs(job_dir, exist_ok=True)
+        self.job_dir = job_dir
+        self.workers = max(1, workers)
+        self.store = JobStore(os.path.join(job_dir, "jobs.db"))
+        self._ctx = multiprocessing.get_context("spawn")
+        self._progress_queue = self._ctx.Queue()
+        self._executor = None
+        self._listener = None
+        self._resume_lock = None
+
+    def _paths(self, job_id):
+        return (os.path.join(self.job_dir, f"{job_id}.pdf"),
+                os.path.join(self.job_dir, f"{job_id}.products.json"))
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._ctx,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,),
+        )
+        self._listener = threading.Thread(target=self._listen_progress, name="pdf-job-progress", daemon=True)
+        self._listener.start()
+
+        # Resume anything left over from a previous run
+        if not self._claim_resume():
+            return
+        for job in self.store.unfinished():
+            pdf_path, products_path = self._paths(job["id"])
+            if not os.path.exists(pdf_path) or not os.path.exists(products_path):
+                self.store.update(job["id"], status="failed", error="Uploaded file missing after restart")
+                continue
+            with open(products_path) as f:
+                products = json.load(f)
+            self.store.update(job["id"], status="queued", pages_done=0)
+            self._dispatch(job["id"], pdf_path, products)
+            logging.info(f"Resumed PDF job {job['id']}")
+
+    def _claim_resume(self):
+        """
+        True in exactly one process per job directory, so several server
+        workers sharing PDF_JOB_DIR don't all re-run the same leftover jobs.
+        The lock is held until the process exits.
+        """
+        if fcntl is None:
+            return True
+        self._resume_lock = open(os.path.join(self.job_dir, "resume.lock"), "w")
+        try:
+            fcntl.flock(self._resume_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._resume_lock.close()
+            self._resume_lock = None
+            return False
+
+    def submit(self, user_id, filename, data: bytes, products: list):
+        """Persist an uploaded PDF and queue it. Returns the job id."""
+        job_id = self.store.create(user_id, filename)
+        pdf_path, products_path = self._paths(job_id)
+        with open(pdf_path, "wb") as f:
+            f.write(data)
+        with open(products_path, "w") as f:
+            json.dump(products, f)
+        self._dispatch(job_id, pdf_path, products)
+        return job_id
+
+    def _dispatch(self, job_id, pdf_path, products):
+        future = self._executor.submit(_run_job, job_id, pdf_path, products)
+        future.add_done_callback(lambda fut: self._finish(job_id, fut))
+
+    def _finish(self, job_id, future):
+        if future.cancelled():
+            return  # left queued, picked up again on the next start
+        try:
+            order, total_pages = future.result()
+            self.store.update(job_id, status="done", result=order,
+                              pages_done=total_pages, total_pages=total_pages)
+        except Exception as e:
+            logging.error(f"PDF job {job_id} failed: {e}")
+            self.store.update(job_id, status="failed", error=str(e))
+            return
+        for path in self._paths(job_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _listen_progress(self):
+        while True:
+            message = self._progress_queue.get()
+            if message is None:
+                return
+            self.store.update_progress(*message)
+
+    def shutdown(self, wait=True):
+        if self._executor:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        self._progress_queue.put(None)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the process-wide job queue, starting it on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = PdfJobQueue()
+            _queue.start()
+    return _queue
+
+
+def shutdown_job_queue():
+    """Stop the process-wide queue if it was started; unfinished jobs resume on the next start."""
+    global _queue
+    with _queue_lock:
+        if _queue is not None:
+            _queue.shutdown(wait=False)
+            _queue = None
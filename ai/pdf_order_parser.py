@@ -0,0 +1,84 @@
+import re
+from rapidfuzz import process
+
+# ----------------------
+# Helper functions
+# ----------------------
+def normalize_line(line: str) -> str:
+    """Normalize dash types and trim spaces."""
+    line = line.replace("–", "-").replace("—", "-")
+    line = re.sub(r"-{2,}", "-", line)  # collapse --- or ---- into a single -
+    return line.strip()
+
+
+def fuzzy_match_product(name: str, firestore_products: list) -> str:
+    """Fuzzy match product name against Firestore product list."""
+    if not firestore_products:
+        return None
+    best_match, score, _ = process.extractOne(name, firestore_products)
+    if score > 80:  # threshold can be adjusted
+        return best_match
+    return None  # ignore unknown products
+
+
+def parse_product_line(line: str, firestore_products: list):
+    """Parse a line to extract product name and quantity."""
+    line = normalize_line(line)
+
+    # Case 1: "Product - Quantity"
+    if "-" in line:
+        parts = line.split("-")
+        if len(parts) == 2:
+            product_name = parts[0].strip()
+            qty_str = parts[1].strip()
+            qty = int(re.sub(r"\D", "", qty_str) or 0)
+            product_name = fuzzy_match_product(product_name, firestore_products)
+            if product_name and qty > 0:
+                return product_name, qty
+
+    # Case 2: "10 kg of Sugar" or "10 Sugar"
+    match = re.match(r"(\d+)\s*(\w*)\s*(?:of\s+)?(.+)", line, re.IGNORECASE)
+    if match:
+        qty = int(match.group(1))
+        product_name = match.group(3).strip()
+        product_name = fuzzy_match_product(product_name, firestore_products)
+        if product_name and qty > 0:
+            return product_name, qty
+
+    return None, None
+
+
+def parse_order_lines(lines, firestore_products: list, order_data=None):
+    """Accumulate supplier and product lines into an order dict."""
+    if order_data is None:
+        order_data = {"supplier": "", "products": []}
+
+    for line in lines:
+        line = normalize_line(line)
+        # Supplier
+        if "supplier:" in line.lower():
+            order_data["supplier"] = line.split(":")[1].strip()
+        else:
+            product_name, qty = parse_product_line(line, firestore_products)
+            if product_name and qty:
+                order_data["products"].append({"name": product_name, "qty": qty})
+
+    return order_data
+
+
+def parse_order_pdf(pdf_source, firestore_products: list, on_progress=None):
+    """
+    Extract an order from a PDF path or file object, page by page.
+    on_progress(pages_done, total_pages) is called after every page.
+    """
+    import pdfplumber  # pulls in pdfminer; only needed once a PDF arrives
+
+    order_data = {"supplier": "", "products": []}
+    with pdfplumber.open(pdf_source) as pdf:
+        total_pages = len(pdf.pages)
+        for i, page in enumerate(pdf.pages, start=1):
+            text = page.extract_text() or ""
+            parse_order_lines(text.split("\n"), firestore_products, order_data)
+            if on_progress:
+                on_progress(i, total_pages)
+    return order_data
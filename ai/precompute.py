@@ -0,0 +1,367 @@
+"""
+Precomputed demand forecasts and reorder plans for the /ai router.
+
+Each /ai request carries the tenant's full stock and transaction data. The
+router fingerprints it (analytics_store.dataset_version) and, when the version changed,
+saves the dataset in a local SQLite store. A scheduler thread then runs the
+bulk forecast and reorder endpoints for every product of that tenant, after
+the data has been quiet for PRECOMPUTE_DEBOUNCE_S, and again every
+PRECOMPUTE_INTERVAL_S since forecasts move with the calendar. Results are
+stored with the dataset version they were computed from and when.
+
+"predict demand for X" and "optimize order for X" are answered from the
+store when the stored result matches the request's dataset version and is
+younger than PRECOMPUTE_MAX_AGE_S; otherwise the router computes them live
+as before. Several workers may share the store; a file lock lets one of
+them refresh at a time. PRECOMPUTE_PATH="" turns all of this off.
+"""
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import has_request_context, request
+
+import admission
+import analytics_store
+import metrics
+import services
+import wire_format
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the single-process development server runs there
+    fcntl = None
+
+PRECOMPUTE_PATH = os.getenv("PRECOMPUTE_PATH", "precompute.sqlite3")
+INTERVAL_S = float(os.getenv("PRECOMPUTE_INTERVAL_S", 6 * 3600))
+DEBOUNCE_S = float(os.getenv("PRECOMPUTE_DEBOUNCE_S", 30))
+MAX_AGE_S = float(os.getenv("PRECOMPUTE_MAX_AGE_S", 24 * 3600))
+BATCH = int(os.getenv("PRECOMPUTE_BATCH", 10))  # products per bulk call, so each fits one request budget
+TICK_S = 5
+
+# kind -> (service, bulk path, list field in the response, name field in each result)
+KINDS = {
+    "demand": ("demand_predictor", "/predict_demand_bulk", "results", "product"),
+    "optimize": ("order_optimizer", "/optimize_order_bulk", "plans", "product"),
+}
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("precompute_lookups_total", "counter", "Precomputed answer lookups by outcome (hit, stale, miss).")
+
+_request_dataset = contextvars.ContextVar("precompute_dataset", default=None)  # (tenant, version)
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+# ----------------------
+# Results store
+# ----------------------
+class ResultStore:
+    """SQLite-backed latest dataset per tenant and precomputed results per product."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS datasets (
+                tenant TEXT PRIMARY KEY,
+                version TEXT,
+                stock_data TEXT,
+                transaction_data TEXT,
+                updated_at REAL,
+                dirty_since REAL,
+                refreshed_at REAL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                tenant TEXT,
+                kind TEXT,
+                product TEXT,
+                version TEXT,
+                computed_at REAL,
+                readable_text TEXT,
+                data TEXT,
+                PRIMARY KEY (tenant, kind, product)
+            )"""
+        )
+        self._conn.commit()
+
+    def save_dataset(self, tenant, version, stock_data, transaction_data):
+        """Store the tenant's data if its version changed and mark it for a refresh."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM datasets WHERE tenant = ?", (tenant,)).fetchone()
+            if row and row[0] == version:
+                return False
+            self._conn.execute(
+                "INSERT INTO datasets (tenant, version, stock_data, transaction_data, updated_at, dirty_since) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(tenant) DO UPDATE SET version = excluded.version, "
+                "stock_data = excluded.stock_data, transaction_data = excluded.transaction_data, "
+                "updated_at = excluded.updated_at, dirty_since = excluded.dirty_since",
+                (tenant, version, json.dumps(stock_data), json.dumps(transaction_data), now, now),
+            )
+            self._conn.commit()
+        return True
+
+    def mark_dirty(self, tenant):
+        with self._lock:
+            self._conn.execute("UPDATE datasets SET dirty_since = ? WHERE tenant = ?", (time.time() - DEBOUNCE_S, tenant))
+            self._conn.commit()
+
+    def load_dataset(self, tenant):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, stock_data, transaction_data FROM datasets WHERE tenant = ?", (tenant,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"version": row[0], "stock_data": json.loads(row[1]), "transaction_data": json.loads(row[2])}
+
+    def due_tenants(self, now):
+        """Tenants whose data changed DEBOUNCE_S ago or whose results are INTERVAL_S old."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tenant FROM datasets WHERE dirty_since <= ? OR refreshed_at <= ? "
+                "ORDER BY COALESCE(dirty_since, refreshed_at)",
+                (now - DEBOUNCE_S, now - INTERVAL_S),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def postpone(self, tenant):
+        """Retry a failed refresh after another debounce period."""
+        with self._lock:
+            self._conn.execute("UPDATE datasets SET dirty_since = ? WHERE tenant = ?", (time.time(), tenant))
+            self._conn.commit()
+
+    def finish_refresh(self, tenant, version):
+        """Record a refresh; a dataset that changed meanwhile stays dirty."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE datasets SET refreshed_at = ?, dirty_since = CASE WHEN version = ? THEN NULL "
+                "ELSE dirty_since END WHERE tenant = ?",
+                (time.time(), version, tenant),
+            )
+            self._conn.commit()
+
+    def put_results(self, tenant, kind, version, rows):
+        """rows: (normalized product, readable_text, data dict)."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (tenant, kind, product, version, computed_at, readable_text, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(tenant, kind, product, version, now, text, json.dumps(data)) for product, text, data in rows],
+            )
+            self._conn.commit()
+
+    def get_result(self, tenant, kind, product):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, computed_at, readable_text, data FROM results "
+                "WHERE tenant = ? AND kind = ? AND product = ?",
+                (tenant, kind, product),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"version": row[0], "computed_at": row[1], "readable_text": row[2], "data": json.loads(row[3])}
+
+    def status(self, tenant):
+        with self._lock:
+            dataset = self._conn.execute(
+                "SELECT version, updated_at, dirty_since, refreshed_at FROM datasets WHERE tenant = ?", (tenant,)
+            ).fetchone()
+            counts = self._conn.execute(
+                "SELECT kind, COUNT(*), MIN(computed_at), MAX(computed_at) FROM results WHERE tenant = ? GROUP BY kind",
+                (tenant,),
+            ).fetchall()
+        if dataset is None:
+            return {"tenant": tenant, "dataset": None, "results": {}}
+        return {
+            "tenant": tenant,
+            "dataset": dict(zip(("version", "updated_at", "dirty_since", "refreshed_at"), dataset)),
+            "results": {kind: {"products": n, "oldest": oldest, "newest": newest} for kind, n, oldest, newest in counts},
+        }
+
+
+# ----------------------
+# Scheduler
+# ----------------------
+class Precomputer:
+    def __init__(self, path=PRECOMPUTE_PATH):
+        self.path = path
+        self.store = ResultStore(path)
+        self._known_versions = {}  # tenant -> last version saved by this process
+        self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="precompute-save")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+        self._thread.start()
+
+    def observe(self, tenant, version, stock_data, transaction_data):
+        """Save a request's dataset in the background when its version is new to this process."""
+        if self._known_versions.get(tenant) == version:
+            return
+        self._known_versions[tenant] = version
+        self._saver.submit(self._save, tenant, version, stock_data, transaction_data)
+
+    def _save(self, tenant, version, stock_data, transaction_data):
+        try:
+            if self.store.save_dataset(tenant, version, stock_data, transaction_data):
+                logger.info("precompute dataset changed", extra={"tenant": tenant, "version": version})
+        except Exception:
+            logger.exception("precompute dataset save failed")
+
+    def trigger(self, tenant):
+        """Refresh the tenant on the next tick instead of after the debounce."""
+        self.store.mark_dirty(tenant)
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._saver.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                for tenant in self.store.due_tenants(time.time()):
+                    if self._stop.is_set():
+                        break
+                    self._refresh_locked(tenant)
+            except Exception:
+                logger.exception("precompute scheduler failed")
+            self._wake.wait(TICK_S)
+            self._wake.clear()
+
+    def _refresh_locked(self, tenant):
+        """Refresh unless another worker is already refreshing from the same store."""
+        if fcntl is None:
+            return self.refresh(tenant)
+        with open(self.path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            return self.refresh(tenant)
+
+    def refresh(self, tenant):
+        """Run every precomputed kind for all of the tenant's products."""
+        dataset = self.store.load_dataset(tenant)
+        if dataset is None:
+            return
+        products = sorted({
+            row.get("product_name") or row.get("name")
+            for row in dataset["stock_data"] if row.get("product_name") or row.get("name")
+        })
+        stored = 0
+        with metrics.timed("precompute_refresh"):
+            for kind in KINDS:
+                rows = []
+                for start in range(0, len(products), BATCH):
+                    rows += self._compute(kind, tenant, dataset, products[start:start + BATCH])
+                self.store.put_results(tenant, kind, dataset["version"], rows)
+                stored += len(rows)
+                logger.info("precomputed", extra={"tenant": tenant, "kind": kind, "products": len(rows)})
+        if products and not stored:
+            self.store.postpone(tenant)  # agents unreachable; try again later rather than every tick
+            return
+        self.store.finish_refresh(tenant, dataset["version"])
+
+    def _compute(self, kind, tenant, dataset, products):
+        service, path, field, name_field = KINDS[kind]
+        payload = {
+            "products": products,  # small fields first: the agents filter the arrays while reading them
+            "include_trends": True,
+            "stock_data": dataset["stock_data"],
+            "transaction_data": dataset["transaction_data"],
+        }
+        try:
+            # The dataset version lets the agents read the analytics store instead of the body when it is synced
+            response = wire_format.post(services.url(service, path), payload, timeout=120,
+                                        headers=analytics_store.dataset_headers(tenant, dataset["version"]))
+            response.raise_for_status()
+            results = wire_format.decode_response(response).get(field) or []
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("precompute %s batch failed: %s", kind, e)
+            return []
+        return [(normalize_name(r[name_field]), r.get("readable_text", ""), r) for r in results]
+
+
+_precomputer = None
+_precomputer_lock = threading.Lock()
+
+
+def get_precomputer():
+    """The process's scheduler, started on first use; None when PRECOMPUTE_PATH is empty."""
+    global _precomputer
+    if not PRECOMPUTE_PATH:
+        return None
+    with _precomputer_lock:
+        if _precomputer is None:
+            _precomputer = Precomputer()
+    return _precomputer
+
+
+def shutdown_precomputer():
+    global _precomputer
+    with _precomputer_lock:
+        if _precomputer is not None:
+            _precomputer.stop()
+            _precomputer = None
+
+
+# ----------------------
+# Request path
+# ----------------------
+def observe_request(tenant, version, stock_data, transaction_data):
+    """
+    Remember this request's dataset version for lookup() and queue the data
+    for precomputation if new. Called on every request: worker threads are
+    reused, so a request without data must clear the previous one's version.
+    """
+    precomputer = get_precomputer()
+    if precomputer is None or not stock_data:
+        _request_dataset.set(None)
+        return
+    _request_dataset.set((tenant, version))
+    precomputer.observe(tenant, version, stock_data, transaction_data)
+
+
+def lookup(kind, product):
+    """
+    The stored answer for product if it was computed from this request's
+    tenant and dataset version within MAX_AGE_S, else None.
+    """
+    context = _request_dataset.get()
+    precomputer = get_precomputer()
+    if context is None or precomputer is None or not product:
+        return None
+    tenant, version = context
+    if not has_request_context() or admission.tenant_of(request) != tenant:
+        return None  # the version was observed for another request
+    result = precomputer.store.get_result(tenant, kind, normalize_name(product))
+    if result is None:
+        outcome = "miss"
+    elif result["version"] != version or time.time() - result["computed_at"] > MAX_AGE_S:
+        outcome = "stale"
+    else:
+        outcome = "hit"
+    metrics.inc("precompute_lookups_total", kind=kind, outcome=outcome)
+    if outcome != "hit":
+        return None
+    return {
+        "readable_text": result["readable_text"],
+        "details": result["data"],
+        "precomputed": {"dataset_version": result["version"], "computed_at": result["computed_at"]},
+    }
@@ -0,0 +1,225 @@
+"""
+Production launcher for the agents.
+
+Each service runs under gunicorn with gthread workers. The app is imported
+and warmed up (spaCy, Prophet, the intent classifier) in the master before
+it forks, so workers share those pages copy-on-write and are ready as soon
+as they start. SIGTERM drains in-flight requests for --graceful-timeout
+seconds before workers exit. Run from ai/:
+
+    python serve.py ai demand_predictor     # one server per named service, each on its own port
+    python serve.py all                     # every service in services.SERVICES
+    python serve.py combined --dev          # development only: every service in one server under /<name>
+
+Worker and thread counts come from --workers/--threads or SERVE_WORKERS /
+SERVE_THREADS; ports from services.py (<NAME>_PORT). The development
+entry points (python ai.py etc.) are unchanged.
+
+Combined mode sends the router's agent calls back over HTTP to the same
+server. A request holds one thread while its agent call needs another, so
+once about --threads requests wait on agents at once (fewer with fan-out),
+the worker deadlocks until the timeouts fire. It therefore needs --dev and
+is meant for trying the stack on one port, not for production.
+"""
+import argparse
+import importlib
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import services
+
+DEFAULT_WORKERS = int(os.getenv("SERVE_WORKERS", 2))
+DEFAULT_THREADS = int(os.getenv("SERVE_THREADS", 8))
+DEFAULT_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+COMBINED_PORT = int(os.getenv("COMBINED_PORT", services.SERVICES["ai"][1]))
+# Command launch_each() runs per service; wrappers such as benchmarks/stubs.py replace it
+SELF_SCRIPT = [os.path.abspath(__file__)]
+
+
+# ----------------------
+# Per-service hooks
+# ----------------------
+def _start_pdf_jobs():
+    from pdf_jobs import get_job_queue
+    get_job_queue()  # each worker gets its own pool; one of them resumes leftover jobs
+
+
+def _stop_pdf_jobs():
+    from pdf_jobs import shutdown_job_queue
+    shutdown_job_queue()
+
+
+def _start_precompute():
+    from precompute import get_precomputer
+    get_precomputer()  # workers share the store; a file lock lets one refresh at a time
+
+
+def _stop_precompute():
+    from precompute import shutdown_precomputer
+    shutdown_precomputer()
+
+
+def _start_monitor():
+    from stock_monitor import get_monitor
+    get_monitor()  # workers share the store; a file lock lets one send webhooks at a time
+
+
+def _stop_monitor():
+    from stock_monitor import shutdown_monitor
+    shutdown_monitor()
+
+
+def _start_router():
+    _start_precompute()
+    _start_monitor()
+
+
+def _stop_router():
+    _stop_precompute()
+    _stop_monitor()
+
+
+# Run in every worker after fork (process pools and threads don't survive a fork)
+WORKER_START = {"order_generator": _start_pdf_jobs, "ai": _start_router}
+WORKER_EXIT = {"order_generator": _stop_pdf_jobs, "ai": _stop_router}
+
+
+def load_app(name):
+    """Import the service's Flask app and run its warmup."""
+    module = importlib.import_module(services.SERVICES[name][0])
+    services.warm(name)
+    return module.app
+
+
+def combined_app():
+    """
+    All agents in one WSGI app: the router at / and every other agent under
+    /<name>, with the router's agent URLs pointed at those prefixes.
+    Development only (see the module docstring).
+    """
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+    import log_setup
+    log_setup.configure("agents", "agents_logs.txt")  # before the agents' own configure() calls, which it overrides
+
+    for name in services.SERVICES:
+        if name != "ai":
+            os.environ.setdefault(f"{name.upper()}_URL", f"http://127.0.0.1:{COMBINED_PORT}/{name}")
+    mounts = {f"/{name}": load_app(name) for name in services.SERVICES if name != "ai"}
+    return DispatcherMiddleware(load_app("ai"), mounts)
+
+
+# ----------------------
+# gunicorn
+# ----------------------
+def serve(names, bind, workers, threads, timeout, graceful_timeout):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is not installed: pip install gunicorn")
+
+    def post_worker_init(worker):
+        for name in names:
+            if name in WORKER_START:
+                WORKER_START[name]()
+
+    def worker_exit(server, worker):
+        for name in names:
+            if name in WORKER_EXIT:
+                WORKER_EXIT[name]()
+
+    class AgentServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("graceful_timeout", graceful_timeout)
+            self.cfg.set("proc_name", "agents-" + "+".join(names) if len(names) > 1 else names[0])
+            self.cfg.set("post_worker_init", post_worker_init)
+            self.cfg.set("worker_exit", worker_exit)
+
+        def load(self):
+            start = time.perf_counter()
+            app = combined_app() if len(names) > 1 else load_app(names[0])
+            logging.info(f"Preloaded {', '.join(names)} in {time.perf_counter() - start:.1f}s")
+            return app
+
+    AgentServer().run()
+
+
+def launch_each(names, argv):
+    """Run one server process per service and stop them all when any exits or on SIGTERM/SIGINT."""
+    children = {
+        name: subprocess.Popen([sys.executable, *SELF_SCRIPT, name, *argv])
+        for name in names
+    }
+
+    def stop(signum=None, frame=None):
+        for child in children.values():
+            if child.poll() is None:
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    exit_code = 0
+    while children:
+        for name, child in list(children.items()):
+            code = child.poll()
+            if code is None:
+                continue
+            del children[name]
+            if code != 0:
+                logging.error(f"{name} exited with code {code}; stopping the other services")
+                exit_code = exit_code or code
+                stop()
+        time.sleep(0.5)
+    return exit_code
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Run the agents under gunicorn.")
+    parser.add_argument("services", nargs="+",
+                        help=f"service names ({', '.join(services.SERVICES)}), 'all' or 'combined'")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    parser.add_argument("--timeout", type=int, default=120, help="seconds before a stuck worker is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to drain requests on shutdown")
+    parser.add_argument("--dev", action="store_true", help="allow 'combined', which is not safe under load")
+    args = parser.parse_args()
+
+    if args.services == ["combined"]:
+        if not args.dev:
+            parser.error("'combined' routes agent calls back through its own threads and deadlocks under load; "
+                         "use 'all' in production or pass --dev")
+        logging.warning("combined mode is for development: about --threads concurrent /ai requests deadlock it")
+        names = list(services.SERVICES)
+        return serve(names, f"{args.host}:{COMBINED_PORT}", args.workers, args.threads,
+                     args.timeout, args.graceful_timeout)
+
+    names = list(services.SERVICES) if args.services == ["all"] else args.services
+    unknown = [name for name in names if name not in services.SERVICES]
+    if unknown:
+        parser.error(f"unknown service(s): {', '.join(unknown)}")
+
+    if len(names) > 1:
+        passthrough = ["--host", args.host, "--workers", str(args.workers), "--threads", str(args.threads),
+                       "--timeout", str(args.timeout), "--graceful-timeout", str(args.graceful_timeout)]
+        sys.exit(launch_each(names, passthrough))
+
+    name = names[0]
+    serve([name], f"{args.host}:{services.port(name)}", args.workers, args.threads,
+          args.timeout, args.graceful_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Registry of the agent services: where each one listens and how the router
+reaches it, plus the health and readiness endpoints every agent exposes.
+
+Ports and URLs default to the local development layout and can be
+overridden per service, e.g. DEMAND_PREDICTOR_PORT=6000 or
+DEMAND_PREDICTOR_URL=http://demand:5000.
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import jsonify
+
+# name -> (module, default port)
+SERVICES = {
+    "demand_predictor": ("demand_predictor", 5000),
+    "ai": ("ai", 5001),
+    "supply_checker": ("supply_checker", 5002),
+    "order_optimizer": ("order_optimizer", 5003),
+    "order_generator": ("order_generator", 5004),
+    "auto_reply": ("auto_reply_agent", 5005),
+    "negotiation": ("negotiation_service", 5006),
+}
+
+
+def port(name):
+    return int(os.getenv(f"{name.upper()}_PORT", SERVICES[name][1]))
+
+
+def base_url(name):
+    return os.getenv(f"{name.upper()}_URL", f"http://127.0.0.1:{port(name)}").rstrip("/")
+
+
+def url(name, path):
+    """Full URL of path on the named agent."""
+    return base_url(name) + path
+
+
+# ----------------------
+# Health and readiness
+# ----------------------
+_started_at = time.time()
+_warmups = {}
+_ready = set()
+_ready_lock = threading.Lock()
+_warming = set()
+_warming_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def warm(name):
+    """Run the service's warmup once (loading models etc.) and mark it ready."""
+    with _ready_lock:
+        if name in _ready:
+            return
+        warmup = _warmups.get(name)
+        if warmup:
+            warmup()
+        _ready.add(name)
+
+
+def _warm_in_background(name):
+    """Start warm(name) on a thread unless it is done or already running."""
+    with _warming_lock:
+        if name in _ready or name in _warming:
+            return
+        _warming.add(name)
+
+    def run():
+        try:
+            warm(name)
+        except Exception:
+            logger.exception(f"warmup of {name} failed")
+        finally:
+            with _warming_lock:
+                _warming.discard(name)
+
+    threading.Thread(target=run, name=f"warmup-{name}", daemon=True).start()
+
+
+def init_app(app, name, warmup=None):
+    """
+    Register /healthz and /readyz on app. /healthz answers as soon as the
+    process serves requests; /readyz returns 503 until warm(name) has run.
+    serve.py warms before forking; under the development entry points the
+    first request (usually a /readyz probe) starts the warmup in the
+    background. Services without a warmup are ready immediately.
+    """
+    _warmups[name] = warmup
+    app.config["SERVICE_NAME"] = name  # log_setup labels records with it
+    if warmup is None:
+        _ready.add(name)
+
+    @app.before_request
+    def _warm_on_first_request():
+        if name not in _ready:
+            _warm_in_background(name)
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        return jsonify({"status": "ok", "service": name, "pid": os.getpid(),
+                        "uptime_s": round(time.time() - _started_at, 1)})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        if name not in _ready:
+            return jsonify({"status": "starting", "service": name}), 503
+        return jsonify({"status": "ready", "service": name})
@@ -0,0 +1,530 @@
+"""
+Low-stock monitor fed by stock and sales events.
+
+Stock coverage and reorder quantities used to be computed only when
+someone asked predict_demand about one product, so stockouts were found
+late and users kept polling the chat. The monitor keeps, per tenant and
+SKU, the quantity on hand and an exponentially weighted depletion rate
+(units/day, half-life MONITOR_HALF_LIFE_DAYS). Each event updates both in
+O(1):
+
+    rate <- rate * exp(-dt / tau) + qty_sold / tau
+
+Coverage is qty / rate in days. A SKU turns "low" below MONITOR_LOW_DAYS
+of coverage and "out" at zero stock. It only goes back to "ok" above
+MONITOR_CLEAR_DAYS, so a SKU hovering at the threshold does not flap.
+Every state change is an alert with a reorder quantity for
+MONITOR_TARGET_DAYS of cover. Alerts are kept in order per tenant and
+can be read in two ways: long-polled through /monitor/alerts, or POSTed
+to MONITOR_WEBHOOK_URL (with retries).
+
+Events come from the backend as orders are processed (POST
+/monitor/events). The full stock and transactions of each new /ai dataset
+version re-seed the SKUs in the background. State lives in SQLite
+(MONITOR_PATH), so every worker shares it. MONITOR_PATH="" turns the
+monitor off.
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the single-process development server runs there
+    fcntl = None
+
+MONITOR_PATH = os.getenv("MONITOR_PATH", "monitor.sqlite3")
+HALF_LIFE_DAYS = float(os.getenv("MONITOR_HALF_LIFE_DAYS", 14))
+LOW_DAYS = float(os.getenv("MONITOR_LOW_DAYS", 7))
+CLEAR_DAYS = float(os.getenv("MONITOR_CLEAR_DAYS", 10))  # hysteresis: a low SKU clears only above this
+TARGET_DAYS = float(os.getenv("MONITOR_TARGET_DAYS", 30))
+WEBHOOK_URL = os.getenv("MONITOR_WEBHOOK_URL", "")
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("MONITOR_WEBHOOK_MAX_ATTEMPTS", 8))
+RETENTION_S = float(os.getenv("MONITOR_ALERT_RETENTION_S", 7 * 86400))
+MAX_WAIT_S = 25  # longest /monitor/alerts long-poll
+# Long polls waiting at once per worker; each holds a router thread, so more are answered 429
+MAX_WAITERS = int(os.getenv("MONITOR_MAX_WAITERS", 2))
+POLL_S = 1  # how often waiters and the webhook sender look for alerts written by other workers
+DAY_S = 86400
+TAU_S = HALF_LIFE_DAYS * DAY_S / math.log(2)
+
+OK, LOW, OUT = "ok", "low", "out"
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("monitor_events_total", "counter", "Stock monitor events applied, by type.")
+metrics.describe("monitor_alerts_total", "counter", "Stock monitor alerts raised, by new state.")
+metrics.describe("monitor_webhook_total", "counter", "Stock monitor webhook deliveries by outcome.")
+metrics.describe("monitor_alert_delivery_seconds", "histogram", "Time from an alert to its webhook delivery.")
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def event_time(value, now):
+    """Epoch seconds of an event's "at"/createdAt (ISO text, seconds or milliseconds); now when missing."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = value / 1000 if value > 1e11 else float(value)
+    elif isinstance(value, dict) and "_seconds" in value:  # a Firestore Timestamp serialized as JSON
+        seconds = float(value["_seconds"])
+    elif value:
+        try:
+            parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            return now
+        seconds = (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+    else:
+        return now
+    return min(seconds, now)
+
+
+# ----------------------
+# Per-SKU arithmetic
+# ----------------------
+def decayed(rate, rate_at, at):
+    """A rate (units/second) as of time at, decayed since rate_at."""
+    if not rate or at <= rate_at:
+        return rate or 0.0
+    return rate * math.exp(-(at - rate_at) / TAU_S)
+
+
+def add_sale(rate, rate_at, qty, at):
+    """(rate, rate_at) after qty units sold at time at; sales older than rate_at are weighted by their age."""
+    if at >= rate_at:
+        return decayed(rate, rate_at, at) + qty / TAU_S, at
+    return rate + qty / TAU_S * math.exp(-(rate_at - at) / TAU_S), rate_at
+
+
+def classify(previous, qty, daily_rate):
+    """"out", "low" or "ok" for a SKU, staying low until coverage is back above CLEAR_DAYS."""
+    if qty <= 0:
+        return OUT
+    coverage = qty / daily_rate if daily_rate > 0 else math.inf
+    if coverage < LOW_DAYS or (previous in (LOW, OUT) and coverage < CLEAR_DAYS):
+        return LOW
+    return OK
+
+
+def describe_sku(row, now):
+    """Public view of a SKU row: rate per day, coverage in days and reorder quantity as of now."""
+    daily_rate = decayed(row["rate"], row["rate_at"], now) * DAY_S
+    coverage = row["qty"] / daily_rate if daily_rate > 0 else None
+    return {
+        "product": row["product_name"] or row["product"],
+        "product_norm": row["product"],
+        "qty": row["qty"],
+        "daily_rate": round(daily_rate, 3),
+        "coverage_days": round(coverage, 1) if coverage is not None else None,
+        "reorder_qty": max(0, math.ceil(TARGET_DAYS * daily_rate - row["qty"])),
+        "state": row["state"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _changes(event, now):
+    """(product_name, sold qty, absolute stock or None, time) for each SKU an event touches."""
+    if not isinstance(event, dict):
+        return []
+    kind = event.get("type", "sale")
+    at = event_time(event.get("at") or event.get("createdAt"), now)
+    if kind == "transaction":
+        items = event.get("items") if isinstance(event.get("items"), list) else []
+        return [
+            (item.get("product_name"), _number(item.get("qty")) or 0.0, _number(item.get("stock")), at)
+            for item in items if isinstance(item, dict) and item.get("product_name")
+        ]
+    name = event.get("product_name") or event.get("name")
+    if not name:
+        return []
+    if kind == "stock":
+        return [(name, 0.0, _number(event.get("qty")), at)]
+    return [(name, _number(event.get("qty")) or 0.0, _number(event.get("stock")), at)]
+
+
+# ----------------------
+# Store
+# ----------------------
+_COLUMNS = ("product", "product_name", "qty", "rate", "rate_at", "state", "updated_at")
+
+
+class MonitorStore:
+    """SQLite-backed SKU state and alert log shared by the router's workers."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS skus (
+                tenant TEXT,
+                product TEXT,
+                product_name TEXT,
+                qty REAL,
+                rate REAL,
+                rate_at REAL,
+                state TEXT,
+                updated_at REAL,
+                PRIMARY KEY (tenant, product)
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS alerts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant TEXT,
+                product TEXT,
+                state TEXT,
+                previous TEXT,
+                data TEXT,
+                created_at REAL,
+                delivered_at REAL,
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS alerts_tenant ON alerts (tenant, seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seeds (tenant TEXT PRIMARY KEY, version TEXT, seeded_at REAL)")
+
+    def _row(self, tenant, product):
+        row = self._conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM skus WHERE tenant = ? AND product = ?", (tenant, product)
+        ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def _save(self, tenant, rows, previous_states, now):
+        """Write changed SKU rows and an alert for each one whose state changed. Returns the alerts."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO skus (tenant, product, product_name, qty, rate, rate_at, state, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(tenant, *(row[c] for c in _COLUMNS)) for row in rows],
+        )
+        alerts = []
+        for row in rows:
+            previous = previous_states.get(row["product"])
+            if row["state"] == (previous or OK):
+                continue
+            data = {**describe_sku(row, now), "previous_state": previous or OK}
+            seq = self._conn.execute(
+                "INSERT INTO alerts (tenant, product, state, previous, data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (tenant, row["product"], row["state"], previous or OK, json.dumps(data), now),
+            ).lastrowid
+            alerts.append({"seq": seq, "tenant": tenant, "created_at": now, **data})
+            metrics.inc("monitor_alerts_total", state=row["state"])
+        return alerts
+
+    def apply_events(self, tenant, events, now=None):
+        """Apply sale and stock events in order. Returns (SKUs touched, alerts raised)."""
+        now = now or time.time()
+        rows, previous_states = {}, {}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for event in events:
+                    for name, sold, stock, at in _changes(event, now):
+                        product = normalize_name(name)
+                        row = rows.get(product)
+                        if row is None:
+                            row = self._row(tenant, product) or {
+                                "product": product, "product_name": name, "qty": 0.0,
+                                "rate": 0.0, "rate_at": at, "state": None, "updated_at": now,
+                            }
+                            previous_states[product] = row["state"]
+                            rows[product] = row
+                        if sold > 0:
+                            row["rate"], row["rate_at"] = add_sale(row["rate"], row["rate_at"], sold, at)
+                        row["qty"] = stock if stock is not None else row["qty"] - sold
+                        row["updated_at"] = now
+                    kind = event.get("type", "sale") if isinstance(event, dict) else "invalid"
+                    metrics.inc("monitor_events_total", type=kind)
+                for row in rows.values():
+                    row["state"] = classify(row["state"], row["qty"], decayed(row["rate"], row["rate_at"], now) * DAY_S)
+                alerts = self._save(tenant, list(rows.values()), previous_states, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [describe_sku(row, now) for row in rows.values()], alerts
+
+    def seed(self, tenant, version, stock_data, transaction_data, now=None):
+        """
+        Reset the tenant's SKUs to a full dataset: stock from the first row
+        per product, rates replayed from every line item. Products no longer
+        stocked are dropped. Returns the alerts raised, or None when another
+        worker already seeded this version.
+        """
+        now = now or time.time()
+        seeded = {}
+        for row in stock_data or []:
+            if not isinstance(row, dict):
+                continue
+            name = row.get("product_name") or row.get("name")
+            product = normalize_name(name)
+            if product and product not in seeded:
+                seeded[product] = {"product": product, "product_name": name, "qty": _number(row.get("qty")) or 0.0,
+                                   "rate": 0.0, "rate_at": now, "state": None, "updated_at": now}
+        for tx in transaction_data or []:
+            if not isinstance(tx, dict):
+                continue
+            at = event_time(tx.get("createdAt"), now)
+            items = tx.get("items") if isinstance(tx.get("items"), list) else [tx]
+            for item in items:
+                row = seeded.get(normalize_name(item.get("product_name"))) if isinstance(item, dict) else None
+                qty = _number(item.get("qty")) if row is not None else None
+                if qty:
+                    row["rate"] += qty / TAU_S * math.exp(-(now - at) / TAU_S)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self._conn.execute("SELECT version FROM seeds WHERE tenant = ?", (tenant,)).fetchone()
+                if done and done[0] == version:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                previous_states = dict(self._conn.execute(
+                    "SELECT product, state FROM skus WHERE tenant = ?", (tenant,)
+                ).fetchall())
+                for row in seeded.values():
+                    row["state"] = classify(previous_states.get(row["product"]), row["qty"], row["rate"] * DAY_S)
+                self._conn.execute("DELETE FROM skus WHERE tenant = ?", (tenant,))
+                alerts = self._save(tenant, list(seeded.values()), previous_states, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO seeds (tenant, version, seeded_at) VALUES (?, ?, ?)", (tenant, version, now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return alerts
+
+    def status(self, tenant, product=None, state=None):
+        """SKUs of a tenant (one product, or those in one state): out of stock first, then by coverage."""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM skus WHERE tenant = ?"
+        params = [tenant]
+        if product:
+            query += " AND product = ?"
+            params.append(normalize_name(product))
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        now = time.time()
+        skus = [describe_sku(dict(zip(_COLUMNS, row)), now) for row in rows]
+        urgency = {OUT: 0, LOW: 1}
+        skus.sort(key=lambda s: (urgency.get(s["state"], 2), math.inf if s["coverage_days"] is None else s["coverage_days"]))
+        return skus
+
+    def alerts_after(self, tenant, after=0, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, created_at, data FROM alerts WHERE tenant = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (tenant, after, limit),
+            ).fetchall()
+        return [{"seq": seq, "tenant": tenant, "created_at": created_at, **json.loads(data)}
+                for seq, created_at, data in rows]
+
+    def undelivered(self, now, limit=100):
+        """Alerts due for a webhook attempt."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, tenant, created_at, attempts, data FROM alerts WHERE delivered_at IS NULL "
+                "AND attempts < ? AND next_attempt_at <= ? ORDER BY seq LIMIT ?",
+                (WEBHOOK_MAX_ATTEMPTS, now, limit),
+            ).fetchall()
+        return [{"seq": seq, "tenant": tenant, "created_at": created_at, "attempts": attempts, **json.loads(data)}
+                for seq, tenant, created_at, attempts, data in rows]
+
+    def mark_delivered(self, seqs, now):
+        with self._lock:
+            self._conn.executemany("UPDATE alerts SET delivered_at = ? WHERE seq = ?", [(now, s) for s in seqs])
+
+    def mark_failed(self, seqs, now):
+        """Count a failed attempt and back off exponentially, up to five minutes."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE alerts SET attempts = attempts + 1, next_attempt_at = ? + MIN(300, 1 << attempts) WHERE seq = ?",
+                [(now, s) for s in seqs],
+            )
+
+    def purge(self, before):
+        with self._lock:
+            self._conn.execute("DELETE FROM alerts WHERE created_at < ?", (before,))
+
+
+# ----------------------
+# Monitor
+# ----------------------
+class TooManyWaiters(Exception):
+    """Raised when MAX_WAITERS long polls are already waiting in this worker."""
+
+
+class Monitor:
+    def __init__(self, path=MONITOR_PATH):
+        self.path = path
+        self.store = MonitorStore(path)
+        self._known_versions = {}  # tenant -> last version seeded by this process
+        self._seeder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="monitor-seed")
+        self._alerted = threading.Condition()
+        self._waiters = threading.BoundedSemaphore(MAX_WAITERS)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="monitor", daemon=True)
+        self._thread.start()
+
+    def apply_events(self, tenant, events):
+        with metrics.timed("monitor_events"):
+            skus, alerts = self.store.apply_events(tenant, events)
+        if alerts:
+            self._notify(alerts)
+        return skus, alerts
+
+    def observe(self, tenant, version, stock_data, transaction_data):
+        """Re-seed the tenant in the background when its dataset version is new to this process."""
+        if self._known_versions.get(tenant) == version:
+            return
+        self._known_versions[tenant] = version
+        self._seeder.submit(self._seed, tenant, version, stock_data, transaction_data)
+
+    def _seed(self, tenant, version, stock_data, transaction_data):
+        try:
+            with metrics.timed("monitor_seed"):
+                alerts = self.store.seed(tenant, version, stock_data, transaction_data)
+            if alerts:
+                self._notify(alerts)
+            if alerts is not None:
+                logger.info("monitor seeded", extra={"tenant": tenant, "version": version, "alerts": len(alerts)})
+        except Exception:
+            logger.exception("monitor seed failed")
+            self._known_versions.pop(tenant, None)
+
+    def _notify(self, alerts):
+        for alert in alerts:
+            logger.info("stock alert", extra={"tenant": alert["tenant"], "product": alert["product"],
+                                              "state": alert["state"], "coverage_days": alert["coverage_days"]})
+        with self._alerted:
+            self._alerted.notify_all()
+        self._wake.set()
+
+    def wait_for_alerts(self, tenant, after, wait_s):
+        """
+        Alerts after seq, waiting up to wait_s for the first one (raised by
+        any worker). Raises TooManyWaiters when it would have to wait while
+        MAX_WAITERS others already are.
+        """
+        deadline = time.monotonic() + max(0.0, min(wait_s, MAX_WAIT_S))
+        alerts = self.store.alerts_after(tenant, after)
+        if alerts or deadline <= time.monotonic():
+            return alerts
+        if not self._waiters.acquire(blocking=False):
+            raise TooManyWaiters()
+        try:
+            while True:
+                alerts = self.store.alerts_after(tenant, after)
+                remaining = deadline - time.monotonic()
+                if alerts or remaining <= 0 or self._stop.is_set():
+                    return alerts
+                with self._alerted:
+                    self._alerted.wait(min(POLL_S, remaining))
+        finally:
+            self._waiters.release()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._alerted:
+            self._alerted.notify_all()
+        self._seeder.shutdown(wait=True)
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if WEBHOOK_URL:
+                    self._deliver_locked()
+                if time.time() - last_purge > 3600:
+                    self.store.purge(time.time() - RETENTION_S)
+                    last_purge = time.time()
+            except Exception:
+                logger.exception("monitor webhook sender failed")
+            self._wake.wait(POLL_S)
+            self._wake.clear()
+
+    def _deliver_locked(self):
+        """Deliver unless another worker is already delivering from the same store."""
+        if fcntl is None:
+            return self.deliver()
+        with open(self.path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            return self.deliver()
+
+    def deliver(self):
+        """POST due alerts to the webhook in one batch; failures are retried with backoff."""
+        alerts = self.store.undelivered(time.time())
+        if not alerts:
+            return
+        seqs = [a["seq"] for a in alerts]
+        try:
+            response = requests.post(WEBHOOK_URL, json={"alerts": alerts}, timeout=5)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("monitor webhook failed: %s", e)
+            metrics.inc("monitor_webhook_total", outcome="failed")
+            self.store.mark_failed(seqs, time.time())
+            return
+        now = time.time()
+        self.store.mark_delivered(seqs, now)
+        metrics.inc("monitor_webhook_total", outcome="delivered")
+        for alert in alerts:
+            metrics.observe("monitor_alert_delivery_seconds", now - alert["created_at"])
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """The process's monitor, started on first use; None when MONITOR_PATH is empty."""
+    global _monitor
+    if not MONITOR_PATH:
+        return None
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = Monitor()
+    return _monitor
+
+
+def shutdown_monitor():
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            _monitor.stop()
+            _monitor = None
+
+
+def observe_request(tenant, version, stock_data, transaction_data):
+    """Queue a re-seed of the tenant's SKUs when a request brings a new dataset version."""
+    monitor = get_monitor()
+    if monitor is None or not stock_data:
+        return
+    monitor.observe(tenant, version, stock_data, transaction_data)
@@ -0,0 +1,559 @@
+"""
+Bounded-memory ingestion of large agent request bodies.
+
+request.get_json() holds the whole payload as Python dicts, and the agents
+then copy it into DataFrames (flattening every transaction item once more),
+so a worker peaks at several times the body size. read_request() instead
+parses the body incrementally: top-level fields are decoded one at a time,
+and stock_data / transaction_data elements are decoded one element at a
+time and appended to typed column buffers (int64/float64 arrays, interned
+strings or categorical codes, timestamps as epoch seconds). Only the
+requested columns are kept. Rows outside the filters (a target product, a time window) are
+dropped as they are read:
+
+    payload = stream_ingest.read_request(
+        request, STOCK_COLUMNS, ITEM_COLUMNS,
+        plan=lambda fields: stream_ingest.Filters(products={"rice"}, since=three_months_ago),
+    )
+    df_stock = payload.stock.to_frame(normalized={"product_name": "name_norm"})
+    df_items = payload.items.to_frame()
+
+plan() is called with the scalar fields read so far (e.g. "query") when the
+first array starts, so callers that send small fields first get their
+filters applied. Bodies over INGEST_MAX_BODY_BYTES are rejected from
+Content-Length before reading, and the column buffers may not grow past
+INGEST_MEMORY_BUDGET_BYTES. Both raise PayloadTooLarge (413).
+
+Bodies sent as msgpack (see wire_format) go through read_msgpack() and
+end up in the same column buffers.
+"""
+import codecs
+import json
+import logging
+import math
+import os
+import re
+from array import array
+from datetime import datetime
+
+from flask import jsonify
+
+import metrics
+import wire_format
+
+MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", 512 * 1024 * 1024))
+MEMORY_BUDGET_BYTES = int(os.getenv("INGEST_MEMORY_BUDGET_BYTES", 128 * 1024 * 1024))
+CHUNK_BYTES = 64 * 1024
+BUDGET_CHECK_ROWS = 1024  # rows between memory budget checks
+
+# Column kinds
+STR = "str"
+NAME = "name"  # repeated strings, read into a categorical
+NUM = "num"
+TIME = "time"
+
+ARRAY_FIELDS = ("stock_data", "transaction_data")
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("ingest_rejected_total", "counter", "Request bodies rejected by streaming ingestion.")
+
+_EPOCH = datetime(1970, 1, 1)
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class MalformedPayload(ValueError):
+    pass
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+def epoch_seconds(value):
+    """ISO createdAt -> seconds since the epoch in the writer's wall time (as pandas tz_localize(None) does)."""
+    if not value:
+        return math.nan
+    text = str(value).strip().replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return math.nan
+    return (parsed.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+# ----------------------
+# Column buffers
+# ----------------------
+class _NumberColumn:
+    """int64 until a fractional, missing or out-of-range value arrives, then float64 (missing = NaN)."""
+
+    def __init__(self):
+        self.values = array("q")
+        self.ints = True
+        self.seen = False
+
+    def _widen(self):
+        self.values = array("d", self.values)
+        self.ints = False
+
+    def append(self, value):
+        kind = type(value)  # exact types: bool is not a quantity
+        if kind is int and self.ints:
+            try:
+                self.values.append(value)
+                self.seen = True
+                return
+            except OverflowError:
+                pass
+        elif kind is str:
+            try:
+                value, kind = float(value), float
+            except ValueError:
+                pass
+        if self.ints:
+            self._widen()
+        if kind is int or kind is float:
+            self.seen = True
+            self.values.append(float(value))
+        else:
+            self.values.append(math.nan)
+
+    def nbytes(self):
+        return self.values.buffer_info()[1] * self.values.itemsize
+
+    def series(self):
+        """The values as the smallest numpy dtype that holds them exactly (int8..int64, else float32/64)."""
+        import numpy as np
+        values = np.frombuffer(self.values, dtype=np.int64 if self.ints else np.float64)
+        if not len(values):
+            return values
+        if self.ints:
+            low, high = values.min(), values.max()
+            for dtype in (np.int8, np.int16, np.int32):
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                    return values.astype(dtype)
+            return values
+        narrow = values.astype(np.float32)
+        return narrow if np.array_equal(narrow, values, equal_nan=True) else values
+
+    def get(self, i):
+        value = self.values[i]
+        return None if value != value else value  # NaN -> missing
+
+
+class _TimeColumn(_NumberColumn):
+    """Epoch seconds as float64; NaN for missing or unparseable timestamps."""
+
+    def __init__(self):
+        self.values = array("d")
+        self.ints = False
+        self.seen = False
+
+    def append(self, value):
+        self.values.append(value)
+        self.seen = self.seen or value == value
+
+    def series(self):
+        import numpy as np
+        import pandas as pd
+        return pd.to_datetime(np.frombuffer(self.values, dtype=np.float64), unit="s")
+
+
+class _StringColumn:
+    """Python strings, interned per column so repeated names (products, suppliers) are stored once."""
+
+    def __init__(self):
+        self.values = []
+        self._pool = {}
+        self._pool_bytes = 0
+        self.seen = False
+
+    def append(self, value):
+        if value is None:
+            self.values.append(None)
+            return
+        if not isinstance(value, str):
+            value = str(value)
+        self.seen = True
+        pooled = self._pool.get(value)
+        if pooled is None:
+            pooled = self._pool[value] = value
+            self._pool_bytes += 49 + len(value)
+        self.values.append(pooled)
+
+    def nbytes(self):
+        return 8 * len(self.values) + self._pool_bytes
+
+    def series(self):
+        return self.values
+
+    def get(self, i):
+        return self.values[i]
+
+
+class _NameColumn:
+    """
+    Repeated names (products, suppliers) as int32 codes into a list of
+    distinct values, which becomes a pandas categorical without a pass over
+    the rows.
+    """
+
+    def __init__(self):
+        self.codes = array("i")
+        self.categories = []
+        self._index = {}
+        self._pool_bytes = 0
+        self.seen = False
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        if not isinstance(value, str):
+            value = str(value)
+        self.seen = True
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+            self._pool_bytes += 57 + len(value)
+        self.codes.append(code)
+
+    def nbytes(self):
+        return 4 * len(self.codes) + self._pool_bytes
+
+    def series(self):
+        import numpy as np
+        import pandas as pd
+        return pd.Categorical.from_codes(np.frombuffer(self.codes, dtype=np.int32), categories=self.categories)
+
+    def normalized(self):
+        """normalize_name() of every row, computed once per distinct value."""
+        import numpy as np
+        import pandas as pd
+        names = pd.Index(self.categories, dtype=object).str.strip().str.lower()
+        remap, unique = pd.factorize(names)
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        remap = np.append(remap.astype(np.int32), np.int32(-1))  # code -1 (missing) stays missing
+        return pd.Categorical.from_codes(remap[codes], categories=unique)
+
+    def get(self, i):
+        code = self.codes[i]
+        return self.categories[code] if code >= 0 else None
+
+
+_COLUMN_TYPES = {STR: _StringColumn, NAME: _NameColumn, NUM: _NumberColumn, TIME: _TimeColumn}
+
+
+class Columns:
+    """Typed column buffers for one kind of row."""
+
+    def __init__(self, spec):
+        self.spec = dict(spec)
+        self.columns = {name: _COLUMN_TYPES[kind]() for name, kind in self.spec.items()}
+        self.rows = 0
+
+    def append(self, row):
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+        self.rows += 1
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def to_frame(self, normalized=None):
+        """
+        DataFrame of the columns that had at least one value, with compact
+        dtypes (see the column types). normalized maps a name column to a
+        new column holding its normalize_name() values, computed with
+        vectorized string operations.
+        """
+        import pandas as pd
+        data = {name: column.series() for name, column in self.columns.items() if column.seen}
+        for source, target in (normalized or {}).items():
+            column = self.columns.get(source)
+            if column is None or not column.seen:
+                continue
+            if isinstance(column, _NameColumn):
+                data[target] = column.normalized()
+            else:
+                data[target] = pd.Series(column.values, dtype=object).str.strip().str.lower().fillna("")
+        return pd.DataFrame(data)
+
+    def records(self):
+        """Rows as dicts without the missing values, for code that loops over the original JSON rows."""
+        names = [(name, column) for name, column in self.columns.items() if column.seen]
+        for i in range(self.rows):
+            record = {}
+            for name, column in names:
+                value = column.get(i)
+                if value is not None:
+                    record[name] = value
+            yield record
+
+
+# ----------------------
+# Incremental parser
+# ----------------------
+class _JsonStream:
+    """A JSON text read from a byte stream in chunks, decoded one value at a time."""
+
+    def __init__(self, stream, max_bytes, max_buffer):
+        self._stream = stream
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._max_bytes = max_bytes
+        self._max_buffer = max_buffer
+        self.bytes_read = 0
+
+    def _fill(self, at_least=0):
+        if self._eof:
+            return False
+        chunk = self._stream.read(max(CHUNK_BYTES, at_least))
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        if not chunk:
+            self._eof = True
+            self._buf += self._utf8.decode(b"", final=True)
+            return False
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self._max_bytes:
+            raise PayloadTooLarge(f"Request body exceeds {self._max_bytes} bytes")
+        self._buf += self._utf8.decode(chunk)
+        if len(self._buf) > self._max_buffer:
+            raise PayloadTooLarge(f"A single JSON value exceeds {self._max_buffer} bytes")
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it; "" at the end of the body."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise MalformedPayload(f"Invalid JSON body: expected {char!r} near byte {self.bytes_read}")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more of the body until it is all buffered."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if not self._fill(at_least=len(self._buf) - self._pos):  # grow with the value, not chunk by chunk
+                    raise MalformedPayload(f"Invalid JSON body: {e.msg}") from e
+                continue
+            # A number ending at the buffer's edge may continue in the next chunk
+            if end == len(self._buf) and isinstance(value, (int, float)) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def elements(self):
+        """Yield the elements of the JSON array starting here, one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise MalformedPayload(f"Invalid JSON body: expected ',' or ']' near byte {self.bytes_read}")
+
+
+class Filters:
+    """
+    Which rows to keep. products: normalized names (None keeps all);
+    since / until: epoch-second bounds on line item createdAt; skip: drop
+    every row (the caller answers from somewhere else).
+    """
+
+    def __init__(self, products=None, since=None, until=None, skip=False):
+        self.products = {normalize_name(p) for p in products} if products is not None else None
+        self.since = (since - _EPOCH).total_seconds() if isinstance(since, datetime) else since
+        self.until = (until - _EPOCH).total_seconds() if isinstance(until, datetime) else until
+        self.skip = skip
+
+    def keeps_product(self, *names):
+        return self.products is None or any(normalize_name(n) in self.products for n in names)
+
+    def keeps_time(self, ts):
+        if self.since is None and self.until is None:
+            return True
+        if ts != ts:  # no usable createdAt: outside any window
+            return False
+        return (self.since is None or ts >= self.since) and (self.until is None or ts < self.until)
+
+
+class Payload:
+    """Scalar fields, stock rows and transaction line items read from one body."""
+
+    def __init__(self, stock_spec, item_spec):
+        self.fields = {}
+        self.stock = Columns(stock_spec)
+        self.items = Columns(item_spec)
+        self.counts = {name: 0 for name in ARRAY_FIELDS}  # elements in the body, before filtering
+        self.bytes_read = 0
+
+    def nbytes(self):
+        return self.stock.nbytes() + self.items.nbytes()
+
+
+def _add_stock(payload, row, filters):
+    if not isinstance(row, dict) or not filters.keeps_product(row.get("product_name"), row.get("name")):
+        return
+    payload.stock.append(row)
+
+
+def _add_transaction(payload, tx, filters):
+    """Append a transaction's line items (or the row itself when transactions are flat)."""
+    if not isinstance(tx, dict):
+        return
+    items = tx.get("items")
+    items = items if isinstance(items, list) else [tx]
+    tx_time = epoch_seconds(tx.get("createdAt"))
+    for item in items:
+        if not isinstance(item, dict) or not filters.keeps_product(item.get("product_name")):
+            continue
+        ts = tx_time if tx_time == tx_time or item is tx else epoch_seconds(item.get("createdAt"))
+        if not filters.keeps_time(ts):
+            continue
+        for name, column in payload.items.columns.items():
+            column.append(ts if type(column) is _TimeColumn else item.get(name, tx.get(name)))
+        payload.items.rows += 1
+
+
+_ADDERS = {"stock_data": _add_stock, "transaction_data": _add_transaction}
+
+
+def read(stream, stock_spec, item_spec, plan=None, max_bytes=MAX_BODY_BYTES, budget=MEMORY_BUDGET_BYTES):
+    """
+    Parse a JSON object body from a byte stream into a Payload. The
+    stock_data and transaction_data arrays go to column buffers, with the
+    Filters plan(fields) returns; every other field is kept as decoded.
+    """
+    reader = _JsonStream(stream, max_bytes, budget)
+    payload = Payload(stock_spec, item_spec)
+    filters = None
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return payload
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise MalformedPayload("Invalid JSON body: object keys must be strings")
+        reader.expect(":")
+        if key in ARRAY_FIELDS and reader.peek() == "[":
+            if filters is None:
+                filters = (plan(payload.fields) if plan else None) or Filters()
+            _add_elements(payload, key, reader.elements(), filters, budget)
+        else:
+            payload.fields[key] = reader.value()
+        char = reader.peek()
+        reader._pos += 1
+        if char == "}":
+            break
+        if char != ",":
+            raise MalformedPayload(f"Invalid JSON body: expected ',' or '}}' near byte {reader.bytes_read}")
+    if reader.peek() != "":
+        raise MalformedPayload("Invalid JSON body: trailing data")
+    payload.bytes_read = reader.bytes_read
+    return _checked(payload, budget)
+
+
+def read_msgpack(data, stock_spec, item_spec, plan=None, budget=MEMORY_BUDGET_BYTES):
+    """
+    read() for a wire_format msgpack body. The body is decoded at once, but
+    its columnar tables are turned into rows one at a time, so only the
+    kept rows reach the column buffers. plan() sees every scalar field.
+    """
+    try:
+        body = wire_format.unpack(data, tables=True)
+    except Exception as e:
+        raise MalformedPayload(f"Invalid msgpack body: {e}") from e
+    if not isinstance(body, dict):
+        raise MalformedPayload("Invalid msgpack body: expected a map")
+    payload = Payload(stock_spec, item_spec)
+    arrays = {}
+    for key, value in body.items():
+        if key in ARRAY_FIELDS and isinstance(value, (wire_format.Table, list)):
+            arrays[key] = value
+        else:
+            payload.fields[key] = wire_format.expand(value)
+    filters = ((plan(payload.fields) if plan else None) or Filters()) if arrays else None
+    for key, value in arrays.items():
+        elements = value.rows() if isinstance(value, wire_format.Table) else map(wire_format.expand, value)
+        _add_elements(payload, key, elements, filters, budget)
+    payload.bytes_read = len(data)
+    return _checked(payload, budget)
+
+
+def _add_elements(payload, key, elements, filters, budget):
+    add = _ADDERS[key]
+    for n, element in enumerate(elements, 1):
+        payload.counts[key] += 1
+        if not filters.skip:
+            add(payload, element, filters)
+        if n % BUDGET_CHECK_ROWS == 0 and payload.nbytes() > budget:
+            raise PayloadTooLarge(f"{key} needs more than {budget} bytes after filtering")
+
+
+def _checked(payload, budget):
+    if payload.nbytes() > budget:
+        raise PayloadTooLarge(f"Request data needs more than {budget} bytes after filtering")
+    return payload
+
+
+@metrics.timed("ingest")
+def read_request(request, stock_spec, item_spec, plan=None):
+    """read() over a Flask request's body, rejecting it up front when Content-Length is over the limit."""
+    try:
+        if request.content_length is not None and request.content_length > MAX_BODY_BYTES:
+            raise PayloadTooLarge(f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        if wire_format.is_msgpack(request) and wire_format.available():
+            data = request.stream.read(MAX_BODY_BYTES + 1)
+            if len(data) > MAX_BODY_BYTES:
+                raise PayloadTooLarge(f"Request body exceeds {MAX_BODY_BYTES} bytes")
+            payload = read_msgpack(data, stock_spec, item_spec, plan)
+        else:
+            payload = read(request.stream, stock_spec, item_spec, plan)
+    except (PayloadTooLarge, MalformedPayload) as e:
+        metrics.inc("ingest_rejected_total", reason="too_large" if isinstance(e, PayloadTooLarge) else "malformed")
+        raise
+    logger.info("ingested", extra={
+        "body_bytes": payload.bytes_read,
+        "stock_rows": payload.counts["stock_data"],
+        "transactions": payload.counts["transaction_data"],
+        "kept_stock_rows": payload.stock.rows,
+        "kept_line_items": payload.items.rows,
+        "buffer_bytes": payload.nbytes(),
+    })
+    return payload
+
+
+def error_response(error):
+    """413 for an oversized body, 400 for one that is not a JSON or msgpack object."""
+    return jsonify({"error": str(error)}), 413 if isinstance(error, PayloadTooLarge) else 400
@@ -0,0 +1,47 @@
+"""
+Event framing for streamed agent responses.
+
+Agents stream newline-delimited JSON ({"event": ..., "data": ...} per line)
+to the router, and the router re-emits the same events to the dashboard as
+Server-Sent Events.
+"""
+import json
+
+from flask import Response, stream_with_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+SSE_MIMETYPE = "text/event-stream"
+
+
+def ndjson_event(event, data):
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def ndjson_response(events):
+    """Stream an iterable of (event, data) pairs as NDJSON."""
+    return Response(
+        stream_with_context(ndjson_event(event, data) for event, data in events),
+        mimetype=NDJSON_MIMETYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_response(events):
+    """Stream an iterable of (event, data) pairs as Server-Sent Events."""
+    return Response(
+        stream_with_context(sse_event(event, data) for event, data in events),
+        mimetype=SSE_MIMETYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def wants_stream(request, data=None):
+    """True when the caller asked for a streamed response."""
+    if data and data.get("stream"):
+        return True
+    accept = request.headers.get("Accept", "")
+    return SSE_MIMETYPE in accept or NDJSON_MIMETYPE in accept
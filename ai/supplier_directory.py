@@ -0,0 +1,339 @@
+"""
+Local supplier directory, searched before live web search.
+
+get_web_suppliers() runs a SerpAPI search and scrapes every result on each
+"best supplier for X" question, even for products whose suppliers we
+already know. The directory keeps suppliers from two sources in SQLite:
+- stock: supplierName, products and purchase_price from each tenant's
+  stock data, refreshed when the router sees a new dataset version;
+- web: earlier search results with their scraped contacts. These are
+  shared by all tenants and kept for SUPPLIER_WEB_TTL_S.
+
+Names, products, descriptions and contacts sit in an FTS5 full-text
+table ranked with BM25:
+
+    suppliers = supplier_directory.find_suppliers("organic rice")
+
+find_suppliers() answers from the directory when at least
+SUPPLIER_MIN_LOCAL of the hits actually carry the product. Otherwise it
+goes to the web, adds the results to the directory, and returns local and
+web suppliers together. SUPPLIER_DIRECTORY_PATH="" turns the directory
+off.
+"""
+import contextvars
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import metrics
+from supplier_service import get_web_suppliers
+
+DIRECTORY_PATH = os.getenv("SUPPLIER_DIRECTORY_PATH", "suppliers.sqlite3")
+MIN_LOCAL = int(os.getenv("SUPPLIER_MIN_LOCAL", 1))  # suppliers carrying the product needed to skip web search
+WEB_TTL_S = float(os.getenv("SUPPLIER_WEB_TTL_S", 30 * 86400))
+MAX_RESULTS = 5
+# BM25 column weights: name, products, description, contacts
+BM25_WEIGHTS = (2.0, 5.0, 1.0, 0.5)
+
+UNKNOWN_EMAIL = "info@unknown.com"
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("supplier_lookups_total", "counter", "Supplier lookups by where they were answered (local, web).")
+
+_request_tenant = contextvars.ContextVar("supplier_tenant", default="")
+
+
+def normalize_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
+
+
+def _tokens(text):
+    """Words of text, with a plural "s" dropped so "apples" matches "apple"."""
+    words = re.findall(r"\w+", normalize_name(text))
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+
+
+def _web_key(supplier):
+    host = urlparse(supplier.get("url") or "").netloc.lower()
+    return host[4:] if host.startswith("www.") else host or normalize_name(supplier.get("name"))
+
+
+# ----------------------
+# Store
+# ----------------------
+class SupplierDirectory:
+    """SQLite supplier rows, product associations and a BM25-ranked FTS5 index over both."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS suppliers (
+                id INTEGER PRIMARY KEY,
+                tenant TEXT,
+                source TEXT,
+                key TEXT,
+                name TEXT,
+                url TEXT,
+                email TEXT,
+                phone TEXT,
+                description TEXT,
+                rating TEXT,
+                updated_at REAL,
+                UNIQUE (tenant, source, key)
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS supplier_products (
+                supplier_id INTEGER,
+                product TEXT,
+                product_name TEXT,
+                records INTEGER,
+                avg_price REAL,
+                min_price REAL,
+                PRIMARY KEY (supplier_id, product)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS supplier_docs USING fts5("
+            "name, products, description, contacts, tokenize = 'porter unicode61')"
+        )
+        self._conn.commit()
+
+    def _index(self, supplier_id):
+        """Rewrite one supplier's full-text row from its tables."""
+        name, description, email, phone, url = self._conn.execute(
+            "SELECT name, description, email, phone, url FROM suppliers WHERE id = ?", (supplier_id,)
+        ).fetchone()
+        products = " ".join(row[0] for row in self._conn.execute(
+            "SELECT product_name FROM supplier_products WHERE supplier_id = ?", (supplier_id,)
+        ))
+        contacts = " ".join(c for c in (email, phone, url) if c and c not in (UNKNOWN_EMAIL, "N/A"))
+        self._conn.execute("DELETE FROM supplier_docs WHERE rowid = ?", (supplier_id,))
+        self._conn.execute(
+            "INSERT INTO supplier_docs (rowid, name, products, description, contacts) VALUES (?, ?, ?, ?, ?)",
+            (supplier_id, name, products, description or "", contacts),
+        )
+
+    def _delete(self, ids):
+        for supplier_id in ids:
+            self._conn.execute("DELETE FROM supplier_docs WHERE rowid = ?", (supplier_id,))
+            self._conn.execute("DELETE FROM supplier_products WHERE supplier_id = ?", (supplier_id,))
+            self._conn.execute("DELETE FROM suppliers WHERE id = ?", (supplier_id,))
+
+    def replace_stock(self, tenant, stock_data):
+        """Replace the tenant's stock-derived suppliers with those in stock_data. Returns how many."""
+        grouped = {}  # supplier key -> {"name", "products": {product: [name, records, prices]}}
+        for row in stock_data or []:
+            if not isinstance(row, dict):
+                continue
+            supplier = row.get("supplierName")
+            product_name = row.get("name") or row.get("product_name")
+            if not normalize_name(supplier) or not normalize_name(product_name):
+                continue
+            entry = grouped.setdefault(normalize_name(supplier), {"name": supplier.strip(), "products": {}})
+            product = entry["products"].setdefault(normalize_name(product_name), [product_name.strip(), 0, []])
+            product[1] += 1
+            price = row.get("purchase_price")
+            if isinstance(price, (int, float)) and not isinstance(price, bool) and price > 0:
+                product[2].append(float(price))
+
+        now = time.time()
+        with self._lock:
+            old = [r[0] for r in self._conn.execute(
+                "SELECT id FROM suppliers WHERE tenant = ? AND source = 'stock'", (tenant,)
+            )]
+            self._delete(old)
+            for key, entry in grouped.items():
+                supplier_id = self._conn.execute(
+                    "INSERT INTO suppliers (tenant, source, key, name, url, email, phone, description, rating, updated_at) "
+                    "VALUES (?, 'stock', ?, ?, '', ?, 'N/A', '', 'N/A', ?)",
+                    (tenant, key, entry["name"], UNKNOWN_EMAIL, now),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO supplier_products (supplier_id, product, product_name, records, avg_price, min_price) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(supplier_id, product, name, records,
+                      sum(prices) / len(prices) if prices else None, min(prices) if prices else None)
+                     for product, (name, records, prices) in entry["products"].items()],
+                )
+                self._index(supplier_id)
+            self._conn.commit()
+        return len(grouped)
+
+    def add_web_results(self, product_name, suppliers):
+        """Remember web search results for product_name, keyed by website, keeping known contacts."""
+        product = normalize_name(product_name)
+        now = time.time()
+        with self._lock:
+            for s in suppliers or []:
+                if not isinstance(s, dict) or not s.get("url"):
+                    continue  # error placeholders and results without a website
+                key = _web_key(s)
+                row = self._conn.execute(
+                    "SELECT id, email, phone FROM suppliers WHERE tenant = '' AND source = 'web' AND key = ?", (key,)
+                ).fetchone()
+                email = s.get("email") or UNKNOWN_EMAIL
+                phone = s.get("phone") or "N/A"
+                if row is None:
+                    supplier_id = self._conn.execute(
+                        "INSERT INTO suppliers (tenant, source, key, name, url, email, phone, description, rating, "
+                        "updated_at) VALUES ('', 'web', ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, s.get("name") or "Unknown Supplier", s["url"], email, phone,
+                         s.get("details") or "", str(s.get("rating", "N/A")), now),
+                    ).lastrowid
+                else:
+                    supplier_id = row[0]
+                    self._conn.execute(
+                        "UPDATE suppliers SET name = ?, url = ?, email = ?, phone = ?, description = ?, rating = ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (s.get("name") or "Unknown Supplier", s["url"],
+                         row[1] if email == UNKNOWN_EMAIL else email, row[2] if phone == "N/A" else phone,
+                         s.get("details") or "", str(s.get("rating", "N/A")), now, supplier_id),
+                    )
+                if product:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO supplier_products (supplier_id, product, product_name, records) "
+                        "VALUES (?, ?, ?, 0)",
+                        (supplier_id, product, product_name.strip()),
+                    )
+                self._index(supplier_id)
+            self._conn.commit()
+
+    def search(self, tenant, product_name, limit=MAX_RESULTS):
+        """
+        Suppliers for a product, best first: those that carry it (lowest
+        average purchase price first), then other BM25 matches.
+        """
+        tokens = _tokens(product_name)
+        if not tokens:
+            return []
+        query = " OR ".join(f'"{t}"' for t in dict.fromkeys(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.source, s.name, s.url, s.email, s.phone, s.description, s.rating, "
+                f"bm25(supplier_docs, {', '.join(map(str, BM25_WEIGHTS))}) AS score "
+                "FROM supplier_docs JOIN suppliers s ON s.id = supplier_docs.rowid "
+                "WHERE supplier_docs MATCH ? AND s.tenant IN (?, '') AND (s.source = 'stock' OR s.updated_at >= ?) "
+                "ORDER BY score LIMIT ?",
+                (query, tenant, time.time() - WEB_TTL_S, limit * 4),
+            ).fetchall()
+            products = {}
+            if rows:
+                ids = [r[0] for r in rows]
+                for supplier_id, name, records, avg_price in self._conn.execute(
+                    "SELECT supplier_id, product_name, records, avg_price FROM supplier_products "
+                    f"WHERE supplier_id IN ({', '.join('?' * len(ids))})", ids,
+                ):
+                    products.setdefault(supplier_id, []).append((name, records, avg_price))
+
+        wanted = set(tokens)
+        results = []
+        for supplier_id, source, name, url, email, phone, description, rating, score in rows:
+            carried = [p for p in products.get(supplier_id, []) if wanted <= set(_tokens(p[0]))]
+            prices = [p[2] for p in carried if p[2] is not None]
+            if source == "stock":
+                names = ", ".join(p[0] for p in (carried or products.get(supplier_id, []))[:5])
+                description = f"Supplies {names} in your stock records"
+                if prices:
+                    description += f", average purchase price {min(prices):.2f}"
+            results.append({
+                "name": name, "url": url, "details": description, "rating": rating,
+                "email": email, "phone": phone, "source": f"directory:{source}",
+                "carries_product": bool(carried),
+                "_rank": (not carried, min(prices) if prices else float("inf"), score),
+            })
+        results.sort(key=lambda r: r.pop("_rank"))
+        return results[:limit]
+
+    def stats(self, tenant):
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT source, COUNT(*) FROM suppliers WHERE tenant IN (?, '') GROUP BY source", (tenant,)
+            ).fetchall())
+        return {"tenant": tenant, "suppliers": counts}
+
+
+_directory = None
+_directory_failed = False
+_directory_lock = threading.Lock()
+
+
+def get_directory():
+    """
+    The process's directory, opened on first use; None when
+    SUPPLIER_DIRECTORY_PATH is empty or SQLite lacks FTS5.
+    """
+    global _directory, _directory_failed
+    if not DIRECTORY_PATH or _directory_failed:
+        return None
+    with _directory_lock:
+        if _directory is None and not _directory_failed:
+            try:
+                _directory = SupplierDirectory(DIRECTORY_PATH)
+            except sqlite3.OperationalError:
+                logger.warning("supplier directory disabled, falling back to web search", exc_info=True)
+                _directory_failed = True
+    return _directory
+
+
+# ----------------------
+# Router side
+# ----------------------
+_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="supplier-index")
+_known_versions = {}  # tenant -> last dataset version indexed by this process
+
+
+def _index_stock(tenant, version, stock_data):
+    try:
+        count = get_directory().replace_stock(tenant, stock_data)
+        logger.info("supplier directory indexed", extra={"tenant": tenant, "version": version, "suppliers": count})
+    except Exception:
+        logger.exception("supplier directory indexing failed")
+        _known_versions.pop(tenant, None)
+
+
+def observe_request(tenant, version, stock_data):
+    """Remember the request's tenant for find_suppliers() and re-index its stock suppliers when the version is new."""
+    _request_tenant.set(tenant or "")
+    if get_directory() is None or not stock_data or _known_versions.get(tenant) == version:
+        return
+    _known_versions[tenant] = version
+    _indexer.submit(_index_stock, tenant, version, stock_data)
+
+
+def _carriers(suppliers, need_contact):
+    return [s for s in suppliers if s["carries_product"] and (not need_contact or s["email"] != UNKNOWN_EMAIL)]
+
+
+def find_suppliers(product_name, need_contact=False):
+    """
+    Suppliers for product_name in get_web_suppliers() form, from the
+    directory when it knows enough of them (with an email when
+    need_contact), else with a web search added.
+    """
+    directory = get_directory()
+    local = []
+    if directory is not None and product_name:
+        with metrics.timed("supplier_directory_search"):
+            local = directory.search(_request_tenant.get(), product_name)
+        carriers = _carriers(local, need_contact)
+        if len(carriers) >= MIN_LOCAL:
+            metrics.inc("supplier_lookups_total", outcome="local")
+            return carriers if need_contact else local
+    metrics.inc("supplier_lookups_total", outcome="web")
+    web = get_web_suppliers(product_name)
+    if directory is not None and web:
+        try:
+            directory.add_web_results(product_name, web)
+        except Exception:
+            logger.exception("supplier directory update failed")
+    seen = {_web_key(s) for s in web if isinstance(s, dict)}
+    return [s for s in _carriers(local, need_contact) if _web_key(s) not in seen] + web
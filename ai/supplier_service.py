@@ -1,26 +1,34 @@
-from serpapi import GoogleSearch
 import time
 import requests
 from bs4 import BeautifulSoup
 import re
+import logging
 import os
 from dotenv import load_dotenv
+import deadline
+import metrics
 
 load_dotenv()  # Load environment variables from .env file
-serpapi_key = os.getenv("SERPAPI_API_KEY")
-if not serpapi_key:
-    raise ValueError("SERPAPI_API_KEY not found in environment variables.")
+logger = logging.getLogger(__name__)
+
+
+def serpapi_key():
+    key = os.getenv("SERPAPI_API_KEY")
+    if not key:
+        raise ValueError("SERPAPI_API_KEY not found in environment variables.")
+    return key
 
 # Regex patterns for email and phone number extraction
 EMAIL_REGEX = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
 PHONE_REGEX = r'(\+?\d{1,3}[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'
 
+@metrics.timed("scrape")
 def scrape_website_for_contact(url):
     """Scrape a website for email and phone number."""
     try:
         # Send request with a user-agent to avoid being blocked
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=10)
+        response = requests.get(url, headers=headers, timeout=deadline.timeout(10))
         response.raise_for_status()
         soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -61,7 +69,10 @@ def scrape_website_for_contact(url):
                         from urllib.parse import urljoin
                         contact_url = urljoin(url, contact_url)
                     try:
-                        contact_response = requests.get(contact_url, headers=headers, timeout=5)
+                        if not deadline.allows("scrape"):
+                            deadline.skip("scrape")
+                            break
+                        contact_response = requests.get(contact_url, headers=headers, timeout=deadline.timeout(5))
                         contact_response.raise_for_status()
                         contact_soup = BeautifulSoup(contact_response.text, 'html.parser')
                         contact_text = contact_soup.get_text(separator=' ', strip=True)
@@ -85,29 +96,40 @@ def scrape_website_for_contact(url):
                                     contact_phones.append(contact_phone)
                             phone = contact_phones[0] if contact_phones else None
                     except requests.exceptions.RequestException as e:
-                        print(f"Error scraping contact page {contact_url}: {e}")
+                        logger.warning("Error scraping contact page %s: %s", contact_url, e)
 
         return email or "info@unknown.com", phone or "N/A"
     except requests.exceptions.RequestException as e:
-        print(f"Error scraping {url}: {e}")
+        logger.warning("Error scraping %s: %s", url, e)
         return "info@unknown.com", "N/A"
     
 def get_web_suppliers(product_name):
+    if not deadline.allows("serpapi"):
+        deadline.skip("serpapi")
+        return []
     try:
+        from serpapi import GoogleSearch
+
         params = {
             "q": f"{product_name} suppliers near me",
-            "api_key": serpapi_key,
+            "api_key": serpapi_key(),
             "num": 5
         }
         search = GoogleSearch(params)
-        results = search.get_dict()
+        with metrics.timed("serpapi"):
+            results = search.get_dict()
 
         suppliers = []
         if 'organic_results' in results:
             for result in results['organic_results']:
                 url = result.get('link', '')
-                # Scrape website for contact details
-                email, phone = scrape_website_for_contact(url) if url else ("info@unknown.com", "N/A")
+                # Scrape website for contact details (skipped when the request budget is low)
+                if url and deadline.allows("scrape"):
+                    email, phone = scrape_website_for_contact(url)
+                else:
+                    if url:
+                        deadline.skip("scrape")
+                    email, phone = "info@unknown.com", "N/A"
                 suppliers.append({
                     "name": result.get('title', 'Unknown Supplier'),
                     "url": url,
@@ -121,7 +143,7 @@ def get_web_suppliers(product_name):
         time.sleep(1)
         return suppliers
     except requests.exceptions.RequestException as e:
-        print("serpAPI error:", e)
+        logger.error("serpAPI error: %s", e)
         return [{"name": "Error fetching suppliers", "url": "", "details": str(e)}]
 
 def format_suppliers(suppliers):
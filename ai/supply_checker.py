@@ -4,56 +4,91 @@ import statistics
 import logging
 import pandas as pd
 from dotenv import load_dotenv
-import os
-import google.generativeai as genai
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from llm_gateway import generate
+import analytics_store
+import deadline
+import log_setup
+import metrics
+import services
+import stream_ingest
+import tracing
+import wire_format
 
 # Load environment variables
-load_dotenv()
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-genai.configure(api_key=gemini_api_key)
+load_dotenv()  # GEMINI_API_KEY is checked by llm_gateway on the first model call
 
 
 # Logging
-logging.basicConfig(filename='supply_checker_logs.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log_setup.configure("supply_checker", "supply_checker_logs.txt")
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=1, max=60),
-    retry=retry_if_exception_type(Exception)
-)
 def generate_gemini_insight(prompt):
-    model = genai.GenerativeModel('gemini-2.0-flash-001')
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    # Retries, backoff and rate limiting are handled by the shared gateway
+    return generate(prompt, model='gemini-2.0-flash-001', call_site='supplier_insight',
+                    deadline=deadline.remaining()).strip()
 
 app = Flask(__name__)
+deadline.init_app(app, budget_s=10)
+services.init_app(app, "supply_checker")
+tracing.init_app(app, "supply_checker")
+metrics.init_app(app, "supply_checker")
+wire_format.init_app(app)
 CORS(app)
 
+# Stock columns kept by stream_ingest; rows for other products are dropped while the body is read
+STOCK_COLUMNS = {
+    "name": stream_ingest.NAME,
+    "supplierName": stream_ingest.NAME,
+    "qty": stream_ingest.NUM,
+    "purchase_price": stream_ingest.NUM,
+}
+
+
+def supplier_stats_from_body(product_name, stock_data):
+    """supplier -> {"total_qty", "avg_price"} over the stock rows for product_name."""
+    supplier_stats = {}
+    for stock in stock_data:
+        # If Firestore stock only has flat structure (name + qty)
+        if stock.get("name", "").lower() == product_name:
+            supplier = stock.get("supplierName", "Unknown")  # fallback if missing
+            if supplier not in supplier_stats:
+                supplier_stats[supplier] = {"total_qty": 0, "prices": []}
+            supplier_stats[supplier]["total_qty"] += stock.get("qty", 0)
+            if stock.get("purchase_price"):
+                supplier_stats[supplier]["prices"].append(stock["purchase_price"])
+    return {
+        supplier: {"total_qty": stats["total_qty"],
+                   "avg_price": statistics.mean(stats["prices"]) if stats["prices"] else 0}
+        for supplier, stats in supplier_stats.items()
+    }
+
+
+def supplier_stats_from_store(product_name, store, tenant):
+    """supplier_stats_from_body() over the tenant's current stock snapshot in the analytics store."""
+    return {
+        row["supplier"]: {"total_qty": row["total_qty"], "avg_price": row["avg_price"]}
+        for row in store.supplier_price_stats(tenant, product_name)
+    }
+
+
 @app.route("/supply-check", methods=["POST"])
 def supply_check():
     try:
-        data = request.get_json()
+        source = analytics_store.request_source()
+        payload = stream_ingest.read_request(request, STOCK_COLUMNS, {}, plan=lambda fields: stream_ingest.Filters(
+            skip=source is not None, products=[fields["product_name"]] if fields.get("product_name") else None,
+        ))
+        data = payload.fields
         query = data.get("query", "").lower()
         product_name = data.get("product_name", "").lower()
-        stock_data = data.get("stock_data", [])
 
-        if not product_name or not stock_data:
+        if not product_name or not (source or payload.counts["stock_data"]):
             return jsonify({"error": "Missing product_name or stock_data"}), 400
 
         # Collect suppliers for the given product
-        supplier_stats = {}
-        for stock in stock_data:
-            # If Firestore stock only has flat structure (name + qty)
-            if stock.get("name", "").lower() == product_name:
-                supplier = stock.get("supplierName", "Unknown")  # fallback if missing
-                if supplier not in supplier_stats:
-                    supplier_stats[supplier] = {"total_qty": 0, "prices": []}
-                supplier_stats[supplier]["total_qty"] += stock.get("qty", 0)
-                if stock.get("purchase_price"):
-                    supplier_stats[supplier]["prices"].append(stock["purchase_price"])
+        if source is not None:
+            supplier_stats = supplier_stats_from_store(product_name, *source)
+        else:
+            supplier_stats = supplier_stats_from_body(product_name, payload.stock.records())
 
         if not supplier_stats:
             return jsonify({"message": f"No supplier found for {product_name}"}), 200
@@ -61,7 +96,7 @@ def supply_check():
         # Rank suppliers by score (high qty, low avg price)
         results = []
         for supplier, stats in supplier_stats.items():
-            avg_price = statistics.mean(stats["prices"]) if stats["prices"] else 0
+            avg_price = stats["avg_price"]
             results.append({
                 "supplier": supplier,
                 "total_qty": stats["total_qty"],
@@ -74,11 +109,15 @@ def supply_check():
 
         # Generate Gemini insight
         prompt = f"Based on these suppliers for {product_name}: {results[:3]}, recommend the best one with reasoning. Keep it concise (1-2 sentences)."
-        try:
-            insight = generate_gemini_insight(prompt)
-        except Exception as e:
-            logging.error(f"Gemini API error: {e}")
-            insight = "Gemini is temporarily unavailable. Pure Mills is recommended based on quantity and price."
+        if not deadline.allows("llm"):
+            deadline.skip("llm")
+            insight = f"{results[0]['supplier']} is recommended based on quantity and price."
+        else:
+            try:
+                insight = generate_gemini_insight(prompt)
+            except Exception as e:
+                logging.error(f"Gemini API error: {e}")
+                insight = "Gemini is temporarily unavailable. Pure Mills is recommended based on quantity and price."
 
         # Generate readable text
         response_text = f"Supplier Information for {product_name}:\n"
@@ -88,17 +127,25 @@ def supply_check():
             response_text += f"  - {sup['supplier']}: {sup['total_qty']} units, Avg Price: ${sup['avg_price']}\n"
             response_text += f"- Insight: {insight}"
 
-        logging.info(f"Supply Checker response: {response_text}")
+        logging.info("supply check", extra={
+            "product_name": product_name,
+            "best_supplier": results[0]["supplier"],
+            "suppliers": len(results),
+            "response_chars": len(response_text),
+        })
         return jsonify({
             "readable_text": response_text,
             "query": query,
             "product_name": product_name,
             "best_supplier": results[0],
-            "all_suppliers": results
+            "all_suppliers": results,
+            "skipped_stages": deadline.skipped_stages()
         })
 
+    except (stream_ingest.PayloadTooLarge, stream_ingest.MalformedPayload) as e:
+        return stream_ingest.error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5002, debug=True)
+    app.run(host="127.0.0.1", port=services.port("supply_checker"), debug=True)
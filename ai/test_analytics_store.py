@@ -0,0 +1,66 @@
+"""Reconciliation of the analytics store with edited and deleted transactions. Run from ai/ with pytest."""
+import analytics_store
+import catalog_snapshot
+
+STOCK = [{"name": "Rice", "qty": 5}]
+
+
+def _tx(tid, created_at, product, qty, subtotal):
+    return {"tid": tid, "createdAt": created_at, "items": [{"product_name": product, "qty": qty, "subtotal": subtotal}]}
+
+
+def _store(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_snapshot, "SNAPSHOT_DIR", "")
+    return analytics_store.AnalyticsStore(str(tmp_path / "analytics.sqlite3"))
+
+
+def _sync(store, stock, transactions):
+    version = analytics_store.dataset_version(stock, transactions)
+    return version, store.sync("t", version, stock, transactions)
+
+
+def test_edited_transaction_replaces_its_rows(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    _sync(store, STOCK, [_tx("1", "2026-01-05T00:00:00Z", "Rice", 3, 6)])
+
+    version, added = _sync(store, STOCK, [_tx("1", "2026-01-05T00:00:00Z", "Rice", 30, 60)])
+
+    assert added == 1
+    assert store.synced_version("t") == version
+    assert store.monthly_sales("t", "rice") == [("2026-01", 30, 1)]
+
+
+def test_deleted_transaction_leaves_the_rollup(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    first = _tx("1", "2026-01-05T00:00:00Z", "Rice", 2, 4)
+    second = _tx("2", "2026-01-06T00:00:00Z", "Rice", 3, 6)
+    sugar = _tx("3", "2026-02-06T00:00:00Z", "Sugar", 1, 1)
+    _sync(store, STOCK, [first, second, sugar])
+
+    version, _ = _sync(store, STOCK, [first])
+
+    assert store.synced_version("t") == version
+    assert store.monthly_sales("t", "rice") == [("2026-01", 2, 1)]
+    assert store.monthly_sales("t", "sugar") == []
+
+
+def test_backdated_transaction_is_added(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    newest = _tx("2", "2026-01-06T00:00:00Z", "Rice", 3, 6)
+    _sync(store, STOCK, [newest])
+
+    version, added = _sync(store, STOCK, [_tx("1", "2025-12-01T00:00:00Z", "Rice", 1, 2), newest])
+
+    assert added == 1
+    assert store.synced_version("t") == version
+    assert store.monthly_sales("t", "rice") == [("2025-12", 1, 1), ("2026-01", 3, 1)]
+
+
+def test_version_changes_with_supplier_and_price():
+    transactions = [_tx("1", "2026-01-05T00:00:00Z", "Rice", 3, 6)]
+    stock = [{"name": "Rice", "qty": 5, "supplierName": "Acme", "purchase_price": 2}]
+    version = analytics_store.dataset_version(stock, transactions)
+
+    assert analytics_store.dataset_version([{**stock[0], "supplierName": "Beta"}], transactions) != version
+    assert analytics_store.dataset_version([{**stock[0], "purchase_price": 3}], transactions) != version
+    assert analytics_store.dataset_version(stock, [_tx("1", "2026-01-05T00:00:00Z", "Rice", 30, 6)]) != version
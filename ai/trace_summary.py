@@ -0,0 +1,132 @@
+"""
+Summarize traces recorded by tracing.py.
+
+Prints each trace as a span tree with durations and marks the critical
+path, the chain of spans that determined when the request finished. Run
+from ai/:
+
+    python trace_summary.py                      # the 10 slowest traces in traces.jsonl
+    python trace_summary.py --trace <trace_id>   # one trace
+    python trace_summary.py --route /ai --slowest 5 --file a.jsonl --file b.jsonl
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+
+def load_traces(paths):
+    """Spans grouped by trace id, from one or more JSONL files (e.g. one per host)."""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    span = json.loads(line)
+                    traces[span["trace_id"]].append(span)
+    return traces
+
+
+def _end(span):
+    return span["start"] + span["duration_ms"] / 1000
+
+
+def build_tree(spans):
+    """(roots, children by parent span_id), with children in start order."""
+    ids = {s["span_id"] for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in sorted(spans, key=lambda s: s["start"]):
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+    return roots, children
+
+
+def critical_path(root, children):
+    """
+    Span ids on the critical path: from the root, repeatedly follow the
+    child that finished last, since the parent could not finish before it.
+    """
+    path = [root["span_id"]]
+    node = root
+    while children.get(node["span_id"]):
+        node = max(children[node["span_id"]], key=_end)
+        path.append(node["span_id"])
+    return set(path)
+
+
+def self_time_ms(span, children):
+    """Duration not covered by any child (overlapping children counted once)."""
+    intervals = sorted((c["start"], _end(c)) for c in children.get(span["span_id"], []))
+    covered, cursor = 0.0, span["start"]
+    for start, end in intervals:
+        start, end = max(start, cursor), min(end, _end(span))
+        if end > start:
+            covered += end - start
+            cursor = end
+    return max(0.0, span["duration_ms"] - covered * 1000)
+
+
+def render_trace(spans):
+    roots, children = build_tree(spans)
+    root = max(roots, key=lambda s: s["duration_ms"])
+    on_path = critical_path(root, children)
+    t0 = min(s["start"] for s in spans)
+    lines = [f"trace {root['trace_id']}  {root['duration_ms']:.1f} ms  ({len(spans)} spans)"]
+
+    def walk(span, depth):
+        marker = "*" if span["span_id"] in on_path else " "
+        label = span["name"]
+        if span.get("service"):
+            label = f"{span['service']}: {label}"
+        extras = [f"{k}={v}" for k, v in (span.get("attrs") or {}).items() if k != "route"]
+        if span.get("error"):
+            extras.append(f"error={span['error']}")
+        lines.append(
+            f"{marker} {(span['start'] - t0) * 1000:>8.1f} {span['duration_ms']:>9.1f} "
+            f"{self_time_ms(span, children):>9.1f}  {'  ' * depth}{label}"
+            + (f"  [{', '.join(extras)}]" if extras else "")
+        )
+        for child in children.get(span["span_id"], []):
+            walk(child, depth + 1)
+
+    lines.append(f"  {'start ms':>8} {'total ms':>9} {'self ms':>9}  span  (* = critical path)")
+    for r in roots:
+        walk(r, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", action="append", help=f"trace file, repeatable (default {TRACE_FILE})")
+    parser.add_argument("--trace", help="show only this trace id")
+    parser.add_argument("--route", help="only traces whose root span is this route, e.g. /ai")
+    parser.add_argument("--slowest", type=int, default=10, help="number of traces to show")
+    args = parser.parse_args()
+
+    files = args.file or [TRACE_FILE]
+    traces = load_traces(files)
+    if args.trace:
+        selected = [traces.get(args.trace, [])]
+        if not selected[0]:
+            parser.exit(1, f"trace {args.trace} not found in {', '.join(files)}\n")
+    else:
+        def root_of(spans):
+            return max(build_tree(spans)[0], key=lambda s: s["duration_ms"])
+
+        candidates = [
+            spans for spans in traces.values()
+            if not args.route or (root_of(spans).get("attrs") or {}).get("route") == args.route
+        ]
+        selected = sorted(candidates, key=lambda spans: root_of(spans)["duration_ms"], reverse=True)[:args.slowest]
+
+    print("\n\n".join(render_trace(spans) for spans in selected) or "no traces")
+
+
+if __name__ == "__main__":
+    main()
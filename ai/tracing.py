@@ -0,0 +1,191 @@
+"""
+Request tracing across the agent chain.
+
+Every request handled by an agent becomes a server span. The trace context
+arrives in a W3C traceparent header and is passed on to downstream agents
+with outgoing_headers(). Stages inside a request open nested spans with
+span(name) (metrics.timed does this too). Finished spans are appended to
+TRACE_FILE as one JSON object per line and kept in a small in-memory
+buffer served at /traces/<trace_id>. Summarize them with trace_summary.py.
+
+Spans are only recorded inside a traced request; TRACE_SAMPLE_RATE picks
+the fraction of new traces that are recorded (the decision travels with
+the traceparent flags).
+"""
+import contextvars
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, jsonify, request
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")  # "" turns the file sink off
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", 2000))
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "sampled", "start", "attrs", "error")
+
+    def __init__(self, trace_id, parent_id, name, service, sampled, attrs):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.sampled = sampled
+        self.start = time.time()
+        self.attrs = attrs
+        self.error = None
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self, end):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": round(self.start, 6),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+# ----------------------
+# Sink
+# ----------------------
+_recent = deque(maxlen=TRACE_BUFFER)
+_sink_lock = threading.Lock()
+_sink = None
+_sink_pid = None
+
+
+def _write(record):
+    global _sink, _sink_pid
+    line = json.dumps(record, default=str) + "\n"
+    with _sink_lock:
+        _recent.append(record)
+        if not TRACE_FILE:
+            return
+        if _sink is None or _sink_pid != os.getpid():  # reopen after a fork
+            _sink = open(TRACE_FILE, "a", buffering=1, encoding="utf-8")
+            _sink_pid = os.getpid()
+        _sink.write(line)
+
+
+def recent_spans(trace_id):
+    with _sink_lock:
+        return [r for r in _recent if r["trace_id"] == trace_id]
+
+# ----------------------
+# Spans
+# ----------------------
+def parse_traceparent(value):
+    """(trace_id, parent span_id, sampled) from a traceparent header, or None if malformed."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+def start_span(name, service=None, traceparent=None, **attrs):
+    """
+    Start a span and make it current. With traceparent it continues that
+    trace; without one it is a child of the current span or, if there is
+    none, the root of a new trace. Returns (span, token) for end_span().
+    """
+    parent = _current.get()
+    context = parse_traceparent(traceparent) if traceparent else None
+    if context:
+        trace_id, parent_id, sampled = context
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        trace_id, parent_id, sampled = secrets.token_hex(16), None, random.random() < TRACE_SAMPLE_RATE
+    service = service or (parent.service if parent is not None else None)
+    span = Span(trace_id, parent_id, name, service, sampled, attrs)
+    return span, _current.set(span)
+
+
+def end_span(span, token, error=None):
+    try:
+        _current.reset(token)
+    except ValueError:  # ended from another context, e.g. after a streamed response
+        pass
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+    if span.sampled:
+        _write(span.to_dict(time.time()))
+
+
+@contextmanager
+def span(name, **attrs):
+    """Record a nested span around a block. Does nothing outside a traced request."""
+    if _current.get() is None:
+        yield None
+        return
+    current, token = start_span(name, **attrs)
+    try:
+        yield current
+    except Exception as e:
+        end_span(current, token, e)
+        raise
+    end_span(current, token)
+
+
+def current_span():
+    return _current.get()
+
+
+def outgoing_headers():
+    """traceparent for a call to another agent, so its spans join this trace."""
+    current = _current.get()
+    return {TRACEPARENT_HEADER: current.traceparent()} if current is not None else {}
+
+
+def init_app(app, service):
+    """Open a server span for every request and serve /traces/<trace_id>."""
+
+    @app.before_request
+    def _start_server_span():
+        _current.set(None)  # never parent a request on a span left over in this thread
+        route = request.url_rule.rule if request.url_rule else request.path
+        g.trace_span = start_span(
+            f"{request.method} {route}", service=service,
+            traceparent=request.headers.get(TRACEPARENT_HEADER), route=route,
+        )
+
+    @app.after_request
+    def _add_trace_header(response):
+        pending = g.get("trace_span")
+        if pending is not None:
+            pending[0].attrs["status"] = response.status_code
+            response.headers[TRACEPARENT_HEADER] = pending[0].traceparent()
+        return response
+
+    @app.teardown_request
+    def _end_server_span(exc):
+        pending = g.pop("trace_span", None)
+        if pending is not None:
+            end_span(*pending, error=exc)
+
+    @app.route("/traces/<trace_id>", methods=["GET"])
+    def trace_handler(trace_id):
+        """Spans of a recent trace recorded by this process."""
+        return jsonify(recent_spans(trace_id))
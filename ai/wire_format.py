@@ -0,0 +1,222 @@
+"""
+Columnar MessagePack bodies between the agents, chosen by content negotiation.
+
+JSON repeats every key for every stock row and transaction item, and
+encoding it costs the agents more CPU than their own logic on big
+tenants. With Content-Type: application/x-msgpack a body is MessagePack,
+and every long list of objects in it (stock_data, transaction_data) is
+sent as one columnar table: the key names once, then one array of values
+per key. Keys absent from a row stay absent. That halves the body, and
+the receiving agent reads it faster than JSON (benchmarks/bench_wire.py).
+
+    wire_format.init_app(app)   # accept msgpack bodies, answer msgpack when Accept asks for it
+    response = wire_format.post(url, payload, timeout=10, headers=...)
+    result = wire_format.decode_response(response)
+
+JSON stays the default everywhere. ai.py and precompute send msgpack to the
+agents only when WIRE_FORMAT=msgpack and the msgpack package is installed.
+request.get_json() returns the same rows for either format, and
+stream_ingest reads the tables row by row without expanding the whole body.
+"""
+import os
+
+from flask import has_request_context, request
+from flask import Request as FlaskRequest
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import msgpack
+except ImportError:  # optional: every service keeps speaking JSON without it
+    msgpack = None
+
+MSGPACK_MIMETYPE = "application/x-msgpack"
+JSON_MIMETYPE = "application/json"
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json")  # what ai.py and precompute send to the agents
+MIN_TABLE_ROWS = 16  # shorter lists of objects (the items of one transaction) stay msgpack maps
+
+_EXT_TABLE = 1
+_EXT_MISSING = 2
+
+
+class _Missing:
+    __slots__ = ()
+
+
+MISSING = _Missing()  # a key absent from one row of a table
+
+
+def available():
+    return msgpack is not None
+
+
+# ----------------------
+# Encoding
+# ----------------------
+def _columnar(value):
+    """value with every list of objects replaced by a table extension."""
+    kind = type(value)
+    if kind is dict:
+        return {k: _columnar(v) if type(v) in (dict, list) else v for k, v in value.items()}
+    if kind is not list:
+        return value
+    if len(value) >= MIN_TABLE_ROWS and all(type(row) is dict for row in value):
+        keys = list(dict.fromkeys(k for row in value for k in row))
+        columns = []
+        for key in keys:
+            column = [row.get(key, MISSING) for row in value]
+            if any(type(v) in (dict, list) for v in column):
+                column = [_columnar(v) if type(v) in (dict, list) else v for v in column]
+            columns.append(column)
+        return msgpack.ExtType(_EXT_TABLE, msgpack.packb([len(value), keys, columns], default=_default))
+    return [_columnar(v) if type(v) in (dict, list) else v for v in value]
+
+
+def _default(value):
+    if value is MISSING:
+        return msgpack.ExtType(_EXT_MISSING, b"")
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    raise TypeError(f"Cannot encode {type(value).__name__} as msgpack")
+
+
+def pack(value):
+    """MessagePack bytes for a JSON-like value, with lists of objects as columnar tables."""
+    return msgpack.packb(_columnar(value), default=_default)
+
+
+# ----------------------
+# Decoding
+# ----------------------
+class Table:
+    """A decoded columnar table; rows() yields one dict per row."""
+
+    __slots__ = ("keys", "columns", "length")
+
+    def __init__(self, keys, columns, length):
+        self.keys = keys
+        self.columns = columns
+        self.length = length  # rows without keys ({}) have no column to count
+
+    def __len__(self):
+        return self.length
+
+    def rows(self):
+        pairs = list(zip(self.keys, self.columns))
+        for i in range(len(self)):
+            row = {}
+            for key, column in pairs:
+                value = column[i]
+                if value is not MISSING:
+                    row[key] = expand(value) if type(value) in (Table, list, dict) else value
+            yield row
+
+
+def _ext_hook(code, data):
+    if code == _EXT_TABLE:
+        parts = msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+        if len(parts) == 2:  # tables packed before the row count was added
+            keys, columns = parts
+            return Table(keys, columns, len(columns[0]) if columns else 0)
+        length, keys, columns = parts
+        return Table(keys, columns, length)
+    if code == _EXT_MISSING:
+        return MISSING
+    return msgpack.ExtType(code, data)
+
+
+def expand(value):
+    """value with every Table turned back into a list of dicts."""
+    kind = type(value)
+    if kind is Table:
+        return list(value.rows())
+    if kind is dict:
+        return {k: expand(v) for k, v in value.items()}
+    if kind is list:
+        return [expand(v) for v in value]
+    return value
+
+
+def unpack(data, tables=False):
+    """Decode pack() output; tables=True leaves Table objects in place for row-by-row reading."""
+    value = msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+    return value if tables else expand(value)
+
+
+# ----------------------
+# HTTP
+# ----------------------
+def is_msgpack(message):
+    """True when a Flask request or requests response carries a msgpack body."""
+    content_type = message.headers.get("Content-Type", "")
+    return content_type.split(";")[0].strip() == MSGPACK_MIMETYPE
+
+
+class WireRequest(FlaskRequest):
+    """Flask request whose get_json() also decodes msgpack bodies."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if not is_msgpack(self) or msgpack is None:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return unpack(self.get_data(cache=cache))
+        except Exception:
+            if silent:
+                return None
+            raise
+
+
+def wants_msgpack(req):
+    accept = req.accept_mimetypes
+    return msgpack is not None and accept.quality(MSGPACK_MIMETYPE) > accept.quality(JSON_MIMETYPE)
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """
+    jsonify() and returned dicts become msgpack, packed straight from the
+    Python object, when the client prefers msgpack; JSON otherwise.
+    """
+
+    def response(self, *args, **kwargs):
+        if not has_request_context() or not wants_msgpack(request):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            data = pack(obj)
+        except TypeError:  # values only the JSON encoder knows (dates, decimals)
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data, mimetype=MSGPACK_MIMETYPE)
+
+
+def init_app(app):
+    """Accept msgpack request bodies and answer msgpack to clients that prefer it."""
+    app.request_class = WireRequest
+    app.json = WireJSONProvider(app)
+
+    @app.after_request
+    def _vary_on_accept(response):
+        response.vary.add("Accept")
+        return response
+
+
+def post(url, payload, accept_msgpack=True, **kwargs):
+    """
+    requests.post with payload in WIRE_FORMAT (JSON unless msgpack is
+    configured and installed). Decode the answer with decode_response().
+    """
+    import requests
+
+    if WIRE_FORMAT != "msgpack" or msgpack is None:
+        return requests.post(url, json=payload, **kwargs)
+    headers = {**(kwargs.pop("headers", None) or {}), "Content-Type": MSGPACK_MIMETYPE}
+    if accept_msgpack:
+        headers["Accept"] = f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.5"
+    return requests.post(url, data=pack(payload), headers=headers, **kwargs)
+
+
+def decode_response(response):
+    """Body of a requests response, from msgpack or JSON."""
+    if is_msgpack(response) and msgpack is not None:
+        return unpack(response.content)
+    return response.json()
@@ -45,14 +45,32 @@ app.post('/api/forecast', authenticate, [
   console.log('Received query:', query, 'User ID:', userId);
 
   try {
+    // Latest delivery per product from the stock-in records: who supplied it and at what unit cost
+    const addstockSnap = await db.collection('users').doc(userId).collection('addstock').get();
+    const latestSupply = {};
+    addstockSnap.docs.forEach(doc => {
+      const data = doc.data();
+      const at = data.createdAt?.toMillis() || 0;
+      if (!data.supplierName) return;
+      (data.items || []).forEach(item => {
+        const key = (item.product_name || '').trim().toLowerCase();
+        if (key && (!latestSupply[key] || latestSupply[key].at <= at)) {
+          latestSupply[key] = { supplierName: data.supplierName, purchase_price: Number(item.base_cost_usd || 0), at };
+        }
+      });
+    });
+
     const productsSnap = await db.collection('users').doc(userId).collection('products').get();
     const stock_data = productsSnap.docs.map(doc => {
       const data = doc.data();
+      const supply = latestSupply[(data.product_name || '').trim().toLowerCase()] || {};
       return {
         product_name: data.product_name || 'Unknown',
         qty: Number(data.stock_amount || 0),
         base_cost_usd: Number(data.base_cost_usd || 0),
         suggested_price_usd: Number(data.suggested_price_usd || 0),
+        supplierName: data.supplierName || supply.supplierName || '',
+        purchase_price: Number(data.purchase_price || supply.purchase_price || 0),
         createdAt: data.createdAt?.toDate().toISOString() || new Date().toISOString()
       };
     });
@@ -74,14 +92,35 @@ app.post('/api/forecast', authenticate, [
       };
     });
 
+    // Streamed mode: relay the agent's Server-Sent Events as they arrive
+    if (req.body.stream) {
+      const agentStream = await axios.post('http://127.0.0.1:5001/ai', {
+        query,
+        stock_data,
+        transaction_data,
+        stream: true
+      }, { responseType: 'stream', headers: { 'X-Tenant-Id': userId } });
+
+      res.setHeader('Content-Type', 'text/event-stream');
+      res.setHeader('Cache-Control', 'no-cache');
+      agentStream.data.pipe(res);
+      return;
+    }
+
     const agentResponse = await axios.post('http://127.0.0.1:5001/ai', {
       query,
       stock_data,
       transaction_data
-    });
+    }, { headers: { 'X-Tenant-Id': userId } });
 
     res.json(agentResponse.data);
   } catch (error) {
+    // The agent sheds load with 429 + Retry-After; pass that on instead of a 500
+    if (error.response && error.response.status === 429) {
+      const retryAfter = error.response.headers['retry-after'];
+      if (retryAfter) res.setHeader('Retry-After', retryAfter);
+      return res.status(429).json({ error: 'The assistant is busy right now, please retry shortly.' });
+    }
     console.error('❌ AI agent error:', error.message);
     res.status(500).json({ error: error.message });
   }
@@ -178,14 +217,15 @@ app.post('/api/ai-reply', authenticate, async (req, res) => {
     const transaction_data = transactionsSnap.docs.map(doc => doc.data());
 
     // --- Call AI to detect order or reply ---
+    // email.id (the Gmail message id) lets the agent recognise a redelivered message
     const aiResponse = await axios.post('http://127.0.0.1:5005/auto_reply', {
       email,
       stock_data,
       transaction_data
-    });
+    }, { headers: { 'X-Tenant-Id': userId } });
 
-    // --- If AI detected order, process it ---
-    if (aiResponse.data.orderDetected) {
+    // --- If AI detected order, process it (a redelivered email was already processed) ---
+    if (aiResponse.data.orderDetected && !aiResponse.data.duplicate) {
       const orderResponse = await axios.post(`${req.protocol}://${req.get('host')}/api/processOrder`, {
         customer_name: aiResponse.data.customer_name,
         items: aiResponse.data.items
@@ -200,8 +240,9 @@ app.post('/api/ai-reply', authenticate, async (req, res) => {
         },
         stock_data,
         transaction_data,
-        processedOrder: orderResponse.data
-      });
+        processedOrder: orderResponse.data,
+        fingerprint: aiResponse.data.fingerprint // a redelivery of the original email gets this confirmation
+      }, { headers: { 'X-Tenant-Id': userId } });
 
       return res.json({ reply: confirmationResponse.data.reply });
     }
@@ -284,6 +325,19 @@ app.post('/api/processOrder', authenticate, async (req, res) => {
       }
     });
 
+    // Let the stock monitor update coverage now instead of waiting for the next chat query
+    if (transactionItems.length > 0) {
+      const events = transactionItems.map(i => ({
+        type: 'sale',
+        product_name: i.product_name,
+        qty: i.qty,
+        stock: productsMap.get(i.product_name).stock - i.qty,
+        at: createdAt || new Date().toISOString()
+      }));
+      axios.post('http://127.0.0.1:5001/monitor/events', { events }, { headers: { 'X-Tenant-Id': userId }, timeout: 2000 })
+        .catch(err => console.error('Stock monitor update failed:', err.message));
+    }
+
     res.json({ tid, customer_name, transactionItems, outOfStock });
   } catch (err) {
     console.error("Order processing error:", err.message);
@@ -291,6 +345,28 @@ app.post('/api/processOrder', authenticate, async (req, res) => {
   }
 });
 
+// -------------------- STOCK ALERTS --------------------
+// Long poll: answers as soon as the monitor raises an alert after ?after=<seq>, or after ?wait= seconds
+app.get('/api/stock-alerts', authenticate, async (req, res) => {
+  const wait = Math.min(Number(req.query.wait || 20), 25);
+  try {
+    const monitorResponse = await axios.get('http://127.0.0.1:5001/monitor/alerts', {
+      params: { after: Number(req.query.after || 0), wait },
+      headers: { 'X-Tenant-Id': req.user.uid },
+      timeout: (wait + 5) * 1000
+    });
+    res.json(monitorResponse.data);
+  } catch (err) {
+    if (err.response && err.response.status === 429) {
+      // the router caps open long polls; the dashboard retries after the delay
+      res.set('Retry-After', err.response.headers['retry-after'] || '5');
+      return res.status(429).json(err.response.data);
+    }
+    console.error('Stock alerts error:', err.message);
+    res.status(502).json({ error: err.message });
+  }
+});
+
 // -------------------- GMAIL SEND --------------------
 app.post("/api/gmail/send", async (req, res) => {
   try {